@@ -0,0 +1,54 @@
+# Precomputed PicoBlaze ALU, built once at import so every instruction is a single lookup.
+#
+# Entries are shared (result, carry, zero) tuples. Arithmetic tables are indexed by
+# a << 9 | b << 1 | carry_in, shift and rotate tables by value << 1 | carry_in.
+
+RESULTS = [(value, carry, 0 if value else 1) for carry in (0, 1) for value in range(256)]
+
+
+def _result(value, carry):
+    return RESULTS[carry << 8 | value]
+
+
+def _shift_table(function):
+    return [_result(*function(value, carry)) for value in range(256) for carry in (0, 1)]
+
+
+# a 9 bit two's complement result already is the carry << 8 | value index into RESULTS
+ADD = [RESULTS[(a + b + carry) & 0x1FF] for a in range(256) for b in range(256) for carry in (0, 1)]
+SUB = [RESULTS[(a - b - carry) & 0x1FF] for a in range(256) for b in range(256) for carry in (0, 1)]
+
+ZERO = [0 if value else 1 for value in range(256)]
+PARITY = [bin(value).count('1') & 1 for value in range(256)]
+
+# (carry, zero) of TEST, indexed by the AND of both operands
+TEST = [(PARITY[value], ZERO[value]) for value in range(256)]
+
+SL0 = _shift_table(lambda value, carry: (value << 1 & 0xFF, value >> 7))
+SL1 = _shift_table(lambda value, carry: ((value << 1 | 1) & 0xFF, value >> 7))
+SLX = _shift_table(lambda value, carry: ((value << 1 | value & 1) & 0xFF, value >> 7))
+SLA = _shift_table(lambda value, carry: ((value << 1 | carry) & 0xFF, value >> 7))
+RL = _shift_table(lambda value, carry: ((value << 1 | value >> 7) & 0xFF, value >> 7))
+SR0 = _shift_table(lambda value, carry: (value >> 1, value & 1))
+SR1 = _shift_table(lambda value, carry: (value >> 1 | 0x80, value & 1))
+SRX = _shift_table(lambda value, carry: (value >> 1 | value & 0x80, value & 1))
+SRA = _shift_table(lambda value, carry: (value >> 1 | carry << 7, value & 1))
+RR = _shift_table(lambda value, carry: (value >> 1 | (value & 1) << 7, value & 1))
+
+TABLES = {
+    'ADD': ADD,
+    'SUB': SUB,
+    'ZERO': ZERO,
+    'PARITY': PARITY,
+    'TEST': TEST,
+    'SL0': SL0,
+    'SL1': SL1,
+    'SLX': SLX,
+    'SLA': SLA,
+    'RL': RL,
+    'SR0': SR0,
+    'SR1': SR1,
+    'SRX': SRX,
+    'SRA': SRA,
+    'RR': RR,
+}
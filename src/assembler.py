@@ -0,0 +1,184 @@
+from src.fast_tokenizer import FastLexer
+from src.parser_rules import Parser, ParserState
+from src.program import link
+from ply import lex, yacc
+import src.tokenizer_rules as tokenizer_rules
+import hashlib
+import importlib.util
+import os
+import ply
+import shutil
+import tempfile
+
+# The lexer and the LALR tables are built on the first assembled program and shared by the
+# whole process. Tables are cached in CACHE_DIR (overridable with PICOBLAZE_CACHE_DIR) under
+# a key derived from the grammar, so the source tree is never written to.
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'picoblaze-simulator')
+
+# Bump it whenever a change outside the grammar alters the assembled Program (e.g. decode or link)
+ASSEMBLER_VERSION = '2'
+
+LEXTAB = 'picoblaze_lextab'
+PARSETAB = 'parsetab.pickle'
+
+# 'ply' is the lexer built from tokenizer_rules, 'fast' the hand written src.fast_tokenizer.
+# Both produce the same tokens, opt in to 'fast' with use_tokenizer() or PICOBLAZE_TOKENIZER.
+TOKENIZERS = ('ply', 'fast')
+
+_tokenizer = os.environ.get('PICOBLAZE_TOKENIZER') or 'ply'
+_lexers = {}
+_frontend = None
+_version = None
+
+
+def _grammar_key():
+    rules = [(name, getattr(tokenizer_rules, name)) for name in dir(tokenizer_rules) if name.startswith('t_')]
+    parts = [ply.__version__, tokenizer_rules.tokens,
+             [(name, rule if type(rule) is str else rule.__doc__) for name, rule in rules],
+             [(name, getattr(Parser, name).__doc__) for name in dir(Parser) if name.startswith('p_')]]
+    return hashlib.md5(repr(parts).encode()).hexdigest()[:16]
+
+
+# Identifies everything that produces a Program from source, for caches of assembled programs
+def version():
+    global _version
+    if _version is None:
+        _version = '{0}-{1}'.format(ASSEMBLER_VERSION, _grammar_key())
+    return _version
+
+
+def cache_root():
+    return os.environ.get('PICOBLAZE_CACHE_DIR') or CACHE_DIR
+
+
+def writable_dir(directory):
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return None
+    return directory if os.access(directory, os.W_OK) else None
+
+
+def _lextab(directory):
+    path = os.path.join(directory, LEXTAB + '.py')
+    if not os.path.exists(path):
+        # ply writes the table under this name once the lexer is built
+        return LEXTAB
+
+    spec = importlib.util.spec_from_file_location(LEXTAB, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _tables_dir():
+    return writable_dir(os.path.join(cache_root(), _grammar_key()))
+
+
+# Calls build(directory, write) with the cache directory holding the table `name`. A missing (or broken)
+# table is built in a private directory and renamed into place, so other processes building the
+# same table at once never read a partly written file. Only `write` allows ply to write the
+# table (a lexer never overwrites a lextab it read). Returns None when nothing can be written.
+def _cached(directory, name, build):
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        try:
+            return build(directory, False)
+        except Exception:
+            # ply only handles missing or outdated tables, not truncated or corrupted ones
+            pass
+
+    try:
+        temporary = tempfile.mkdtemp(dir=directory, suffix='.tmp')
+        try:
+            result = build(temporary, True)
+            os.replace(os.path.join(temporary, name), path)
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+    except OSError:
+        return None
+    return result
+
+
+def _build():
+    directory = _tables_dir()
+    parser = Parser()
+    parser.tokens = tokenizer_rules.tokens
+
+    lalr = None
+    if directory is not None:
+        lalr = _cached(directory, PARSETAB, lambda tables, write: yacc.yacc(
+            module=parser, debug=False, optimize=True, picklefile=os.path.join(tables, PARSETAB),
+            write_tables=write, errorlog=yacc.NullLogger()))
+    if lalr is None:
+        # nowhere to cache, build the tables in memory
+        lalr = yacc.yacc(module=parser, debug=False, write_tables=False, errorlog=yacc.NullLogger())
+
+    return parser, lalr
+
+
+def _ply_lexer():
+    directory = _tables_dir()
+
+    lexer = None
+    if directory is not None:
+        lexer = _cached(directory, LEXTAB + '.py', lambda tables, write: lex.lex(
+            module=tokenizer_rules, optimize=True, lextab=_lextab(tables), outputdir=tables,
+            errorlog=yacc.NullLogger()))
+    if lexer is None:
+        lexer = lex.lex(module=tokenizer_rules, optimize=True, lextab='', errorlog=yacc.NullLogger())
+    return lexer
+
+
+def use_tokenizer(name):
+    global _tokenizer
+    if name not in TOKENIZERS:
+        raise ValueError('Unknown tokenizer "{0}", expected one of: {1}'.format(name, ', '.join(TOKENIZERS)))
+    _tokenizer = name
+
+
+def lexer():
+    if _tokenizer not in _lexers:
+        _lexers[_tokenizer] = FastLexer() if _tokenizer == 'fast' else _ply_lexer()
+    return _lexers[_tokenizer]
+
+
+def frontend():
+    global _frontend
+    if _frontend is None:
+        _frontend = _build()
+
+    parser, lalr = _frontend
+    return parser, lexer(), lalr
+
+
+# Yields (line, instruction) pairs, including ORG and LABEL, from any iterable of source lines
+# (e.g. an open file) as they are parsed. Parsed instructions are handed out line by line, only
+# the aliases and directives are kept in `state`, so memory does not grow with the source.
+# The front end is shared, so only one stream can be consumed at a time.
+def stream(lines, state=None, first_line=1):
+    parser, lexer, lalr = frontend()
+    instructions = parser.set_state(state or ParserState()).instructions
+
+    # the grammar describes a single line, so every line is a separate parse
+    # sharing the lexer, which keeps counting lines from where the last one ended
+    for line_no, line in enumerate(lines, first_line):
+        lexer.lineno = line_no
+        lalr.parse(line, lexer=lexer)
+
+        if instructions:
+            for instruction in instructions:
+                yield line_no, instruction
+            del instructions[:]
+
+
+def assemble(lines):
+    state = ParserState()
+    instructions = stream(lines, state)
+    return link(instructions, state.aliases, state.directives, numbered=True)
+
+
+def assemble_file(filename):
+    with open(filename) as file:
+        return assemble(file)
@@ -0,0 +1,75 @@
+# Runs machines as asyncio tasks: a quantum of instructions at a time, then back to the event loop.
+# Input devices raise WouldBlock instead of waiting, the IN instruction is then retried once the
+# data arrived, so one event loop can host many machines without a thread for each.
+from collections import deque
+import asyncio
+
+QUANTUM = 1000
+
+
+# Raised by a port device having no data yet, `ready` is an asyncio.Event set once it has
+class WouldBlock(Exception):
+    def __init__(self, ready):
+        super(WouldBlock, self).__init__('Port device has no data')
+        self.ready = ready
+
+
+# Input port device, values pushed by the host or read from an asyncio stream
+class AsyncInput(object):
+    def __init__(self, data=()):
+        self._data = deque(data)
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._data)
+
+    def push(self, data):
+        self._data.extend(data)
+        self._ready.set()
+
+    def read(self):
+        if not self._data:
+            self._ready.clear()
+            raise WouldBlock(self._ready)
+        return self._data.popleft() & 0xFF
+
+    # Pushes everything read from the asyncio.StreamReader until its end
+    async def pump(self, reader, chunk=4096):
+        while True:
+            data = await reader.read(chunk)
+            if not data:
+                return
+            self.push(data)
+
+
+# Output port device, the written values are taken with `await get()`
+class AsyncOutput(object):
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    def write(self, value):
+        self._queue.put_nowait(value)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def get_nowait(self):
+        return self._queue.get_nowait()
+
+    def empty(self):
+        return self._queue.empty()
+
+
+# Runs the machine for `max_cycles` (forever by default) and returns the executed cycles.
+# The IN of a blocking device is not executed until it has data, so no cycles pass meanwhile.
+async def run_async(vm, quantum=QUANTUM, max_cycles=None):
+    start = vm.cycles
+    while max_cycles is None or vm.cycles - start < max_cycles:
+        amount = quantum if max_cycles is None else min(quantum, max_cycles - (vm.cycles - start))
+        try:
+            vm.run(amount)
+        except WouldBlock as e:
+            await e.ready.wait()
+            continue
+        await asyncio.sleep(0)
+    return vm.cycles - start
@@ -0,0 +1,389 @@
+from src import alu
+from src.program import INSTRUCTIONS_CNT, PORTS_CNT, RAM_SIZE, REGISTER_NAMES
+import numpy as np
+
+# depth of the hardware call stack, deeper calls wrap around like in the KCPSM3
+STACK_DEPTH = 31
+
+
+def _table(table):
+    return np.array(table, dtype=np.uint8)
+
+
+ADD = _table(alu.ADD)
+SUB = _table(alu.SUB)
+ZERO = _table(alu.ZERO)
+TEST = _table(alu.TEST)
+SHIFTS = {name: _table(alu.TABLES[name]) for name in ('SL0', 'SL1', 'SLX', 'SLA', 'RL',
+                                                      'SR0', 'SR1', 'SRX', 'SRA', 'RR')}
+
+
+# Runs one program for many input vectors at once. Every lane has its own registers, flags,
+# program counter, stack, RAM and ports; each step executes one instruction for all lanes
+# that are at the same address, the diverged lanes are masked.
+class BatchVirtualMachine(object):
+    def __init__(self, program, lanes):
+        self._program = program
+        self._lanes = lanes
+
+        self._registers = np.zeros((lanes, len(REGISTER_NAMES)), dtype=np.uint8)
+        self._ram = np.zeros((lanes, RAM_SIZE), dtype=np.uint8)
+        self._carry = np.zeros(lanes, dtype=np.uint8)
+        self._zero = np.zeros(lanes, dtype=np.uint8)
+        self._stack = np.zeros((lanes, STACK_DEPTH), dtype=np.int16)
+        self._stack_ptr = np.zeros(lanes, dtype=np.int16)
+
+        self._interrupt_enabled = np.zeros(lanes, dtype=bool)
+        self._pre_zero = np.zeros(lanes, dtype=np.uint8)
+        self._pre_carry = np.zeros(lanes, dtype=np.uint8)
+        self._interrupt_caused = np.zeros(lanes, dtype=bool)
+
+        self._program_cnt = np.zeros(lanes, dtype=np.int16)
+        self._cycles = np.zeros(lanes, dtype=np.int64)
+
+        self._input_ports = np.zeros((lanes, PORTS_CNT), dtype=np.uint8)
+        self._output_ports = np.zeros((lanes, PORTS_CNT), dtype=np.uint8)
+
+        self._code = [(self._handle_NOP, None, None) if op is None else
+                      (getattr(self, '_handle_' + op.handler), op.x, op.y) for op in program.image]
+
+    @property
+    def lanes(self):
+        return self._lanes
+
+    @property
+    def registers(self):
+        return self._registers
+
+    @property
+    def ram(self):
+        return self._ram
+
+    @property
+    def carry(self):
+        return self._carry
+
+    @property
+    def zero(self):
+        return self._zero
+
+    @property
+    def program_cnt(self):
+        return self._program_cnt
+
+    @property
+    def stack_ptr(self):
+        return self._stack_ptr
+
+    @property
+    def cycles(self):
+        return self._cycles
+
+    @property
+    def input_ports(self):
+        return self._input_ports
+
+    @property
+    def output_ports(self):
+        return self._output_ports
+
+    def toggle_interrupt(self, state, lanes=slice(None)):
+        self._interrupt_caused[lanes] = state
+
+    def step_over(self):
+        self._step(np.arange(self._lanes))
+
+    # Every lane executes `amount` cycles, however far the lanes diverge
+    def step_many(self, amount):
+        end = self._cycles + amount
+        while True:
+            lanes = np.flatnonzero(self._cycles < end)
+            if not len(lanes):
+                return
+            self._step(lanes)
+
+    # Steps the lanes (of `lanes`) at the address of the lane that is furthest behind, so a lane
+    # looping at a low address does not hold back the others. Ties go to the lowest address,
+    # which lets the lanes of a diverged branch catch up with each other.
+    def _step(self, lanes):
+        pcs, cycles = self._program_cnt[lanes], self._cycles[lanes]
+        behind = cycles == cycles.min()
+        pc = int(pcs[behind].min())
+        if pc > INSTRUCTIONS_CNT - 1:
+            raise RuntimeError("Out of memory range")
+
+        lanes = lanes[pcs == pc]
+        interrupted = self._interrupt_caused[lanes] & self._interrupt_enabled[lanes]
+        if interrupted.any():
+            self._handle_interrupt(lanes[interrupted])
+            lanes = lanes[~interrupted]
+
+        if len(lanes):
+            handler, x, y = self._code[pc]
+            handler(lanes, x, y)
+
+    def _advance(self, lanes):
+        self._program_cnt[lanes] += 1
+        self._cycles[lanes] += 1
+
+    def _alu(self, lanes, x, table, index):
+        result = table[index]
+        self._registers[lanes, x] = result[:, 0]
+        self._carry[lanes] = result[:, 1]
+        self._zero[lanes] = result[:, 2]
+        self._advance(lanes)
+
+    def _operand(self, lanes, y):
+        return self._registers[lanes, y].astype(np.intp)
+
+    def _handle_NOP(self, lanes, x, y):
+        self._advance(lanes)
+
+    def _handle_LOAD_val(self, lanes, x, y):
+        self._registers[lanes, x] = y
+        self._advance(lanes)
+
+    def _handle_LOAD_reg(self, lanes, x, y):
+        self._registers[lanes, x] = self._registers[lanes, y]
+        self._advance(lanes)
+
+    def _handle_FETCH_val(self, lanes, x, y):
+        self._registers[lanes, x] = self._ram[lanes, y]
+        self._advance(lanes)
+
+    def _handle_FETCH_reg(self, lanes, x, y):
+        self._registers[lanes, x] = self._ram[lanes, self._ram_addr(lanes, y)]
+        self._advance(lanes)
+
+    def _handle_STORE_val(self, lanes, x, y):
+        self._ram[lanes, y] = self._registers[lanes, x]
+        self._advance(lanes)
+
+    def _handle_STORE_reg(self, lanes, x, y):
+        self._ram[lanes, self._ram_addr(lanes, y)] = self._registers[lanes, x]
+        self._advance(lanes)
+
+    def _ram_addr(self, lanes, y):
+        addr = self._operand(lanes, y)
+        if (addr > RAM_SIZE - 1).any():
+            raise ValueError('Error in address {0}: ram addres "{1}" outside memory'.format(
+                str(self._program_cnt[lanes[0]]), addr.max()))
+        return addr
+
+    def _handle_IN_val(self, lanes, x, y):
+        self._registers[lanes, x] = self._input_ports[lanes, y]
+        self._advance(lanes)
+
+    def _handle_IN_reg(self, lanes, x, y):
+        self._registers[lanes, x] = self._input_ports[lanes, self._operand(lanes, y)]
+        self._advance(lanes)
+
+    def _handle_OUT_val(self, lanes, x, y):
+        self._output_ports[lanes, y] = self._registers[lanes, x]
+        self._advance(lanes)
+
+    def _handle_OUT_reg(self, lanes, x, y):
+        self._output_ports[lanes, self._operand(lanes, y)] = self._registers[lanes, x]
+        self._advance(lanes)
+
+    def _handle_ADD_val(self, lanes, x, y):
+        self._alu(lanes, x, ADD, self._operand(lanes, x) << 9 | y << 1)
+
+    def _handle_ADD_reg(self, lanes, x, y):
+        self._alu(lanes, x, ADD, self._operand(lanes, x) << 9 | self._operand(lanes, y) << 1)
+
+    def _handle_ADDC_val(self, lanes, x, y):
+        self._alu(lanes, x, ADD, self._operand(lanes, x) << 9 | y << 1 | self._carry[lanes])
+
+    def _handle_ADDC_reg(self, lanes, x, y):
+        self._alu(lanes, x, ADD, self._operand(lanes, x) << 9 | self._operand(lanes, y) << 1 | self._carry[lanes])
+
+    def _handle_SUB_val(self, lanes, x, y):
+        self._alu(lanes, x, SUB, self._operand(lanes, x) << 9 | y << 1)
+
+    def _handle_SUB_reg(self, lanes, x, y):
+        self._alu(lanes, x, SUB, self._operand(lanes, x) << 9 | self._operand(lanes, y) << 1)
+
+    def _handle_SUBC_val(self, lanes, x, y):
+        self._alu(lanes, x, SUB, self._operand(lanes, x) << 9 | y << 1 | self._carry[lanes])
+
+    def _handle_SUBC_reg(self, lanes, x, y):
+        self._alu(lanes, x, SUB, self._operand(lanes, x) << 9 | self._operand(lanes, y) << 1 | self._carry[lanes])
+
+    def _compare(self, lanes, index):
+        result = SUB[index]
+        self._carry[lanes] = result[:, 1]
+        self._zero[lanes] = result[:, 2]
+        self._advance(lanes)
+
+    def _handle_COMP_val(self, lanes, x, y):
+        self._compare(lanes, self._operand(lanes, x) << 9 | y << 1)
+
+    def _handle_COMP_reg(self, lanes, x, y):
+        self._compare(lanes, self._operand(lanes, x) << 9 | self._operand(lanes, y) << 1)
+
+    def _logical(self, lanes, x, result):
+        self._registers[lanes, x] = result
+        self._zero[lanes] = ZERO[result]
+        self._advance(lanes)
+
+    def _handle_AND_val(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] & y)
+
+    def _handle_AND_reg(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] & self._registers[lanes, y])
+
+    def _handle_OR_val(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] | y)
+
+    def _handle_OR_reg(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] | self._registers[lanes, y])
+
+    def _handle_XOR_val(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] ^ y)
+
+    def _handle_XOR_reg(self, lanes, x, y):
+        self._logical(lanes, x, self._registers[lanes, x] ^ self._registers[lanes, y])
+
+    def _test(self, lanes, result):
+        flags = TEST[result]
+        self._carry[lanes] = flags[:, 0]
+        self._zero[lanes] = flags[:, 1]
+        self._advance(lanes)
+
+    def _handle_TEST_val(self, lanes, x, y):
+        self._test(lanes, self._registers[lanes, x] & y)
+
+    def _handle_TEST_reg(self, lanes, x, y):
+        self._test(lanes, self._registers[lanes, x] & self._registers[lanes, y])
+
+    def _shift(self, lanes, x, name):
+        self._alu(lanes, x, SHIFTS[name], self._operand(lanes, x) << 1 | self._carry[lanes])
+
+    def _handle_SL0(self, lanes, x, y):
+        self._shift(lanes, x, 'SL0')
+
+    def _handle_SL1(self, lanes, x, y):
+        self._shift(lanes, x, 'SL1')
+
+    def _handle_SLX(self, lanes, x, y):
+        self._shift(lanes, x, 'SLX')
+
+    def _handle_SLA(self, lanes, x, y):
+        self._shift(lanes, x, 'SLA')
+
+    def _handle_RL(self, lanes, x, y):
+        self._shift(lanes, x, 'RL')
+
+    def _handle_SR0(self, lanes, x, y):
+        self._shift(lanes, x, 'SR0')
+
+    def _handle_SR1(self, lanes, x, y):
+        self._shift(lanes, x, 'SR1')
+
+    def _handle_SRX(self, lanes, x, y):
+        self._shift(lanes, x, 'SRX')
+
+    def _handle_SRA(self, lanes, x, y):
+        self._shift(lanes, x, 'SRA')
+
+    def _handle_RR(self, lanes, x, y):
+        self._shift(lanes, x, 'RR')
+
+    def _push(self, lanes):
+        ptr = self._stack_ptr[lanes]
+        self._stack[lanes, ptr] = self._program_cnt[lanes]
+        self._stack_ptr[lanes] = (ptr + 1) % STACK_DEPTH
+
+    def _pop(self, lanes):
+        ptr = (self._stack_ptr[lanes] - 1) % STACK_DEPTH
+        self._stack_ptr[lanes] = ptr
+        return self._stack[lanes, ptr]
+
+    def _jump(self, lanes, taken, x):
+        self._program_cnt[lanes] = np.where(taken, x, self._program_cnt[lanes] + 1)
+        self._cycles[lanes] += 1
+
+    def _call(self, lanes, taken, x):
+        self._push(lanes[taken])
+        self._jump(lanes, taken, x)
+
+    def _ret(self, lanes, taken):
+        self._program_cnt[lanes[taken]] = self._pop(lanes[taken])
+        self._program_cnt[lanes] += 1
+        self._cycles[lanes] += 1
+
+    def _handle_JUMP(self, lanes, x, y):
+        self._program_cnt[lanes] = x
+        self._cycles[lanes] += 1
+
+    def _handle_JUMP_Z(self, lanes, x, y):
+        self._jump(lanes, self._zero[lanes] == 1, x)
+
+    def _handle_JUMP_NZ(self, lanes, x, y):
+        self._jump(lanes, self._zero[lanes] == 0, x)
+
+    def _handle_JUMP_C(self, lanes, x, y):
+        self._jump(lanes, self._carry[lanes] == 1, x)
+
+    def _handle_JUMP_NC(self, lanes, x, y):
+        self._jump(lanes, self._carry[lanes] == 0, x)
+
+    def _handle_CALL(self, lanes, x, y):
+        self._call(lanes, np.ones(len(lanes), dtype=bool), x)
+
+    def _handle_CALL_Z(self, lanes, x, y):
+        self._call(lanes, self._zero[lanes] == 1, x)
+
+    def _handle_CALL_NZ(self, lanes, x, y):
+        self._call(lanes, self._zero[lanes] == 0, x)
+
+    def _handle_CALL_C(self, lanes, x, y):
+        self._call(lanes, self._carry[lanes] == 1, x)
+
+    def _handle_CALL_NC(self, lanes, x, y):
+        self._call(lanes, self._carry[lanes] == 0, x)
+
+    def _handle_RET(self, lanes, x, y):
+        self._ret(lanes, np.ones(len(lanes), dtype=bool))
+
+    def _handle_RET_Z(self, lanes, x, y):
+        self._ret(lanes, self._zero[lanes] == 1)
+
+    def _handle_RET_NZ(self, lanes, x, y):
+        self._ret(lanes, self._zero[lanes] == 0)
+
+    def _handle_RET_C(self, lanes, x, y):
+        self._ret(lanes, self._carry[lanes] == 1)
+
+    def _handle_RET_NC(self, lanes, x, y):
+        self._ret(lanes, self._carry[lanes] == 0)
+
+    def _handle_DINT(self, lanes, x, y):
+        self._interrupt_enabled[lanes] = False
+        self._advance(lanes)
+
+    def _handle_EINT(self, lanes, x, y):
+        self._interrupt_enabled[lanes] = True
+        self._advance(lanes)
+
+    def _reti(self, lanes, enable):
+        self._interrupt_enabled[lanes] = enable
+        self._carry[lanes] = self._pre_carry[lanes]
+        self._zero[lanes] = self._pre_zero[lanes]
+        self._program_cnt[lanes] = self._pop(lanes)
+        self._cycles[lanes] += 1
+
+    def _handle_RETI_ENABLE(self, lanes, x, y):
+        self._reti(lanes, True)
+
+    def _handle_RETI_DISABLE(self, lanes, x, y):
+        self._reti(lanes, False)
+
+    def _handle_interrupt(self, lanes):
+        self._pre_carry[lanes] = self._carry[lanes]
+        self._pre_zero[lanes] = self._zero[lanes]
+        self._interrupt_enabled[lanes] = False
+        self._push(lanes)
+        self._program_cnt[lanes] = INSTRUCTIONS_CNT - 1
+        self._cycles[lanes] += 1
@@ -0,0 +1,55 @@
+# Compares the ply lexer with the hand written tokenizer on a large generated source:
+#   python -m src.bench_tokenizer [lines]
+from ply import lex
+from src.fast_tokenizer import FastLexer
+import src.tokenizer_rules as tokenizer_rules
+import random
+import sys
+import time
+
+LINES = (
+    'LOAD s{0}, ${1:02X}',
+    'ADD s{0}, s{2}',
+    'ADDC s{0}, {1}',
+    'COMP s{0}, {1} ; compare',
+    'JUMP NZ, label_{3}',
+    'label_{3}: STORE s{0}, {4}',
+    'table_{3} EQU ${1:02x}',
+    'RETI enable',
+    '; generated lookup table entry {3}',
+)
+
+
+def generate(lines):
+    random.seed(lines)
+    return ''.join(random.choice(LINES).format(random.randint(0, 15), random.randint(0, 255),
+                                               random.randint(0, 15), i, random.randint(0, 63)) + '\n'
+                   for i in range(lines))
+
+
+def measure(lexer, source, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lexer.input(source)
+        count = sum(1 for _ in lexer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    lines = int(argv[0]) if argv else 100000
+    source = generate(lines)
+
+    results = []
+    for name, lexer in (('ply', lex.lex(module=tokenizer_rules)), ('fast', FastLexer())):
+        count, elapsed = measure(lexer, source)
+        results.append(elapsed)
+        print('{0:>5}: {1} tokens in {2:.3f}s ({3:.0f} tokens/s)'.format(name, count, elapsed, count / elapsed))
+    print('speedup: {0:.2f}x'.format(results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
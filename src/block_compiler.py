@@ -0,0 +1,243 @@
+from src.alu import TABLES
+from src.program import INSTRUCTIONS_CNT, CONTROL_OPCODES
+from src.scheduler import NEVER
+
+# Python source for every specialized handler. {x} and {y} are the bound operands,
+# {addr} the address of the instruction and {next} the address that follows it.
+# Code reaching outside the block (ports, handlers) sees the cycle counter of its instruction,
+# `start` is the counter at the start of the block and {offset} the instruction's index in it.
+# Control flow instructions end a block and have to assign the next program counter to `pc`.
+TEMPLATES = {
+    'NOP':          'pass',
+    'LOAD_val':     'r[{x}] = {y}',
+    'LOAD_reg':     'r[{x}] = r[{y}]',
+    'FETCH_val':    'r[{x}] = ram[{y}]',
+    'STORE_val':    'ram[{y}] = r[{x}]',
+    'IN_val':       'vm._cycles = start + {offset}\n'
+                    'r[{x}] = vm.read_port({y})',
+    'IN_reg':       'vm._cycles = start + {offset}\n'
+                    'r[{x}] = vm.read_port(r[{y}])',
+    'OUT_val':      'vm._cycles = start + {offset}\n'
+                    'vm.write_port({y}, r[{x}])',
+    'OUT_reg':      'vm._cycles = start + {offset}\n'
+                    'vm.write_port(r[{y}], r[{x}])',
+    'ADD_val':      'r[{x}], c, z = ADD[r[{x}] << 9 | {y} << 1]',
+    'ADD_reg':      'r[{x}], c, z = ADD[r[{x}] << 9 | r[{y}] << 1]',
+    'ADDC_val':     'r[{x}], c, z = ADD[r[{x}] << 9 | {y} << 1 | c]',
+    'ADDC_reg':     'r[{x}], c, z = ADD[r[{x}] << 9 | r[{y}] << 1 | c]',
+    'SUB_val':      'r[{x}], c, z = SUB[r[{x}] << 9 | {y} << 1]',
+    'SUB_reg':      'r[{x}], c, z = SUB[r[{x}] << 9 | r[{y}] << 1]',
+    'SUBC_val':     'r[{x}], c, z = SUB[r[{x}] << 9 | {y} << 1 | c]',
+    'SUBC_reg':     'r[{x}], c, z = SUB[r[{x}] << 9 | r[{y}] << 1 | c]',
+    'COMP_val':     '_, c, z = SUB[r[{x}] << 9 | {y} << 1]',
+    'COMP_reg':     '_, c, z = SUB[r[{x}] << 9 | r[{y}] << 1]',
+    'AND_val':      'r[{x}] &= {y}\n'
+                    'z = ZERO[r[{x}]]',
+    'AND_reg':      'r[{x}] &= r[{y}]\n'
+                    'z = ZERO[r[{x}]]',
+    'OR_val':       'r[{x}] |= {y}\n'
+                    'z = ZERO[r[{x}]]',
+    'OR_reg':       'r[{x}] |= r[{y}]\n'
+                    'z = ZERO[r[{x}]]',
+    'XOR_val':      'r[{x}] ^= {y}\n'
+                    'z = ZERO[r[{x}]]',
+    'XOR_reg':      'r[{x}] ^= r[{y}]\n'
+                    'z = ZERO[r[{x}]]',
+    'TEST_val':     'c, z = TEST[r[{x}] & {y}]',
+    'TEST_reg':     'c, z = TEST[r[{x}] & r[{y}]]',
+    'SL0':          'r[{x}], c, z = SL0[r[{x}] << 1 | c]',
+    'SL1':          'r[{x}], c, z = SL1[r[{x}] << 1 | c]',
+    'SLX':          'r[{x}], c, z = SLX[r[{x}] << 1 | c]',
+    'SLA':          'r[{x}], c, z = SLA[r[{x}] << 1 | c]',
+    'RL':           'r[{x}], c, z = RL[r[{x}] << 1 | c]',
+    'SR0':          'r[{x}], c, z = SR0[r[{x}] << 1 | c]',
+    'SR1':          'r[{x}], c, z = SR1[r[{x}] << 1 | c]',
+    'SRX':          'r[{x}], c, z = SRX[r[{x}] << 1 | c]',
+    'SRA':          'r[{x}], c, z = SRA[r[{x}] << 1 | c]',
+    'RR':           'r[{x}], c, z = RR[r[{x}] << 1 | c]',
+    'DINT':         'vm._interrupt_enabled = False',
+    'EINT':         'vm._interrupt_enabled = True',
+    'JUMP':         'pc = {x}',
+    'JUMP_Z':       'pc = {x} if z else {next}',
+    'JUMP_NZ':      'pc = {next} if z else {x}',
+    'JUMP_C':       'pc = {x} if c else {next}',
+    'JUMP_NC':      'pc = {next} if c else {x}',
+    'CALL':         'vm._stack.append({addr})\n'
+                    'pc = {x}',
+    'CALL_Z':       'if z:\n'
+                    '    vm._stack.append({addr})\n'
+                    '    pc = {x}\n'
+                    'else:\n'
+                    '    pc = {next}',
+    'CALL_NZ':      'if z:\n'
+                    '    pc = {next}\n'
+                    'else:\n'
+                    '    vm._stack.append({addr})\n'
+                    '    pc = {x}',
+    'CALL_C':       'if c:\n'
+                    '    vm._stack.append({addr})\n'
+                    '    pc = {x}\n'
+                    'else:\n'
+                    '    pc = {next}',
+    'CALL_NC':      'if c:\n'
+                    '    pc = {next}\n'
+                    'else:\n'
+                    '    vm._stack.append({addr})\n'
+                    '    pc = {x}',
+    'RET':          'pc = vm._pop_stack({addr}) + 1',
+    'RET_Z':        'pc = vm._pop_stack({addr}) + 1 if z else {next}',
+    'RET_NZ':       'pc = {next} if z else vm._pop_stack({addr}) + 1',
+    'RET_C':        'pc = vm._pop_stack({addr}) + 1 if c else {next}',
+    'RET_NC':       'pc = {next} if c else vm._pop_stack({addr}) + 1',
+    'RETI_ENABLE':  'vm._interrupt_enabled = True\n'
+                    'c = vm._pre_carry\n'
+                    'z = vm._pre_zero\n'
+                    'pc = vm._pop_stack({addr})',
+    'RETI_DISABLE': 'vm._interrupt_enabled = False\n'
+                    'c = vm._pre_carry\n'
+                    'z = vm._pre_zero\n'
+                    'pc = vm._pop_stack({addr})',
+}
+
+# Handlers without a template (data dependent range checks) are called through the VM,
+# with the flags and the program counter synchronized first so errors point at the right place.
+# A handler may move the cycle counter (skipping an idle loop), the block counts on from there.
+FALLBACK = ('vm._carry = c\n'
+            'vm._zero = z\n'
+            'vm._program_cnt = {addr}\n'
+            'vm._cycles = start + {offset}\n'
+            'h{addr}({x}, {y})\n'
+            'start = vm._cycles - {offset}\n'
+            'c = vm._carry\n'
+            'z = vm._zero')
+
+# appended to the fallback of control flow instructions (e.g. instrumented ones)
+FALLBACK_CONTROL = '\npc = vm._program_cnt'
+
+
+# Runs the loaded program as basic blocks compiled into Python functions, instead of
+# dispatching every single instruction through VirtualMachine.step_over.
+class BlockEngine(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self._program = None
+        self._code = None
+        self._leaders = set()
+        self._blocks = {}
+
+    @property
+    def blocks(self):
+        return self._blocks
+
+    def invalidate(self):
+        program = self._vm.program
+
+        self._leaders = set(program.labels.values())
+        for addr, op in enumerate(program.image):
+            if op is not None and op.opcode in CONTROL_OPCODES:
+                self._leaders.add(addr + 1)
+                if op.x is not None:
+                    self._leaders.add(op.x)
+
+        self._program = program
+        self._code = self._vm._code
+        self._blocks = {}
+
+    def _block_bounds(self, start):
+        image = self._program.image
+        end = start
+        while end < INSTRUCTIONS_CNT:
+            op = image[end]
+            end += 1
+            if op is not None and op.opcode in CONTROL_OPCODES:
+                break
+            if op is not None and op.handler == 'EINT':
+                # a pending interrupt is taken right after it
+                break
+            if end in self._leaders:
+                break
+        return end
+
+    def compile(self, start):
+        if start > INSTRUCTIONS_CNT - 1:
+            raise RuntimeError("Out of memory range")
+
+        end = self._block_bounds(start)
+        namespace = dict(TABLES)
+        body = []
+
+        for addr in range(start, end):
+            handler, x, y = self._vm._code[addr]
+            # wrapped (instrumented) handlers are never inlined
+            name = handler.__name__
+            if name.startswith('_handle_'):
+                name = name[len('_handle_'):]
+            fields = {'x': repr(x), 'y': repr(y), 'addr': addr, 'next': addr + 1, 'offset': addr - start}
+
+            if name in TEMPLATES:
+                source = TEMPLATES[name].format(**fields)
+            else:
+                namespace['h%d' % addr] = handler
+                source = FALLBACK.format(**fields)
+                op = self._program.image[addr]
+                if op is not None and op.opcode in CONTROL_OPCODES:
+                    source += FALLBACK_CONTROL
+
+            body.append('    # {0}: {1}'.format(addr, name))
+            body.extend('    ' + line for line in source.split('\n'))
+
+        last = self._program.image[end - 1]
+        if last is None or last.opcode not in CONTROL_OPCODES:
+            body.append('    pc = {0}'.format(end))
+
+        source = '\n'.join(['def block(vm, r, ram):',
+                            '    c = vm._carry',
+                            '    z = vm._zero',
+                            '    start = vm._cycles',
+                            *body,
+                            '    vm._carry = c',
+                            '    vm._zero = z',
+                            '    vm._cycles = start + {0}'.format(end - start),
+                            '    return pc'])
+        exec(compile(source, '<block {0}>'.format(start), 'exec'), namespace)
+
+        block = namespace['block'], end - start
+        self._blocks[start] = block
+        return block
+
+    def run(self, amount):
+        vm = self._vm
+        if vm.program is not self._program or vm._code is not self._code:
+            self.invalidate()
+
+        blocks = self._blocks
+        registers, ram = vm._registers, vm._ram
+        # counted in cycles, an idle loop may skip ahead
+        end = vm._cycles + amount
+        vm._run_end = end
+
+        try:
+            while vm._cycles < end:
+                if vm._interrupt_caused and vm._interrupt_enabled:
+                    vm.step_over()
+                    continue
+
+                pc = vm._program_cnt
+                block = blocks.get(pc)
+                if block is None:
+                    block = self.compile(pc)
+
+                function, length = block
+                if vm._cycles + length > vm._deadline:
+                    # a scheduled event is due inside this block
+                    vm.step_over()
+                    continue
+                if vm._cycles + length > end:
+                    # the rest of the budget ends inside this block
+                    while vm._cycles < end:
+                        vm.step_over()
+                    return
+
+                vm._program_cnt = function(vm, registers, ram)
+        finally:
+            vm._run_end = NEVER
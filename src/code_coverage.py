@@ -0,0 +1,197 @@
+# Instruction and branch coverage. A bitmap holds three bit sets over the 1024 addresses: the
+# executed instructions, the conditional branches seen taken and the ones seen not taken.
+# Bitmaps of runs of the same program merge with a bitwise OR.
+from src import image_cache
+from src.program import INSTRUCTIONS_CNT
+import argparse
+import json
+import sys
+
+SET_BYTES = INSTRUCTIONS_CNT // 8
+BITMAP_BYTES = 3 * SET_BYTES
+EXECUTED, TAKEN, NOT_TAKEN = range(3)
+# the lowest bit of every byte of a set
+_LOW_BITS = int.from_bytes(b'\x01' * SET_BYTES, 'little')
+
+CONDITIONS = ('Z', 'NZ', 'C', 'NC')
+
+
+def empty():
+    return bytes(BITMAP_BYTES)
+
+
+def merge(*bitmaps):
+    merged = 0
+    for bitmap in bitmaps:
+        if len(bitmap) != BITMAP_BYTES:
+            raise ValueError('Not a coverage bitmap')
+        merged |= int.from_bytes(bitmap, 'little')
+    return merged.to_bytes(BITMAP_BYTES, 'little')
+
+
+# One byte per address to a bit set and back. Every eighth byte of `flags` holds the same bit of
+# the packed bytes, the 0/1 bytes shifted by less than a byte never carry into each other.
+def _pack(flags):
+    packed = 0
+    for bit in range(8):
+        packed |= int.from_bytes(flags[bit::8], 'little') << bit
+    return packed.to_bytes(SET_BYTES, 'little')
+
+
+def _unpack(packed, flags):
+    packed = int.from_bytes(packed, 'little')
+    for bit in range(8):
+        flags[bit::8] = (packed >> bit & _LOW_BITS).to_bytes(SET_BYTES, 'little')
+
+
+def covered(bitmap, kind, addr):
+    return bool(bitmap[kind * SET_BYTES + addr // 8] >> addr % 8 & 1)
+
+
+def conditional(op):
+    return op is not None and op.handler.split('_')[-1] in CONDITIONS
+
+
+# Collects the coverage of everything the machine executes. Attached as a VM instrument and
+# recording one byte per address while running, the bits are packed only by bitmap().
+class Coverage(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self._sets = [bytearray(INSTRUCTIONS_CNT) for _ in range(3)]
+        vm.instrument(self)
+
+    def detach(self):
+        self._vm.uninstrument(self)
+
+    def clear(self):
+        for flags in self._sets:
+            flags[:] = bytes(INSTRUCTIONS_CNT)
+
+    def bitmap(self):
+        return b''.join(_pack(flags) for flags in self._sets)
+
+    def update(self, bitmap):
+        bitmap = merge(self.bitmap(), bitmap)
+        for kind, flags in enumerate(self._sets):
+            _unpack(bitmap[kind * SET_BYTES:(kind + 1) * SET_BYTES], flags)
+
+    def instrument_code(self, vm, code):
+        image = vm.program.image
+        return [self._wrap(vm, handler, x, y, addr, image[addr]) for addr, (handler, x, y) in enumerate(code)]
+
+    def _wrap(self, vm, handler, x, y, addr, op):
+        executed, taken, not_taken = self._sets
+
+        if not conditional(op):
+            def covering(x, y):
+                executed[addr] = 1
+                handler(x, y)
+        elif op.handler.startswith('JUMP'):
+            # decided by the flags, the next program counter is the same both ways for a jump to addr + 1
+            condition = op.handler.split('_')[-1]
+            flag, state = ('_carry' if 'C' in condition else '_zero'), not condition.startswith('N')
+
+            def covering(x, y):
+                executed[addr] = 1
+                if bool(getattr(vm, flag)) == state:
+                    taken[addr] = 1
+                else:
+                    not_taken[addr] = 1
+                handler(x, y)
+        else:
+            # a taken CALL pushes and a taken RET pops the stack
+            stack = vm._stack
+
+            def covering(x, y):
+                executed[addr] = 1
+                depth = len(stack)
+                handler(x, y)
+                if len(stack) != depth:
+                    taken[addr] = 1
+                else:
+                    not_taken[addr] = 1
+
+        return covering, x, y
+
+    def instrument_interrupt(self, vm, handler):
+        return handler
+
+
+# (covered, total) instructions and branch outcomes of the addresses in `addrs`
+def summary(program, bitmap, addrs=range(INSTRUCTIONS_CNT)):
+    instructions, branches = [0, 0], [0, 0]
+    for addr in addrs:
+        op = program.image[addr]
+        if op is None:
+            continue
+        instructions[0] += covered(bitmap, EXECUTED, addr)
+        instructions[1] += 1
+        if conditional(op):
+            branches[0] += covered(bitmap, TAKEN, addr) + covered(bitmap, NOT_TAKEN, addr)
+            branches[1] += 2
+    return tuple(instructions), tuple(branches)
+
+
+# summary() of the code from every label up to the next one
+def label_summary(program, bitmap):
+    starts = sorted((addr, label) for label, addr in program.labels.items())
+    ends = [addr for addr, _ in starts[1:]] + [INSTRUCTIONS_CNT]
+    return {label: summary(program, bitmap, range(start, end)) for (start, label), end in zip(starts, ends)}
+
+
+# Marks every source line: '-' without code, '#####' never executed, '+' executed and
+# for a conditional branch 'T' / 'N' when it was seen taken / not taken.
+def annotate(program, bitmap, source_lines):
+    marks = {}
+    for addr, line in enumerate(program.lines or ()):
+        op = program.image[addr]
+        if line is None or op is None:
+            continue
+        if not covered(bitmap, EXECUTED, addr):
+            marks[line] = '#####'
+        elif conditional(op):
+            marks[line] = ('T' if covered(bitmap, TAKEN, addr) else '-') + \
+                          ('N' if covered(bitmap, NOT_TAKEN, addr) else '-')
+        else:
+            marks[line] = '+'
+
+    return ['{0:>5} {1:>5}: {2}'.format(marks.get(line_no, '-'), line_no, text.rstrip('\n'))
+            for line_no, text in enumerate(source_lines, 1)]
+
+
+def _percent(pair):
+    return '{0:.1f}%'.format(100.0 * pair[0] / pair[1]) if pair[1] else '-'
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Prints the source of a program annotated with the '
+                                                     'coverage written by src.run --coverage.')
+    arg_parser.add_argument('program', help='.psm file')
+    arg_parser.add_argument('coverage', nargs='+', help='JSON files of {"program": "hex bitmap"}')
+    args = arg_parser.parse_args(argv)
+
+    program = image_cache.load(args.program)
+
+    bitmaps = []
+    for filename in args.coverage:
+        with open(filename) as file:
+            bitmaps.extend(bytes.fromhex(bitmap) for name, bitmap in json.load(file).items()
+                           if name == args.program)
+    bitmap = merge(empty(), *bitmaps)
+
+    with open(args.program) as file:
+        for line in annotate(program, bitmap, file):
+            print(line)
+
+    instructions, branches = summary(program, bitmap)
+    print('')
+    print('{0:<24} {1:>16} {2:>16}'.format('label', 'instructions', 'branches'))
+    for label, (label_instructions, label_branches) in sorted(label_summary(program, bitmap).items(),
+                                                              key=lambda item: program.labels[item[0]]):
+        print('{0:<24} {1:>16} {2:>16}'.format(label, _percent(label_instructions), _percent(label_branches)))
+    print('{0:<24} {1:>16} {2:>16}'.format('total', _percent(instructions), _percent(branches)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
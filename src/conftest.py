@@ -0,0 +1,55 @@
+import pytest
+from src import assembler
+from src.virtual_machine import VirtualMachine
+import os
+from os import remove
+
+
+# the assembled images and parser tables of the tests never go to the user's cache
+@pytest.fixture(scope='session', autouse=True)
+def cache_dir(tmp_path_factory):
+    previous = os.environ.get('PICOBLAZE_CACHE_DIR')
+    os.environ['PICOBLAZE_CACHE_DIR'] = str(tmp_path_factory.mktemp('cache'))
+    yield os.environ['PICOBLAZE_CACHE_DIR']
+
+    if previous is None:
+        del os.environ['PICOBLAZE_CACHE_DIR']
+    else:
+        os.environ['PICOBLAZE_CACHE_DIR'] = previous
+
+
+@pytest.fixture(scope='session')
+def create_and_parse():
+
+    def _create_and_parse(orders):
+        lines = map(lambda x: x + '\n', orders)
+        with open('testfile', 'w') as file:
+            file.writelines(lines)
+
+        vm = VirtualMachine()
+        vm.parse_file('testfile')
+        return vm
+
+    yield _create_and_parse
+    remove('testfile')
+
+
+@pytest.fixture(scope='session')
+def assemble():
+
+    def _assemble(orders):
+        return assembler.assemble([order + '\n' for order in orders])
+
+    return _assemble
+
+
+# writes the orders to a .psm file in the test's tmpdir, returns its path
+@pytest.fixture
+def write_program(tmpdir):
+
+    def _write_program(name, orders):
+        path = tmpdir.join(name)
+        path.write('\n'.join(orders) + '\n')
+        return str(path)
+
+    return _write_program
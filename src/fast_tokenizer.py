@@ -0,0 +1,114 @@
+# Drop-in replacement for the ply lexer built from tokenizer_rules. Every identifier is scanned
+# once and classified through a dict, instead of trying one keyword regex after another.
+# The tokens (types, values, precedence and errors) are the same as from tokenizer_rules.
+from src.errors import TokenizeException
+from src.mnemonics import MNEMONICS
+from ply.lex import LexToken
+import re
+
+KEYWORDS = {name: ('REGISTER', name) for name in ['S%d' % i for i in range(16)] + ['S%s' % i for i in 'ABCDEF']}
+KEYWORDS.update({name: (name, name) for name in MNEMONICS})
+
+# they come after LABEL in tokenizer_rules, so 'C:' is a label and not an indicator
+LATE_KEYWORDS = {name: ('INDICATOR', name) for name in ('C', 'NC', 'Z', 'NZ')}
+LATE_KEYWORDS.update({name: ('FLAG', name) for name in ('ENABLE', 'DISABLE')})
+
+IGNORE = ' \t'
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+_DECIMAL = re.compile(r'\d+')
+_HEXADECIMAL = re.compile(r'[0-9a-fA-F]+')
+
+
+def _word_char(char):
+    return char == '_' or char.isalnum()
+
+
+class FastLexer(object):
+    def __init__(self):
+        self.lexdata = ''
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+
+    def input(self, data):
+        self.lexdata = data
+        self.lexpos = 0
+        self.lexlen = len(data)
+
+    def _token(self, kind, value, pos):
+        token = LexToken()
+        token.type = kind
+        token.value = value
+        token.lineno = self.lineno
+        token.lexpos = pos
+        return token
+
+    def token(self):
+        data, pos, end = self.lexdata, self.lexpos, self.lexlen
+
+        while pos < end:
+            char = data[pos]
+
+            if char in IGNORE:
+                pos += 1
+                continue
+
+            if char == '\n':
+                self.lineno += 1
+                pos += 1
+                continue
+
+            match = _IDENTIFIER.match(data, pos)
+            if match is not None:
+                word = match.group()
+                after = match.end()
+                # keywords are matched as whole words (\b...\b), labels and names are not
+                bounded = (pos == 0 or not _word_char(data[pos - 1])) and \
+                          (after == end or not _word_char(data[after]))
+                upper = word.upper()
+                self.lexpos = after
+
+                if bounded and upper in KEYWORDS:
+                    return self._token(KEYWORDS[upper][0], KEYWORDS[upper][1], pos)
+                if after < end and data[after] == ':':
+                    self.lexpos = after + 1
+                    return self._token('LABEL', word, pos)
+                if bounded and upper in LATE_KEYWORDS:
+                    return self._token(LATE_KEYWORDS[upper][0], LATE_KEYWORDS[upper][1], pos)
+                return self._token('NAME', word, pos)
+
+            match = _DECIMAL.match(data, pos)
+            if match is not None:
+                self.lexpos = match.end()
+                return self._token('NUMBER', int(match.group()), pos)
+
+            if char == '$':
+                match = _HEXADECIMAL.match(data, pos + 1)
+                if match is not None:
+                    self.lexpos = match.end()
+                    return self._token('NUMBER', int(match.group(), 16), pos)
+
+            elif char == ';':
+                newline = data.find('\n', pos)
+                self.lexpos = end if newline == -1 else newline
+                return self._token('COMMENT', data[pos:self.lexpos], pos)
+
+            elif char == ',':
+                self.lexpos = pos + 1
+                return self._token('COMMA', ',', pos)
+
+            self.lexpos = pos
+            raise TokenizeException("Illegal character '%s' in line %d" % (char, self.lineno))
+
+        self.lexpos = pos
+        return None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = self.token()
+        if token is None:
+            raise StopIteration
+        return token
@@ -0,0 +1,125 @@
+from src.mnemonics import JUMP
+from src.program import OPCODES, REG_INSTRUCTIONS
+from src.scheduler import NEVER
+
+# Instructions a skipped loop may hold: they only change registers and flags, and read
+# the RAM (which nothing in the loop writes) or input ports given as constants
+PURE_HANDLERS = frozenset(('LOAD', 'FETCH', 'ADD', 'ADDC', 'SUB', 'SUBC', 'AND', 'OR', 'XOR', 'TEST', 'COMP',
+                           'JUMP') + tuple(instruction.__name__ for instruction in REG_INSTRUCTIONS))
+
+
+# Returns the input ports the loop from `start` to the back-edge at `end` reads,
+# or None when something in it has effects outside of the registers and flags
+def loop_ports(image, start, end):
+    ports = []
+    for addr in range(start, end + 1):
+        op = image[addr]
+        if op is None:
+            return None
+        if op.handler == 'IN_val':
+            ports.append(op.y)
+        elif op.handler.split('_')[0] not in PURE_HANDLERS:
+            return None
+    return tuple(ports)
+
+
+# Fast-forwards loops that wait for something to happen: busy loops (JUMP to itself) and
+# loops polling input ports. The registers and flags are compared every time the back-edge
+# of such a loop is taken. When an iteration ended in the same state it started in, and
+# nothing could have changed what it reads (no event was called, the ports it reads are not
+# mapped to devices), every following iteration does the same. Those are skipped at once,
+# up to the cycle before the next scheduled event or the end of the run, so the machine
+# lands on exactly the cycle and state it would have reached by executing them.
+#
+# Nothing is skipped outside of a run with a cycle budget, or while the journal records.
+class IdleSkipper(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self._history = {}      # back-edge address -> (state, cycle) of the last iteration
+        self._skipped = 0
+        vm.instrument(self)
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    def detach(self):
+        self._history.clear()
+        self._vm.uninstrument(self)
+
+    def instrument_code(self, vm, code):
+        self._history.clear()
+        image = vm.program.image
+        loops = []
+        for addr, op in enumerate(image):
+            if op is not None and OPCODES[op.opcode] is JUMP and op.x <= addr:
+                ports = loop_ports(image, op.x, addr)
+                if ports is not None:
+                    loops.append((op.x, addr, ports))
+
+        code = list(code)
+        for start, end, ports in loops:
+            handler, x, y = code[end]
+            code[end] = self._back_edge(handler, x, y, start, end, ports)
+        # branches leaving a loop from the inside end its history
+        for start, end, _ in loops:
+            for addr in range(start, end):
+                if OPCODES[image[addr].opcode] is JUMP:
+                    handler, x, y = code[addr]
+                    code[addr] = self._exit(handler, x, y, start, end)
+        return code
+
+    def instrument_interrupt(self, vm, handler):
+        history = self._history
+
+        def idle_interrupted():
+            history.clear()
+            handler()
+
+        return idle_interrupted
+
+    def _exit(self, handler, x, y, start, end):
+        vm, history = self._vm, self._history
+
+        def idle_exit(x, y):
+            handler(x, y)
+            if not start <= vm._program_cnt <= end:
+                history.pop(end, None)
+
+        return idle_exit, x, y
+
+    def _back_edge(self, handler, x, y, start, end, ports):
+        vm, history = self._vm, self._history
+        registers, input_ports = vm._registers, vm._input_ports
+
+        def idle_back_edge(x, y):
+            handler(x, y)
+            if vm._program_cnt != start:
+                history.pop(end, None)
+                return
+
+            # the run and the deadline are part of the state, a new run or a called event
+            # make the last iteration useless for predicting the next ones
+            cycle = vm._cycles
+            state = (bytes(registers), vm._carry, vm._zero, vm._run_end, vm._deadline,
+                     bytes(input_ports[port] for port in ports))
+            last = history.get(end)
+            history[end] = state, cycle
+            if last is None or last[0] != state:
+                return
+
+            limit = min(vm._run_end, vm._deadline)
+            period = cycle - last[1]
+            if vm._run_end == NEVER or vm._journal is not None or \
+                    (vm._interrupt_caused and vm._interrupt_enabled) or \
+                    not all(vm._plain_input(port) for port in ports):
+                return
+
+            # the back-edges of the skipped iterations all execute before `limit`
+            skip = (limit - 1 - cycle) // period * period
+            if skip > 0:
+                vm._cycles += skip
+                self._skipped += skip
+                history[end] = state, cycle + skip
+
+        return idle_back_edge, x, y
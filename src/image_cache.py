@@ -0,0 +1,152 @@
+from src import assembler
+from src.program import Program
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+import time
+
+# Assembled programs stored on disk under the hash of their source and the assembler version,
+# so an unchanged file is loaded without running the parser. Reads refresh the modification
+# time of an entry and the least recently used entries are removed once the cache is too big.
+MAX_SIZE = 64 * 1024 * 1024
+SUFFIX = '.image'
+TEMPORARY_SUFFIX = '.tmp'
+# a temporary file this old was left by a writer that crashed
+STALE_TEMPORARY = 60 * 60
+
+
+class ImageCache(object):
+    def __init__(self, directory=None, max_size=MAX_SIZE):
+        self._directory = directory or os.path.join(assembler.cache_root(), 'images')
+        self._max_size = max_size
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def key(self, source):
+        digest = hashlib.sha256(assembler.version().encode())
+        digest.update(b'\0')
+        digest.update(source)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                program = pickle.load(file)
+            if type(program) is not Program:
+                raise TypeError('Not a program')
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # a broken, foreign or unreadable entry is a miss, and is not read again
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return program
+
+    def put(self, key, program):
+        if assembler.writable_dir(self._directory) is None:
+            return
+
+        # written next to the entry and renamed, so readers never see a partial file
+        fd, temporary = tempfile.mkstemp(dir=self._directory, suffix=TEMPORARY_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(program, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key))
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+
+        self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            # removed by another process already
+            pass
+
+    # (modification time, size, path) of the entries and of the temporary files of writers
+    def _files(self):
+        files = []
+        if not os.path.isdir(self._directory):
+            return files
+
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(SUFFIX) or entry.name.endswith(TEMPORARY_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def entries(self):
+        return [entry for entry in self._files() if entry[2].endswith(SUFFIX)]
+
+    def size(self):
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self):
+        entries = []
+        size = 0
+        stale = time.time() - STALE_TEMPORARY
+        for mtime, file_size, path in self._files():
+            if path.endswith(SUFFIX):
+                entries.append((mtime, file_size, path))
+            elif mtime < stale:
+                self._remove(path)
+                continue
+            size += file_size
+
+        for _, entry_size, path in sorted(entries):
+            if size <= self._max_size:
+                break
+            self._remove(path)
+            size -= entry_size
+
+    def clear(self):
+        for _, _, path in self._files():
+            self._remove(path)
+
+    def load(self, filename):
+        with open(filename, 'rb') as file:
+            source = file.read()
+
+        key = self.key(source)
+        program = self.get(key)
+        if program is None:
+            program = assembler.assemble(io.StringIO(source.decode(), newline=None))
+            self.put(key, program)
+        return program
+
+
+_default = None
+
+
+def default_cache():
+    global _default
+    if _default is None:
+        _default = ImageCache()
+    return _default
+
+
+def load(filename):
+    return default_cache().load(filename)
@@ -0,0 +1,308 @@
+from src import assembler
+from src.errors import ParseException, TokenizeException
+from src.fast_tokenizer import FastLexer
+from src.mnemonics import ORG, LABEL
+from src.parser_rules import ParserState
+from src.program import decode, Program, INSTRUCTIONS_CNT, BRANCH_INSTRUCTIONS
+from bisect import bisect_left, insort
+
+PARSE_ERRORS = (ParseException, TokenizeException)
+
+
+# Keeps an assembled program in sync with its source while single lines are edited.
+# update() parses only the edited line (and the lines using an alias it redefines),
+# places the lines from the edit on until the addresses match the previous layout
+# again, and decodes only the moved instructions and the branches to moved labels.
+class IncrementalAssembler(object):
+    def __init__(self, lines=()):
+        self._lines = []
+        self._items = []         # per line: instructions, ORG and LABEL parsed from it
+        self._directives = []    # per line: EQU and DS* directives, as (alias, value) pairs
+        self._names = []         # per line: names the line refers to
+        self._starts = [0]       # per line: the address the line starts at, plus the end address
+        self._addrs = []         # per line: addresses of its instructions
+        self._line_labels = []   # per line: (label, address) pairs
+        self._parse_errors = {}
+        self._link_errors = {}
+
+        self._alias_defs = {}    # alias -> sorted indices of the lines defining it
+        self._aliases = {}
+        self._label_defs = {}    # label -> sorted indices of the lines defining it
+        self._labels = {}
+        self._references = {}    # label -> addresses of the branches to it
+
+        self._owners = [None] * INSTRUCTIONS_CNT
+        self._instructions = {addr: None for addr in range(INSTRUCTIONS_CNT)}
+        self._image = [None] * INSTRUCTIONS_CNT
+        self._targets = [None] * INSTRUCTIONS_CNT
+        self._decode_errors = {}
+
+        self._lexer = FastLexer()
+
+        for text in lines:
+            self._append('')
+            self._lines[-1] = text.rstrip('\n')
+            self._parse(len(self._lines) - 1)
+        self._relink(0, len(self._lines) - 1)
+
+    @property
+    def lines(self):
+        return list(self._lines)
+
+    @property
+    def labels(self):
+        return self._labels
+
+    @property
+    def aliases(self):
+        return self._aliases
+
+    @property
+    def image(self):
+        return self._image
+
+    # errors of the current source by line number, assemble() would raise the first one
+    @property
+    def errors(self):
+        errors = {}
+        for addr, error in self._decode_errors.items():
+            errors[self._owners[addr] + 1] = error
+        for label, lines in self._label_defs.items():
+            for line in lines[1:]:
+                errors[line + 1] = ValueError(str(LABEL(alias=label)) + ": Label already in use")
+        for line, error in self._link_errors.items():
+            errors[line + 1] = error
+        for line, error in self._parse_errors.items():
+            errors[line + 1] = error
+        return errors
+
+    @property
+    def program(self):
+        errors = self.errors
+        if errors:
+            raise errors[min(errors)]
+
+        return Program(image=list(self._image), labels=dict(self._labels), instructions=dict(self._instructions),
+                       aliases=dict(self._aliases),
+                       directives=[directive for directives in self._directives for directive in directives],
+                       lines=[None if line is None else line + 1 for line in self._owners])
+
+    # Replaces the text of the line (1-based), or adds a line right after the last one
+    def update(self, line_no, text):
+        index = line_no - 1
+        if index < 0 or index > len(self._lines):
+            raise IndexError('No such line {0}'.format(line_no))
+        if index == len(self._lines):
+            self._append('')
+
+        self._lines[index] = text.rstrip('\n')
+        parsed = self._parse(index)
+        self._relink(min(parsed), max(parsed))
+
+    # Inserts a line before line `line_no` (1-based), or after the last one. The per line state
+    # below it is moved, only the new line is parsed.
+    def insert(self, line_no, text):
+        index = line_no - 1
+        if index < 0 or index > len(self._lines):
+            raise IndexError('No such line {0}'.format(line_no))
+
+        self._shift(index, 1)
+        self._lines.insert(index, '')
+        self._items.insert(index, ())
+        self._directives.insert(index, ())
+        self._names.insert(index, frozenset())
+        self._addrs.insert(index, ())
+        self._line_labels.insert(index, ())
+        self._starts.insert(index, self._starts[index])
+        self.update(line_no, text)
+
+    def delete(self, line_no):
+        index = line_no - 1
+        if index < 0 or index >= len(self._lines):
+            raise IndexError('No such line {0}'.format(line_no))
+
+        # an empty line holds nothing, removing it changes no address
+        self.update(line_no, '')
+        for lines in (self._lines, self._items, self._directives, self._names, self._addrs, self._line_labels,
+                      self._starts):
+            del lines[index]
+        self._shift(index + 1, -1)
+
+    # Moves every reference to the lines from `index` on by `delta`
+    def _shift(self, index, delta):
+        def moved(line):
+            return line + delta if line >= index else line
+
+        self._parse_errors = {moved(line): error for line, error in self._parse_errors.items()}
+        self._link_errors = {moved(line): error for line, error in self._link_errors.items()}
+        for defs in (self._alias_defs, self._label_defs):
+            for lines in defs.values():
+                lines[:] = [moved(line) for line in lines]
+        self._owners = [None if line is None else moved(line) for line in self._owners]
+
+    def _append(self, text):
+        self._lines.append(text)
+        self._items.append(())
+        self._directives.append(())
+        self._names.append(frozenset())
+        self._addrs.append(())
+        self._line_labels.append(())
+        self._starts.append(self._starts[-1])
+
+    def _scan_names(self, text):
+        self._lexer.input(text)
+        try:
+            return frozenset(token.value for token in self._lexer if token.type == 'NAME')
+        except TokenizeException:
+            return frozenset()
+
+    def _alias_at(self, name, index):
+        lines = self._alias_defs.get(name, ())
+        position = bisect_left(lines, index)
+        if position == 0:
+            return None
+        return dict(self._directives[lines[position - 1]])[name]
+
+    # Parses the line and every later line using an alias it changed, returns the parsed indices
+    def _parse(self, index):
+        parsed = set()
+        pending = [index]
+
+        while pending:
+            index = pending.pop()
+            parsed.add(index)
+
+            names = self._scan_names(self._lines[index])
+            state = ParserState()
+            for name in names:
+                value = self._alias_at(name, index)
+                if value is not None:
+                    state.aliases[name] = value
+
+            self._parse_errors.pop(index, None)
+            try:
+                items = tuple(item for _, item in assembler.stream([self._lines[index] + '\n'], state, index + 1))
+                directives = tuple(state.directives)
+            except PARSE_ERRORS as e:
+                self._parse_errors[index] = e
+                items, directives = (), ()
+
+            self._items[index] = items
+            self._names[index] = names
+            changed = self._define(index, directives)
+
+            if changed:
+                pending.extend(line for line in range(index + 1, len(self._lines))
+                               if line not in parsed and self._names[line] & changed)
+        return parsed
+
+    def _define(self, index, directives):
+        old, new = dict(self._directives[index]), dict(directives)
+        self._directives[index] = directives
+
+        changed = set(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+        for name in changed:
+            lines = self._alias_defs.setdefault(name, [])
+            if name in old and name not in new:
+                lines.remove(index)
+            elif name in new and name not in old:
+                insort(lines, index)
+
+            if lines:
+                self._aliases[name] = dict(self._directives[lines[-1]])[name]
+            else:
+                del self._alias_defs[name]
+                self._aliases.pop(name, None)
+        return changed
+
+    # The address assignment of program.link, from line `first` until the
+    # layout matches the previous one again after line `last`
+    def _relink(self, first, last):
+        moved_labels = set()
+        placed = set()
+        counter = self._starts[first]
+
+        index = first
+        while index < len(self._lines):
+            if index > last and counter == self._starts[index]:
+                break
+            self._starts[index] = counter
+
+            for addr in self._addrs[index]:
+                if self._owners[addr] == index:
+                    self._owners[addr] = None
+                    self._instructions[addr] = None
+                    placed.add(addr)
+            for label, _ in self._line_labels[index]:
+                self._label_defs[label].remove(index)
+                moved_labels.add(label)
+
+            addrs, labels = [], []
+            self._link_errors.pop(index, None)
+            for item in self._items[index]:
+                if type(item) == ORG:
+                    if counter <= item[0]:
+                        counter = item[0]
+                    else:
+                        self._link_errors[index] = ValueError(str(item) + ": Trying to place code in past position")
+                elif type(item) == LABEL:
+                    labels.append((item[0], counter))
+                    insort(self._label_defs.setdefault(item[0], []), index)
+                    moved_labels.add(item[0])
+                elif counter > INSTRUCTIONS_CNT - 1:
+                    self._link_errors[index] = ValueError(str(item) + ": Program does not fit in memory")
+                else:
+                    self._owners[counter] = index
+                    self._instructions[counter] = item
+                    placed.add(counter)
+                    addrs.append(counter)
+                    counter += 1
+
+            self._addrs[index] = tuple(addrs)
+            self._line_labels[index] = tuple(labels)
+            index += 1
+        else:
+            self._starts[-1] = counter
+
+        for label in moved_labels:
+            lines = self._label_defs.get(label)
+            if not lines:
+                self._label_defs.pop(label, None)
+                address = None
+            else:
+                address = dict(self._line_labels[lines[0]])[label]
+
+            if self._labels.get(label) != address:
+                if address is None:
+                    del self._labels[label]
+                else:
+                    self._labels[label] = address
+                placed.update(self._references.get(label, ()))
+
+        for addr in placed:
+            self._decode(addr)
+
+    def _decode(self, addr):
+        target = self._targets[addr]
+        if target is not None:
+            self._references[target].discard(addr)
+            self._targets[addr] = None
+        self._decode_errors.pop(addr, None)
+
+        instruction = self._instructions[addr]
+        if instruction is None:
+            self._image[addr] = None
+            return
+
+        if type(instruction) in BRANCH_INSTRUCTIONS:
+            label_or_ind, label_or_addr = instruction
+            target = label_or_ind if label_or_addr is None else label_or_addr
+            if type(target) is str:
+                self._targets[addr] = target
+                self._references.setdefault(target, set()).add(addr)
+
+        try:
+            self._image[addr] = decode(instruction, addr, self._labels)
+        except (KeyError, ValueError) as e:
+            self._image[addr] = None
+            self._decode_errors[addr] = e
@@ -0,0 +1,194 @@
+from src.program import REG_INSTRUCTIONS, RAM_SIZE
+from collections import deque
+
+# What an undo record restores besides the program counter and the flags
+NONE, REGISTER, RAM, PORT, STACK, INTERRUPT_ENABLE, RETI, INTERRUPT = range(8)
+
+REGISTER_HANDLERS = frozenset(('LOAD', 'FETCH', 'IN', 'ADD', 'ADDC', 'SUB', 'SUBC', 'AND', 'OR', 'XOR') +
+                              tuple(instruction.__name__ for instruction in REG_INSTRUCTIONS))
+
+
+# Returns a function capturing the (kind, a, b) part of the undo record of the handler
+def _capture(vm, name, x, y):
+    base = name.split('_')[0]
+    registers, ram, stack, output_ports = vm._registers, vm._ram, vm._stack, vm._output_ports
+
+    if base in REGISTER_HANDLERS:
+        return lambda: (REGISTER, x, registers[x])
+    if name == 'STORE_val':
+        return lambda: (RAM, y, ram[y])
+    if name == 'STORE_reg':
+        # an address out of range raises in the handler, before anything is recorded
+        return lambda: (RAM, registers[y], ram[registers[y]] if registers[y] < RAM_SIZE else 0)
+    if name == 'OUT_val':
+        return lambda: (PORT, y, output_ports[y])
+    if name == 'OUT_reg':
+        return lambda: (PORT, registers[y], output_ports[registers[y]])
+    if base in ('CALL', 'RET'):
+        return lambda: (STACK, len(stack), stack[-1] if stack else 0)
+    if base in ('EINT', 'DINT'):
+        return lambda: (INTERRUPT_ENABLE, vm._interrupt_enabled, None)
+    if base == 'RETI':
+        return lambda: (RETI, stack[-1] if stack else 0, vm._interrupt_enabled)
+    return lambda: (NONE, None, None)
+
+
+# Records what every executed instruction overwrites, so execution can be undone.
+#
+# The records are kept in chunks of `checkpoint_interval` instructions, each starting with
+# a snapshot of the machine. Going back restores the snapshot that ends the chunk holding the
+# target and undoes the rest of that chunk, so a step back never undoes more than one chunk.
+# At most `capacity` instructions are kept, the oldest chunks are dropped first.
+#
+# Only the machine is rewound, what the port hooks did (and the input ports) stays as it is.
+# Called scheduler events are not undone either, going back to before the last one raises.
+class Journal(object):
+    def __init__(self, vm, capacity=1 << 20, checkpoint_interval=1 << 12):
+        if capacity < checkpoint_interval or checkpoint_interval < 1:
+            raise ValueError('The capacity has to hold at least one checkpoint interval')
+
+        self._vm = vm
+        self._interval = checkpoint_interval
+        self._chunks = deque(maxlen=capacity // checkpoint_interval - 1)
+        self._records = []
+        self._start = self._snapshot(), vm.cycles
+        vm.instrument(self)
+
+    @property
+    def vm(self):
+        return self._vm
+
+    # the earliest cycle the machine can be taken back to
+    @property
+    def earliest(self):
+        if self._chunks:
+            return self._chunks[0][1]
+        return self._start[1]
+
+    def __len__(self):
+        return self._vm.cycles - self.earliest
+
+    def detach(self):
+        self._vm.uninstrument(self)
+
+    def clear(self):
+        self._chunks.clear()
+        del self._records[:]
+        self._start = self._snapshot(), self._vm.cycles
+
+    # whether the scheduler raised the interrupt line is kept with the machine
+    def _snapshot(self):
+        vm = self._vm
+        return vm.snapshot(), vm._scheduler is not None and vm._scheduler._raised
+
+    def _restore(self, snapshot):
+        vm = self._vm
+        input_ports = bytes(vm._input_ports)
+        vm.restore(snapshot[0])
+        vm._input_ports[:] = input_ports
+        if vm._scheduler is not None:
+            vm._scheduler._raised = snapshot[1]
+
+    # Called before an instruction, while the machine is consistent. Every chunk holds exactly
+    # `checkpoint_interval` records, so the cycle the next one starts at is known.
+    def _checkpoint(self):
+        snapshot, cycles = self._start
+        self._chunks.append((snapshot, cycles, self._records[:]))
+        del self._records[:]
+        self._start = self._snapshot(), cycles + self._interval
+
+    def instrument_code(self, vm, code):
+        return [self._wrap(handler, x, y, _capture(vm, handler.__name__[len('_handle_'):], x, y))
+                for handler, x, y in code]
+
+    def _wrap(self, handler, x, y, capture):
+        vm, records, append, interval, checkpoint = \
+            self._vm, self._records, self._records.append, self._interval, self._checkpoint
+
+        def journaled(x, y):
+            if len(records) >= interval:
+                checkpoint()
+            record = (vm._program_cnt, vm._carry, vm._zero) + capture()
+            handler(x, y)
+            append(record)
+
+        return journaled, x, y
+
+    def instrument_interrupt(self, vm, handler):
+        records, append, interval, checkpoint = self._records, self._records.append, self._interval, self._checkpoint
+
+        def journaled():
+            if len(records) >= interval:
+                checkpoint()
+            # the line was raised, by the scheduler when it clears it on taking the interrupt
+            raised = vm._scheduler is not None and vm._scheduler._raised
+            record = vm._program_cnt, vm._carry, vm._zero, INTERRUPT, (vm._pre_carry, vm._pre_zero), raised
+            handler()
+            append(record)
+
+        return journaled
+
+    def _undo(self, record):
+        vm = self._vm
+        vm._program_cnt, vm._carry, vm._zero, kind, a, b = record
+
+        if kind == REGISTER:
+            vm._registers[a] = b
+        elif kind == RAM:
+            vm._ram[a] = b
+        elif kind == PORT:
+            vm._output_ports[a] = b
+        elif kind == STACK:
+            # CALL pushed one address, RET popped `b`
+            del vm._stack[a:]
+            if len(vm._stack) < a:
+                vm._stack.append(b)
+        elif kind == INTERRUPT_ENABLE:
+            vm._interrupt_enabled = a
+        elif kind == RETI:
+            vm._stack.append(a)
+            vm._interrupt_enabled = b
+        elif kind == INTERRUPT:
+            vm._stack.pop()
+            vm._pre_carry, vm._pre_zero = a
+            vm._interrupt_enabled = True
+            vm._interrupt_caused = True
+            if vm._scheduler is not None:
+                vm._scheduler._raised = b
+
+        vm._cycles -= 1
+
+    def step_back(self, amount=1):
+        vm = self._vm
+        target = vm.cycles - amount
+        if amount < 0 or target < self.earliest:
+            raise ValueError('The journal only reaches back to cycle {0}'.format(self.earliest))
+        if vm.cycles - self._start[1] != len(self._records):
+            raise RuntimeError('The machine was changed outside of the journal, clear() it first')
+        if vm._scheduler is not None:
+            vm._scheduler.check_travel(target)
+
+        while target < self._start[1]:
+            # the whole current chunk goes, continue from the end of the previous one
+            self._restore(self._start[0])
+            vm._cycles = self._start[1]
+
+            snapshot, cycles, records = self._chunks.pop()
+            self._start = snapshot, cycles
+            self._records[:] = records
+
+        records = self._records
+        while vm.cycles > target:
+            self._undo(records.pop())
+
+    # Goes back to the last time the program counter was at `pc`, returns the number of steps
+    # taken back, or None (leaving the machine as it is) when the journal does not reach it.
+    def run_back_to(self, pc):
+        steps = 0
+        for records in [self._records] + [chunk[2] for chunk in reversed(self._chunks)]:
+            for record in reversed(records):
+                steps += 1
+                if record[0] == pc:
+                    self.step_back(steps)
+                    return steps
+        return None
@@ -0,0 +1,204 @@
+# KCPSM3 (PicoBlaze for Spartan-3) machine code: 18 bit instruction words and ROM images.
+#
+#   sX, kk  opcode << 12 | sX << 8 | kk          shift   0x20 << 12 | sX << 8 | code
+#   sX, sY  opcode << 12 | sX << 8 | sY << 4     branch  opcode << 12 | condition << 10 | address
+from src.mnemonics import *
+from src.program import link, REGISTERS, REGISTER_NAMES, INSTRUCTIONS_CNT
+import os
+
+WORD_MASK = 0x3FFFF
+
+# (constant or port or address form, register form)
+REG_VAL_OPCODES = {
+    LOAD: (0x00, 0x01),
+    AND: (0x0A, 0x0B),
+    OR: (0x0C, 0x0D),
+    XOR: (0x0E, 0x0F),
+    TEST: (0x12, 0x13),
+    COMP: (0x14, 0x15),
+    ADD: (0x18, 0x19),
+    ADDC: (0x1A, 0x1B),
+    SUB: (0x1C, 0x1D),
+    SUBC: (0x1E, 0x1F),
+    IN: (0x04, 0x05),
+    OUT: (0x2C, 0x2D),
+    FETCH: (0x06, 0x07),
+    STORE: (0x2E, 0x2F),
+}
+
+SHIFT_OPCODE = 0x20
+SHIFT_CODES = {SLA: 0x00, RL: 0x02, SLX: 0x04, SL0: 0x06, SL1: 0x07, SRA: 0x08, SRX: 0x0A, RR: 0x0C, SR0: 0x0E,
+               SR1: 0x0F}
+
+# (unconditional, conditional)
+BRANCH_OPCODES = {RET: (0x2A, 0x2B), CALL: (0x30, 0x31), JUMP: (0x34, 0x35)}
+CONDITIONS = ('Z', 'NZ', 'C', 'NC')
+
+RETI_OPCODE = 0x38
+INTERRUPT_OPCODE = 0x3C
+FLAGS = ('DISABLE', 'ENABLE')
+
+
+def _value(instruction, arg, limit):
+    if type(arg) is str:
+        if arg not in REGISTERS:
+            raise ValueError('"{0}" is not a register ({1})'.format(arg, str(instruction)))
+        return REGISTERS[arg]
+    if arg < 0 or arg > limit:
+        raise ValueError('"{0}" does not fit the instruction word ({1})'.format(arg, str(instruction)))
+    return arg
+
+
+def _address(instruction, arg, labels):
+    if type(arg) is str:
+        if arg not in labels:
+            raise KeyError('No such label "{0}" ({1})'.format(arg, str(instruction)))
+        arg = labels[arg]
+    return _value(instruction, arg, INSTRUCTIONS_CNT - 1)
+
+
+def encode(instruction, labels=None):
+    kind = type(instruction)
+
+    if kind in REG_VAL_OPCODES:
+        reg, reg_or_val = instruction
+        x = _value(instruction, reg, 0xF)
+        if type(reg_or_val) is str:
+            return REG_VAL_OPCODES[kind][1] << 12 | x << 8 | _value(instruction, reg_or_val, 0xF) << 4
+        return REG_VAL_OPCODES[kind][0] << 12 | x << 8 | _value(instruction, reg_or_val, 0xFF)
+
+    if kind in SHIFT_CODES:
+        return SHIFT_OPCODE << 12 | _value(instruction, instruction.reg, 0xF) << 8 | SHIFT_CODES[kind]
+
+    if kind is RET:
+        if instruction.indicator is None:
+            return BRANCH_OPCODES[RET][0] << 12
+        return BRANCH_OPCODES[RET][1] << 12 | CONDITIONS.index(instruction.indicator) << 10
+
+    if kind in BRANCH_OPCODES:
+        label_or_ind, label_or_addr = instruction
+        if label_or_addr is None:
+            return BRANCH_OPCODES[kind][0] << 12 | _address(instruction, label_or_ind, labels or {})
+        return BRANCH_OPCODES[kind][1] << 12 | CONDITIONS.index(label_or_ind) << 10 | \
+            _address(instruction, label_or_addr, labels or {})
+
+    if kind is RETI:
+        return RETI_OPCODE << 12 | FLAGS.index(instruction.flag)
+    if kind is EINT:
+        return INTERRUPT_OPCODE << 12 | 1
+    if kind is DINT:
+        return INTERRUPT_OPCODE << 12
+
+    raise ValueError('{0} has no machine code'.format(str(instruction)))
+
+
+def _reg_val(kind, register):
+    if register:
+        return lambda word: kind(REGISTER_NAMES[word >> 8 & 0xF], REGISTER_NAMES[word >> 4 & 0xF])
+    return lambda word: kind(REGISTER_NAMES[word >> 8 & 0xF], word & 0xFF)
+
+
+def _shift(word):
+    kind = SHIFT_KINDS.get(word & 0xFF)
+    if kind is None:
+        raise ValueError('Invalid shift instruction word {0:05X}'.format(word))
+    return kind(REGISTER_NAMES[word >> 8 & 0xF])
+
+
+def _branch(kind, conditional):
+    if conditional:
+        return lambda word: kind(CONDITIONS[word >> 10 & 3], word & 0x3FF)
+    return lambda word: kind(word & 0x3FF, None)
+
+
+SHIFT_KINDS = {code: kind for kind, code in SHIFT_CODES.items()}
+
+# One entry per 6 bit opcode, each builds the instruction from the whole word
+DECODERS = [None] * 64
+for _kind, (_val, _reg) in REG_VAL_OPCODES.items():
+    DECODERS[_val] = _reg_val(_kind, False)
+    DECODERS[_reg] = _reg_val(_kind, True)
+for _kind in (CALL, JUMP):
+    DECODERS[BRANCH_OPCODES[_kind][0]] = _branch(_kind, False)
+    DECODERS[BRANCH_OPCODES[_kind][1]] = _branch(_kind, True)
+DECODERS[SHIFT_OPCODE] = _shift
+DECODERS[BRANCH_OPCODES[RET][0]] = lambda word: RET(None)
+DECODERS[BRANCH_OPCODES[RET][1]] = lambda word: RET(CONDITIONS[word >> 10 & 3])
+DECODERS[RETI_OPCODE] = lambda word: RETI(FLAGS[word & 1])
+DECODERS[INTERRUPT_OPCODE] = lambda word: EINT() if word & 1 else DINT()
+
+
+def decode(word):
+    if word < 0 or word > WORD_MASK or DECODERS[word >> 12] is None:
+        raise ValueError('Invalid instruction word {0:05X}'.format(word))
+
+    instruction = DECODERS[word >> 12](word)
+    # bits the instruction does not use have to be clear
+    if encode(instruction) != word:
+        raise ValueError('Invalid instruction word {0:05X}'.format(word))
+    return instruction
+
+
+# Instruction words of the whole ROM, empty addresses hold 0 (LOAD s0, 00) as in KCPSM3 images
+def program_words(program):
+    return [0 if instruction is None else encode(instruction, program.labels)
+            for _, instruction in sorted(program.instructions.items())]
+
+
+def program_from_words(words):
+    if len(words) > INSTRUCTIONS_CNT:
+        raise ValueError('Image of {0} words does not fit in memory'.format(len(words)))
+    return link([decode(word) for word in words])
+
+
+def read_hex(file):
+    return [int(line, 16) for line in file.read().split()]
+
+
+def write_hex(file, words):
+    file.writelines('{0:05X}\n'.format(word) for word in words)
+
+
+# data2mem format: '@address' sets the address of the following words, '//' starts a comment
+def read_mem(file):
+    words = []
+    addr = 0
+    for line in file:
+        for token in line.split('//')[0].split():
+            if token.startswith('@'):
+                addr = int(token[1:], 16)
+                continue
+            if addr >= len(words):
+                words.extend([0] * (addr + 1 - len(words)))
+            words[addr] = int(token, 16)
+            addr += 1
+    return words
+
+
+def write_mem(file, words):
+    file.write('@00000000\n')
+    write_hex(file, words)
+
+
+READERS = {'.hex': read_hex, '.mem': read_mem}
+WRITERS = {'.hex': write_hex, '.mem': write_mem}
+
+
+def _format(filename, formats):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in formats:
+        raise ValueError('Unknown image format "{0}", expected one of: {1}'.format(
+            extension, ', '.join(sorted(formats))))
+    return formats[extension]
+
+
+def load_image(filename):
+    reader = _format(filename, READERS)
+    with open(filename) as file:
+        return program_from_words(reader(file))
+
+
+def save_image(filename, program):
+    writer = _format(filename, WRITERS)
+    with open(filename, 'w') as file:
+        writer(file, program_words(program))
@@ -4,17 +4,14 @@ from src.mnemonics import MNEMONICS, EQU, ORG, LABEL
 import re
 
 
-class Parser(object):
+# Everything parsed from a single program. The grammar (Parser) and its LALR tables
+# are shared, only the state is replaced for every program.
+class ParserState(object):
     def __init__(self):
         self._instructions = []
         self._directives = []
         self._aliases = {}
 
-    def reset_state(self):
-        self._instructions = []
-        self._directives = []
-        self._aliases = {}
-
     @property
     def instructions(self):
         return self._instructions
@@ -27,14 +24,43 @@ class Parser(object):
     def directives(self):
         return self._directives
 
+
+class Parser(object):
+    def __init__(self):
+        self._state = ParserState()
+
+    def reset_state(self):
+        self._state = ParserState()
+        return self._state
+
+    @property
+    def state(self):
+        return self._state
+
+    def set_state(self, state):
+        self._state = state
+        return state
+
+    @property
+    def instructions(self):
+        return self._state.instructions
+
+    @property
+    def aliases(self):
+        return self._state.aliases
+
+    @property
+    def directives(self):
+        return self._state.directives
+
     def _add_code(self, instruction):
-        self._instructions.append(instruction)
+        self._state.instructions.append(instruction)
 
     def _add_directive(self, directive):
-        self._directives.append(directive)
+        self._state.directives.append(directive)
 
     def _add_alias(self, key, val):
-        self._aliases[key] = val
+        self._state.aliases[key] = val
 
     def p_line(self, p):
         """line : instruction inline_comment
@@ -179,10 +205,10 @@ class Parser(object):
         regs = re.compile('(?i)s((1[0-5]|[0-9])|(?i)[a-f])')
         _, arg = p
         if not regs.match(arg):
-            if arg not in self._aliases.keys():
+            if arg not in self.aliases.keys():
                 raise ParseException('Name "{0}" not defined'.format(arg))
             else:
-                arg = self._aliases[arg]
+                arg = self.aliases[arg]
 
         p[0] = arg
 
@@ -196,7 +222,7 @@ class Parser(object):
             if arg not in self.aliases.keys():
                 raise ParseException('Name "{0}" not defined'.format(arg))
             else:
-                arg = self._aliases[arg]
+                arg = self.aliases[arg]
 
         p[0] = arg
 
@@ -277,6 +303,6 @@ class Parser(object):
     # Error rule for syntax errors
     def p_error(self, p):
         if p is not None:
-            raise ParseException('Parse error in input {0}:{1}: wrong symbol "{2}"'.format(p.lineno, p.lexpos, p.value))
+            raise ParseException('Parse error in line {0}:{1}: wrong symbol "{2}"'.format(p.lineno, p.lexpos, p.value))
         else:
             print('Unexpected end of input')
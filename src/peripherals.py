@@ -0,0 +1,46 @@
+# Devices for VirtualMachine.map_input, map_output and connect
+from collections import deque
+
+
+class Constant(object):
+    def __init__(self, value):
+        self.value = value & 0xFF
+
+    def read(self):
+        return self.value
+
+
+# Bytes (or any iterable of byte values) read one after another, then `default` forever
+class InputQueue(object):
+    def __init__(self, data=(), default=0):
+        self._data = iter(data)
+        self._default = default
+        self._pending = deque()
+
+    def push(self, data):
+        self._pending.extend(data)
+
+    def read(self):
+        if self._pending:
+            return self._pending.popleft() & 0xFF
+        value = next(self._data, None)
+        if value is None:
+            return self._default
+        return value & 0xFF
+
+
+# Collects every written value in `data`
+class Capture(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.write = self.data.append
+
+
+# Collects (simulated time in seconds, value) for every written value in `samples`
+class TimedCapture(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self.samples = []
+
+    def write(self, value):
+        self.samples.append((self._vm.time, value))
@@ -0,0 +1,151 @@
+from src.mnemonics import JUMP
+from src.program import CLOCKS_PER_INSTRUCTION, INSTRUCTIONS_CNT, OPCODES
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+Hotspot = namedtuple('Hotspot', ('addr', 'count', 'clocks', 'label', 'instruction'))
+Loop = namedtuple('Loop', ('start', 'end', 'iterations', 'clocks', 'label'))
+
+
+def _text(instruction):
+    if instruction is None:
+        return ''
+    return ' '.join([type(instruction).__name__, ', '.join(str(arg) for arg in instruction if arg is not None)])
+
+
+# Counts the executions of every address and the taken back-edges (jumps to the same or a lower
+# address). Attached as a VM instrument, so the machine runs without any overhead when it is not.
+class Profiler(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self._counts = array('Q', bytes(8 * INSTRUCTIONS_CNT))
+        self._taken = array('Q', bytes(8 * INSTRUCTIONS_CNT))  # by the address of the branch
+        self._interrupts = 0
+        vm.instrument(self)
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def interrupts(self):
+        return self._interrupts
+
+    @property
+    def instructions(self):
+        return sum(self._counts)
+
+    # taking an interrupt lasts as long as an instruction
+    @property
+    def clocks(self):
+        return (self.instructions + self._interrupts) * CLOCKS_PER_INSTRUCTION
+
+    def detach(self):
+        self._vm.uninstrument(self)
+
+    def clear(self):
+        self._counts[:] = array('Q', bytes(8 * INSTRUCTIONS_CNT))
+        self._taken[:] = array('Q', bytes(8 * INSTRUCTIONS_CNT))
+        self._interrupts = 0
+
+    def instrument_code(self, vm, code):
+        image = vm.program.image
+        return [self._wrap(vm, handler, x, y, addr, image[addr]) for addr, (handler, x, y) in enumerate(code)]
+
+    def _wrap(self, vm, handler, x, y, addr, op):
+        counts, taken = self._counts, self._taken
+
+        if op is not None and OPCODES[op.opcode] is JUMP and op.x <= addr:
+            target = op.x
+
+            def profiled(x, y):
+                handler(x, y)
+                counts[addr] += 1
+                if vm._program_cnt == target:
+                    taken[addr] += 1
+        else:
+            def profiled(x, y):
+                handler(x, y)
+                counts[addr] += 1
+
+        return profiled, x, y
+
+    def instrument_interrupt(self, vm, handler):
+        def profiled():
+            self._interrupts += 1
+            handler()
+
+        return profiled
+
+    # the label an address belongs to: the closest one at or before it
+    def _labeller(self):
+        labels = sorted((addr, label) for label, addr in self._vm.program.labels.items())
+        addrs = [addr for addr, _ in labels]
+
+        def label(addr):
+            position = bisect_right(addrs, addr)
+            return labels[position - 1][1] if position else None
+        return label
+
+    def opcode_counts(self):
+        counts = {}
+        image = self._vm.program.image
+        for addr, count in enumerate(self._counts):
+            if count:
+                name = 'NOP' if image[addr] is None else OPCODES[image[addr].opcode].__name__
+                counts[name] = counts.get(name, 0) + count
+        return counts
+
+    def label_clocks(self):
+        clocks = {}
+        labeller = self._labeller()
+        for addr, count in enumerate(self._counts):
+            if count:
+                label = labeller(addr)
+                clocks[label] = clocks.get(label, 0) + count * CLOCKS_PER_INSTRUCTION
+        return clocks
+
+    def hotspots(self, top=10):
+        instructions = self._vm.program.instructions
+        labeller = self._labeller()
+        hottest = sorted((addr for addr, count in enumerate(self._counts) if count),
+                         key=lambda addr: -self._counts[addr])[:top]
+        return [Hotspot(addr, self._counts[addr], self._counts[addr] * CLOCKS_PER_INSTRUCTION, labeller(addr),
+                        _text(instructions.get(addr))) for addr in hottest]
+
+    # Loops from the taken back-edges, the clocks are these spent in the loop's address range
+    def loops(self, top=10):
+        image = self._vm.program.image
+        labeller = self._labeller()
+        loops = []
+        for addr, iterations in enumerate(self._taken):
+            if iterations:
+                start = image[addr].x
+                clocks = sum(self._counts[start:addr + 1]) * CLOCKS_PER_INSTRUCTION
+                loops.append(Loop(start, addr, iterations, clocks, labeller(start)))
+        loops.sort(key=lambda loop: -loop.clocks)
+        return loops[:top]
+
+    def report(self, top=10):
+        total = self.clocks or 1
+        summary = '{0} instructions, {1} clocks, {2} interrupts'.format(self.instructions, self.clocks,
+                                                                        self._interrupts)
+        lines = [summary, '', 'Hottest addresses:']
+        for spot in self.hotspots(top):
+            lines.append('  {0:03X} {1:>12} {2:>12} {3:6.2f}%  {4:<16} {5}'.format(
+                spot.addr, spot.count, spot.clocks, 100.0 * spot.clocks / total, spot.label or '', spot.instruction))
+
+        lines.extend(['', 'Hot loops:'])
+        for loop in self.loops(top):
+            lines.append('  {0:03X}-{1:03X} {2:>12} iterations {3:>12} clocks {4:6.2f}%  {5}'.format(
+                loop.start, loop.end, loop.iterations, loop.clocks, 100.0 * loop.clocks / total, loop.label or ''))
+
+        lines.extend(['', 'Clocks by label:'])
+        for label, clocks in sorted(self.label_clocks().items(), key=lambda item: -item[1]):
+            lines.append('  {0:<16} {1:>12} {2:6.2f}%'.format(label or '(none)', clocks, 100.0 * clocks / total))
+
+        lines.extend(['', 'Instructions by opcode:'])
+        for name, count in sorted(self.opcode_counts().items(), key=lambda item: -item[1]):
+            lines.append('  {0:<6} {1:>12}'.format(name, count))
+        return '\n'.join(lines)
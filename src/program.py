@@ -0,0 +1,138 @@
+from src.mnemonics import *
+from collections import namedtuple
+
+""" REGISTERS """
+
+REGISTER_NAMES = tuple('S%X' % i for i in range(16))
+
+REGISTERS = {'S%d' % i: i for i in range(16)}
+REGISTERS.update({name: i for i, name in enumerate(REGISTER_NAMES)})
+
+""" OPCODES """
+
+OPCODES = (ADD, ADDC, AND, CALL, COMP, DINT, EINT, FETCH, IN, JUMP, LOAD, OR, OUT, RET, RETI,
+           RL, SL0, SL1, SLA, SLX, RR, SR0, SR1, SRA, SRX, STORE, SUB, SUBC, TEST, XOR)
+
+OPCODE_IDS = {instruction: opcode for opcode, instruction in enumerate(OPCODES)}
+
+REG_VAL_INSTRUCTIONS = (ADD, ADDC, AND, COMP, LOAD, OR, SUB, SUBC, TEST, XOR)
+RAM_INSTRUCTIONS = (FETCH, STORE)
+PORT_INSTRUCTIONS = (IN, OUT)
+REG_INSTRUCTIONS = (RL, SL0, SL1, SLA, SLX, RR, SR0, SR1, SRA, SRX)
+BRANCH_INSTRUCTIONS = (JUMP, CALL)
+CONTROL_INSTRUCTIONS = (JUMP, CALL, RET, RETI)
+
+CONTROL_OPCODES = frozenset(OPCODE_IDS[i] for i in CONTROL_INSTRUCTIONS)
+
+INSTRUCTIONS_CNT = 1024
+# every PicoBlaze instruction takes two clock cycles
+CLOCKS_PER_INSTRUCTION = 2
+RAM_SIZE = 64
+PORTS_CNT = 256
+
+# A single slot of the decoded program image. `handler` names the specialized
+# handler (e.g. ADD_reg or ADD_val, JUMP_NZ), `x` is the destination register
+# index or the branch target and `y` the source register index or the constant.
+Op = namedtuple('Op', ('opcode', 'handler', 'x', 'y'))
+
+# `lines` holds the source line of the instruction at every address (None for empty slots)
+Program = namedtuple('Program', ('image', 'labels', 'instructions', 'aliases', 'directives', 'lines'))
+Program.__new__.__defaults__ = (None,)
+
+
+def _register(instruction, address, arg):
+    if arg not in REGISTERS:
+        raise ValueError('Error in address {0}: "{1}" is not a register ({2})'.format(
+            str(address), arg, str(instruction)))
+    return REGISTERS[arg]
+
+
+def _target(address, labels, arg):
+    if type(arg) is str:
+        if arg not in labels:
+            raise KeyError('Error in address {0}: no such label "{1}"'.format(str(address), arg))
+        return labels[arg]
+    if arg < 0 or arg > INSTRUCTIONS_CNT - 1:
+        raise ValueError('Error in address {0}: no such address "{1}"'.format(str(address), arg))
+    return arg
+
+
+def decode(instruction, address, labels):
+    kind = type(instruction)
+    name = kind.__name__
+    opcode = OPCODE_IDS[kind]
+
+    if kind in REG_VAL_INSTRUCTIONS:
+        reg, reg_or_val = instruction
+        if type(reg_or_val) is str:
+            return Op(opcode, name + '_reg', _register(instruction, address, reg),
+                      _register(instruction, address, reg_or_val))
+        return Op(opcode, name + '_val', _register(instruction, address, reg), reg_or_val & 0xFF)
+
+    if kind in RAM_INSTRUCTIONS or kind in PORT_INSTRUCTIONS:
+        reg, reg_or_val = instruction
+        if type(reg_or_val) is str:
+            return Op(opcode, name + '_reg', _register(instruction, address, reg),
+                      _register(instruction, address, reg_or_val))
+        if kind in RAM_INSTRUCTIONS and (reg_or_val < 0 or reg_or_val > RAM_SIZE - 1):
+            raise ValueError('Error in address {0}: ram addres "{1}" outside memory'.format(
+                str(address), reg_or_val))
+        if kind in PORT_INSTRUCTIONS and (reg_or_val < 0 or reg_or_val > PORTS_CNT - 1):
+            raise ValueError('Error in address {0}: no such port "{1}"'.format(str(address), reg_or_val))
+        return Op(opcode, name + '_val', _register(instruction, address, reg), reg_or_val)
+
+    if kind in REG_INSTRUCTIONS:
+        return Op(opcode, name, _register(instruction, address, instruction.reg), None)
+
+    if kind in BRANCH_INSTRUCTIONS:
+        label_or_ind, label_or_addr = instruction
+        if label_or_addr is None:
+            return Op(opcode, name, _target(address, labels, label_or_ind), None)
+        return Op(opcode, name + '_' + label_or_ind, _target(address, labels, label_or_addr), None)
+
+    if kind is RET:
+        if instruction.indicator is None:
+            return Op(opcode, name, None, None)
+        return Op(opcode, name + '_' + instruction.indicator, None, None)
+
+    if kind is RETI:
+        return Op(opcode, name + '_' + instruction.flag, None, None)
+
+    return Op(opcode, name, None, None)
+
+
+# Places parsed instructions at their addresses and decodes them into a program image.
+# All label, alias and range errors are raised here, so the VM never checks them while executing.
+# With numbered=True `instructions` yields (line, instruction) pairs and the lines are kept in the Program.
+def link(instructions, aliases=None, directives=None, numbered=False):
+    placed = {addr: None for addr in range(INSTRUCTIONS_CNT)}
+    lines = [None] * INSTRUCTIONS_CNT if numbered else None
+    labels = {}
+
+    instruction_cnt = 0
+    for i in instructions:
+        if numbered:
+            line, i = i
+
+        if type(i) == ORG:
+            if instruction_cnt <= i[0]:
+                instruction_cnt = i[0]
+            else:
+                raise ValueError(str(i) + ": Trying to place code in past position")
+        elif type(i) == LABEL:
+            if i[0] not in labels:
+                labels[i[0]] = instruction_cnt
+            else:
+                raise ValueError(str(i) + ": Label already in use")
+        else:
+            if instruction_cnt > INSTRUCTIONS_CNT - 1:
+                raise ValueError(str(i) + ": Program does not fit in memory")
+            placed[instruction_cnt] = i
+            if numbered:
+                lines[instruction_cnt] = line
+            instruction_cnt += 1
+
+    image = [None if i is None else decode(i, addr, labels) for addr, i in sorted(placed.items())]
+
+    return Program(image=image, labels=labels, instructions=placed,
+                   aliases=dict(aliases or {}), directives=list(directives or []), lines=lines)
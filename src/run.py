@@ -0,0 +1,159 @@
+from src import code_coverage, image_cache
+from src.peripherals import InputQueue
+from src.program import PORTS_CNT
+from src.virtual_machine import VirtualMachine
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+import argparse
+import json
+import os
+import sys
+
+# `stimulus` maps a port to the values read from it one after another,
+# the last value stays on the port once the sequence is used up.
+Job = namedtuple('Job', ('program', 'cycles', 'stimulus', 'coverage'))
+Job.__new__.__defaults__ = (None, False)
+
+# `exit_reason` is 'cycles' when the whole budget was executed and 'error' when
+# reading, assembling or executing failed, `outputs` lists every (port, value) written.
+# `coverage` is the code_coverage bitmap of the run when the job asked for it.
+Result = namedtuple('Result', ('job', 'registers', 'ram', 'cycles', 'program_cnt', 'exit_reason', 'error',
+                               'outputs', 'coverage'))
+
+EXIT_CYCLES = 'cycles'
+EXIT_ERROR = 'error'
+
+
+# The stimulus is read and the outputs are recorded through port devices,
+# so the ports without a stimulus still take the VM's fast paths
+class JobMachine(VirtualMachine):
+    def __init__(self):
+        super(JobMachine, self).__init__()
+        self._fed = ()
+        self._outputs = []
+        for port in range(PORTS_CNT):
+            self.map_output(port, partial(self._record, port))
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    def feed(self, stimulus):
+        for port in self._fed:
+            self.unmap_port(port)
+            self.map_output(port, partial(self._record, port))
+
+        stimulus = {int(port): values for port, values in (stimulus or {}).items() if values}
+        for port, values in stimulus.items():
+            self.map_input(port, InputQueue(values, values[-1] & 0xFF))
+        self._fed = tuple(stimulus)
+        self._outputs = []
+
+    def _record(self, port, value):
+        self._output_ports[port] = value
+        self._outputs.append((port, value))
+
+
+# Every worker process keeps a single machine and the programs it already assembled
+_machine = None
+_programs = {}
+
+
+def _worker_machine():
+    global _machine
+    if _machine is None:
+        _machine = JobMachine()
+    return _machine
+
+
+def _assemble(filename):
+    key = os.path.abspath(filename), os.path.getmtime(filename)
+    if key not in _programs:
+        _programs[key] = image_cache.load(filename)
+    return _programs[key]
+
+
+def run_job(job):
+    vm = _worker_machine()
+    vm.reset()
+    vm.feed(job.stimulus)
+
+    exit_reason, error = EXIT_CYCLES, None
+    coverage = code_coverage.Coverage(vm) if job.coverage else None
+    try:
+        vm.load_program(_assemble(job.program))
+        vm.run(job.cycles)
+    except Exception as e:
+        # a failing job (a missing file too) is reported in its result, the other jobs go on
+        exit_reason, error = EXIT_ERROR, '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        if coverage is not None:
+            coverage.detach()
+
+    return Result(job=job, registers=dict(vm.registers), ram=list(vm.ram), cycles=vm.cycles,
+                  program_cnt=vm._program_cnt, exit_reason=exit_reason, error=error, outputs=list(vm.outputs),
+                  coverage=coverage and coverage.bitmap())
+
+
+# Yields a Result for every job as soon as it is done, not in the order of `jobs`
+def run_jobs(jobs, workers=None):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _load_jobs(filename):
+    jobs = []
+    with open(filename) as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                jobs.append(Job(entry['program'], entry['cycles'], entry.get('stimulus'),
+                                entry.get('coverage', False)))
+    return jobs
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Runs PicoBlaze programs in parallel and prints '
+                                                     'one JSON result per line as the jobs complete.')
+    arg_parser.add_argument('programs', nargs='*', help='.psm files to run')
+    arg_parser.add_argument('--cycles', type=int, default=1000, help='cycle budget of every program')
+    arg_parser.add_argument('--stimulus', help='JSON file with a {"port": [values]} input stimulus')
+    arg_parser.add_argument('--jobs', help='JSON lines file of {"program", "cycles", "stimulus"} jobs')
+    arg_parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    arg_parser.add_argument('--coverage', help='JSON file to write the merged coverage bitmap of every program to')
+    args = arg_parser.parse_args(argv)
+
+    stimulus = None
+    if args.stimulus:
+        with open(args.stimulus) as file:
+            stimulus = json.load(file)
+
+    jobs = [Job(program, args.cycles, stimulus) for program in args.programs]
+    if args.jobs:
+        jobs.extend(_load_jobs(args.jobs))
+    if args.coverage:
+        jobs = [job._replace(coverage=True) for job in jobs]
+
+    failed = 0
+    coverage = {}
+    for result in run_jobs(jobs, args.workers):
+        failed += result.exit_reason == EXIT_ERROR
+        record = result._asdict()
+        record['job'] = result.job._asdict()
+        if result.coverage is not None:
+            record['coverage'] = result.coverage.hex()
+            coverage[result.job.program] = code_coverage.merge(
+                coverage.get(result.job.program, code_coverage.empty()), result.coverage)
+        print(json.dumps(record))
+
+    if args.coverage:
+        with open(args.coverage, 'w') as file:
+            json.dump({program: bitmap.hex() for program, bitmap in coverage.items()}, file)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
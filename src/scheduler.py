@@ -0,0 +1,118 @@
+from heapq import heappush, heappop
+from itertools import count
+
+# deadline of a machine without pending events, later than any cycle it will reach
+NEVER = 1 << 63
+
+
+class Event(object):
+    def __init__(self, cycle, callback, period=None):
+        self.cycle = cycle
+        self.callback = callback
+        self.period = period
+        self.cancelled = False
+
+
+# Calls events at exact cycles of the machine: before the instruction of the event's cycle
+# executes. The machine compares its cycle counter against the earliest deadline only, the
+# heap of events is looked at when that deadline is reached.
+#
+# Interrupts raised by the scheduler are pulses, the line is cleared when the machine takes
+# the interrupt (or stays raised until the program enables interrupts again).
+class Scheduler(object):
+    def __init__(self, vm):
+        self._vm = vm
+        self._heap = []
+        self._order = count()
+        self._raised = False
+        self._dispatched = -1   # cycle of the last call of an event
+        vm.instrument(self)
+
+    @property
+    def deadline(self):
+        return self._heap[0][0] if self._heap else NEVER
+
+    def __len__(self):
+        return sum(not event.cancelled for _, _, event in self._heap)
+
+    def clear(self):
+        del self._heap[:]
+        self._dispatched = -1
+        self._vm._deadline = NEVER
+
+    # The events are not part of the machine state. Going back to before the last called event
+    # would need it (and what its callback did) undone, going past the next one would skip it.
+    def check_travel(self, cycle):
+        if cycle <= self._dispatched:
+            raise RuntimeError('An event was called at cycle {0}, the machine cannot go back to cycle {1}'.format(
+                self._dispatched, cycle))
+        if cycle > self.deadline:
+            raise RuntimeError('The machine cannot skip the event at cycle {0}'.format(self.deadline))
+
+    def _push(self, event):
+        heappush(self._heap, (event.cycle, next(self._order), event))
+        if event.cycle < self._vm._deadline:
+            self._vm._deadline = event.cycle
+
+    # Calls callback(vm) at the cycle
+    def at(self, cycle, callback):
+        if cycle < self._vm.cycles:
+            raise ValueError('Cycle {0} has passed already'.format(cycle))
+        event = Event(cycle, callback)
+        self._push(event)
+        return event
+
+    def after(self, delay, callback):
+        return self.at(self._vm.cycles + delay, callback)
+
+    # Calls callback(vm) every `period` cycles, first at `start` (one period from now by default)
+    def every(self, period, callback, start=None):
+        if period < 1:
+            raise ValueError('The period has to be at least one cycle')
+        event = Event(self._vm.cycles + period if start is None else start, callback, period)
+        self._push(event)
+        return event
+
+    def cancel(self, event):
+        event.cancelled = True
+
+    def interrupt(self, vm=None):
+        self._vm._interrupt_caused = True
+        self._raised = True
+
+    def interrupt_at(self, cycle):
+        return self.at(cycle, self.interrupt)
+
+    # an interrupt raised by a device, `delay` cycles from now
+    def interrupt_after(self, delay=0):
+        return self.after(delay, self.interrupt)
+
+    def timer(self, period, start=None):
+        return self.every(period, self.interrupt, start)
+
+    # Calls the events due by now, the machine does it when its deadline is reached
+    def dispatch(self):
+        vm, heap = self._vm, self._heap
+        while heap and heap[0][0] <= vm._cycles:
+            _, _, event = heappop(heap)
+            if event.cancelled:
+                continue
+            if event.period is not None:
+                # from the scheduled cycle, so a late dispatch does not make the timer drift
+                event.cycle += event.period
+                heappush(heap, (event.cycle, next(self._order), event))
+            self._dispatched = vm._cycles
+            event.callback(vm)
+        vm._deadline = self.deadline
+
+    def instrument_code(self, vm, code):
+        return code
+
+    def instrument_interrupt(self, vm, handler):
+        def acknowledged():
+            handler()
+            if self._raised:
+                self._raised = False
+                vm._interrupt_caused = False
+
+        return acknowledged
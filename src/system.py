@@ -0,0 +1,140 @@
+from collections import deque
+
+QUANTUM = 100
+
+# status port bits of a FIFO
+DATA_AVAILABLE, FULL = 1, 2
+
+
+# Bounded FIFO between an OUT port of one core and an IN port of another. Values written in a
+# quantum become readable at the next synchronization point, so the result does not depend on
+# the order the cores run in. Like a hardware FIFO it drops writes when full and reads 0 when
+# empty, the firmware is expected to poll the status port.
+class Fifo(object):
+    def __init__(self, depth=16):
+        self._depth = depth
+        self._data = deque()
+        self._pending = []
+        self._space = depth  # free entries at the last synchronization point
+        self.overflows = 0
+        self.underflows = 0
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def __len__(self):
+        return len(self._data) + len(self._pending)
+
+    # the writer only sees the reads of previous quanta
+    def write(self, value):
+        if len(self._pending) >= self._space:
+            self.overflows += 1
+            return
+        self._pending.append(value)
+
+    def read(self):
+        if not self._data:
+            self.underflows += 1
+            return 0
+        return self._data.popleft()
+
+    # each side only sees its own flag, which does not change with what the other side does
+    def read_status(self):
+        return DATA_AVAILABLE if self._data else 0
+
+    def write_status(self):
+        return FULL if len(self._pending) >= self._space else 0
+
+    def commit(self):
+        self._data.extend(self._pending)
+        del self._pending[:]
+        self._space = self._depth - len(self._data)
+
+
+# A port shared between cores, the last value written in a quantum is read from the next one on
+class Latch(object):
+    def __init__(self, value=0):
+        self.value = value
+        self._pending = None
+
+    def write(self, value):
+        self._pending = value
+
+    def read(self):
+        return self.value
+
+    def commit(self):
+        if self._pending is not None:
+            self.value, self._pending = self._pending, None
+
+
+# Several cores running in lock step: every core executes `quantum` cycles in the order they were
+# added, then the FIFOs and latches between them are synchronized. Each core runs through its
+# own engine between the synchronization points (vm.run by default, e.g. BlockEngine).
+class System(object):
+    def __init__(self, quantum=QUANTUM):
+        if quantum < 1:
+            raise ValueError('The quantum has to be at least one cycle')
+        self._quantum = quantum
+        self._cores = []
+        self._runners = []
+        self._links = []
+        self._cycles = 0
+
+    @property
+    def cores(self):
+        return list(self._cores)
+
+    @property
+    def cycles(self):
+        return self._cycles
+
+    @property
+    def quantum(self):
+        return self._quantum
+
+    # `engine` is called with the machine and returns an object with run(cycles)
+    def add(self, vm, engine=None):
+        if vm in self._cores:
+            raise ValueError('The machine is a core of this system already')
+        self._cores.append(vm)
+        self._runners.append(vm.run if engine is None else engine(vm).run)
+        return vm
+
+    def _core(self, vm):
+        if vm not in self._cores:
+            raise ValueError('The machine is not a core of this system')
+        return vm
+
+    # Connects OUT `out_port` of `source` to IN `in_port` of `target` through a new FIFO, the
+    # status ports (if given) read its FULL bit on the source and DATA_AVAILABLE on the target
+    def connect(self, source, out_port, target, in_port, depth=16, source_status=None, target_status=None):
+        fifo = Fifo(depth)
+        self._core(source).map_output(out_port, fifo)
+        self._core(target).map_input(in_port, fifo)
+        if source_status is not None:
+            source.map_input(source_status, fifo.write_status)
+        if target_status is not None:
+            target.map_input(target_status, fifo.read_status)
+        self._links.append(fifo)
+        return fifo
+
+    # Shares OUT `out_port` of `source` as an IN port of other cores, `targets` maps core to port
+    def share(self, source, out_port, targets):
+        latch = Latch()
+        self._core(source).map_output(out_port, latch)
+        for target, in_port in targets.items():
+            self._core(target).map_input(in_port, latch)
+        self._links.append(latch)
+        return latch
+
+    def run(self, cycles):
+        end = self._cycles + cycles
+        while self._cycles < end:
+            amount = min(self._quantum, end - self._cycles)
+            for run in self._runners:
+                run(amount)
+            for link in self._links:
+                link.commit()
+            self._cycles += amount
@@ -0,0 +1,24 @@
+from src import alu
+
+
+def test_add_sub():
+    assert alu.ADD[200 << 9 | 100 << 1] == (44, 1, 0)
+    assert alu.ADD[255 << 9 | 0 << 1 | 1] == (0, 1, 1)
+    assert alu.SUB[5 << 9 | 5 << 1] == (0, 0, 1)
+    assert alu.SUB[5 << 9 | 5 << 1 | 1] == (255, 1, 0)
+
+
+def test_parity():
+    assert alu.PARITY[0b1011] == 1
+    assert alu.TEST[0b1001] == (0, 0)
+    assert alu.TEST[0] == (0, 1)
+
+
+def test_shifts():
+    assert alu.SLA[0b10000001 << 1 | 1] == (0b00000011, 1, 0)
+    assert alu.SRA[0b10000000 << 1 | 1] == (0b11000000, 0, 0)
+    assert alu.RL[0b10000001 << 1] == (0b00000011, 1, 0)
+    assert alu.RR[0b00000001 << 1] == (0b10000000, 1, 0)
+    assert alu.SLX[0b00000001 << 1] == (0b00000011, 0, 0)
+    assert alu.SRX[0b10000000 << 1] == (0b11000000, 0, 0)
+    assert alu.SR0[1 << 1] == (0, 1, 1)
@@ -0,0 +1,133 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import pytest
+from src import assembler
+from src.errors import ParseException, TokenizeException
+from src.fast_tokenizer import FastLexer
+from src.mnemonics import *
+from src.virtual_machine import VirtualMachine
+
+
+def test_frontend_is_shared():
+    assert assembler.frontend() == assembler.frontend()
+
+    vm1, vm2 = VirtualMachine(), VirtualMachine()
+    assert vm1.program is vm2.program
+
+
+def test_assemble():
+    program = assembler.assemble(['x EQU 5', 'start: LOAD s0, x', 'JUMP start'])
+    assert program.labels == {'start': 0}
+    assert program.aliases == {'x': 5}
+    assert program.instructions[0] == LOAD('S0', 5)
+
+    # nothing is carried over to the next program
+    program = assembler.assemble(['ADD s1, 1'])
+    assert program.labels == {}
+    assert program.instructions[0] == ADD('S1', 1)
+
+
+def test_table_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv('PICOBLAZE_CACHE_DIR', str(tmpdir))
+
+    _, lalr = assembler._build()
+    lexer = assembler._ply_lexer()
+    directory, = tmpdir.listdir()
+    assert sorted(os.listdir(str(directory))) == [assembler.PARSETAB, assembler.LEXTAB + '.py']
+
+    # the second build only reads the tables
+    _, cached_lalr = assembler._build()
+    cached_lexer = assembler._ply_lexer()
+    assert cached_lexer.lexre[0][0].pattern == lexer.lexre[0][0].pattern
+    assert cached_lalr.action == lalr.action
+
+
+def test_broken_table_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv('PICOBLAZE_CACHE_DIR', str(tmpdir))
+    directory = tmpdir.mkdir(assembler._grammar_key())
+    # what a reader sees while another process is still writing the tables
+    directory.join(assembler.PARSETAB).write_binary(b'\x80\x04\x95')
+    directory.join(assembler.LEXTAB + '.py').write('_tabversion = ')
+
+    _, lalr = assembler._build()
+    lexer = assembler._ply_lexer()
+    lexer.input('LOAD s0, 1')
+    assert [token.type for token in lexer] == ['LOAD', 'REGISTER', 'COMMA', 'NUMBER']
+
+    # the broken tables were replaced
+    _, cached_lalr = assembler._build()
+    assert cached_lalr.action == lalr.action
+    assert assembler._ply_lexer().lexre[0][0].pattern == lexer.lexre[0][0].pattern
+    assert sorted(os.listdir(str(directory))) == [assembler.PARSETAB, assembler.LEXTAB + '.py']
+
+
+def _build_tables(directory):
+    os.environ['PICOBLAZE_CACHE_DIR'] = directory
+    assembler._build()
+    assembler._ply_lexer()
+    return True
+
+
+def test_concurrent_table_builds(tmpdir):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(8, mp_context=context) as executor:
+        assert list(executor.map(_build_tables, [str(tmpdir)] * 8)) == [True] * 8
+
+
+def test_stream():
+    source = iter(['; generated table',
+                   'ORG 3',
+                   'table: LOAD s0, 1',
+                   '',
+                   'ADD s0, 2',
+                   'done:'])
+    instructions = assembler.stream(source)
+
+    assert next(instructions) == (2, ORG(3))
+    assert next(instructions) == (3, LABEL('table'))
+    assert next(instructions) == (3, LOAD('S0', 1))
+    assert list(instructions) == [(5, ADD('S0', 2)), (6, LABEL('done'))]
+
+
+def test_line_map(tmpdir):
+    path = tmpdir.join('lines.psm')
+    path.write('x EQU 1\n'
+               '\n'
+               'start: LOAD s0, x\n'
+               'ORG 10\n'
+               '    ADD s0, 1 ; comment\n'
+               '    JUMP start\n')
+
+    program = assembler.assemble_file(str(path))
+    assert program.lines[:2] == [3, None]
+    assert program.lines[10:12] == [5, 6]
+    assert program.lines.count(None) == 1024 - 3
+
+
+def test_error_lines():
+    with pytest.raises(ParseException) as e:
+        assembler.assemble(['LOAD s0, 1', '', 'ADD s0, s1, s2'])
+    assert 'line 3:' in str(e.value)
+
+    with pytest.raises(TokenizeException) as e:
+        assembler.assemble(['LOAD s0, 1', 'LOAD s0, #1'])
+    assert 'line 2' in str(e.value)
+
+
+@pytest.mark.parametrize('tokenizer', assembler.TOKENIZERS)
+def test_tokenizers(tokenizer, monkeypatch):
+    monkeypatch.setattr(assembler, '_tokenizer', tokenizer)
+    program = assembler.assemble(['x EQU $10', 'start: LOAD s0, x', 'SUB s0, sA ; comment', 'JUMP NZ, start'])
+    assert program.instructions[1] == SUB('S0', 'SA')
+    assert program.instructions[2] == JUMP('NZ', 'start')
+
+    with pytest.raises(ValueError):
+        assembler.use_tokenizer('regex')
+
+
+def test_use_tokenizer(monkeypatch):
+    monkeypatch.setattr(assembler, '_tokenizer', 'ply')
+    assert type(assembler.lexer()) is not FastLexer
+    assembler.use_tokenizer('fast')
+    assert type(assembler.lexer()) is FastLexer
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from src.async_driver import AsyncInput, AsyncOutput, WouldBlock, run_async
+from src.virtual_machine import VirtualMachine
+
+ECHO = ['loop: IN s0, 1',
+        'ADD s0, 1',
+        'OUT s0, 2',
+        'JUMP loop']
+
+
+def machine(program, data=()):
+    vm = VirtualMachine()
+    vm.load_program(program)
+    device, output = AsyncInput(data), AsyncOutput()
+    vm.map_input(1, device)
+    vm.map_output(2, output)
+    return vm, device, output
+
+
+def test_would_block(create_and_parse):
+    vm = create_and_parse(ECHO)
+    device = AsyncInput([7])
+    vm.map_input(1, device)
+    vm.step_many(4)
+    with pytest.raises(WouldBlock):
+        vm.step_over()
+    assert (vm.cycles, vm._program_cnt) == (4, 0)
+    device.push(b'\x09')
+    vm.step_many(3)
+    assert vm.output_ports[2] == vm.registers['S0'] == 10
+
+
+def test_many_machines(assemble):
+    program = assemble(ECHO)
+
+    async def session(index):
+        vm, device, output = machine(program)
+        task = asyncio.ensure_future(run_async(vm, quantum=50, max_cycles=4 * 3))
+        answers = []
+        for value in (index, index + 1, index + 2):
+            await asyncio.sleep(0)
+            device.push([value & 0xFF])
+            answers.append(await output.get())
+        assert await task == 12
+        return answers
+
+    async def main():
+        return await asyncio.gather(*(session(index) for index in range(300)))
+
+    results = asyncio.run(main())
+    assert results == [[(i + 1) & 0xFF, (i + 2) & 0xFF, (i + 3) & 0xFF] for i in range(300)]
+
+
+def test_pump(assemble):
+    program = assemble(ECHO)
+
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'abc')
+        reader.feed_eof()
+        vm, device, output = machine(program)
+        await device.pump(reader)
+        assert await run_async(vm, max_cycles=12) == 12
+        return bytes(output.get_nowait() for _ in range(3))
+
+    assert asyncio.run(main()) == b'bcd'
@@ -0,0 +1,48 @@
+import numpy as np
+from src.batch_vm import BatchVirtualMachine
+from src.test_block_compiler import PROGRAM
+
+
+def test_lockstep_same_as_vm(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    batch = BatchVirtualMachine(vm.program, 3)
+    vm.step_many(300)
+    batch.step_many(300)
+    for lane in range(3):
+        assert list(batch.registers[lane]) == list(vm.registers.values())
+        assert list(batch.ram[lane]) == list(vm.ram)
+        assert batch.program_cnt[lane] == vm._program_cnt
+        assert (batch.carry[lane], batch.zero[lane]) == (vm._carry, vm._zero)
+    assert list(batch.cycles) == [300] * 3
+
+
+def test_diverged_lanes(create_and_parse):
+    vm = create_and_parse(['IN s0, 1',
+                           'LOAD s1, 0',
+                           'loop: ADD s1, 3',
+                           'SUB s0, 1',
+                           'JUMP NZ, loop',
+                           'CALL save',
+                           'done: JUMP done',
+                           'save: OUT s1, 2',
+                           'RET'])
+    batch = BatchVirtualMachine(vm.program, 4)
+    batch.input_ports[:, 1] = [1, 2, 5, 9]
+    batch.step_many(40)
+    assert list(batch.output_ports[:, 2]) == [3, 6, 15, 27]
+    assert list(batch.program_cnt) == [6] * 4
+    assert np.all(batch.stack_ptr == 0)
+
+
+def test_lane_polling_at_low_address(create_and_parse):
+    vm = create_and_parse(['start: IN s0, 1',
+                           'COMP s0, 0',
+                           'JUMP Z, start',
+                           'LOAD s1, 7',
+                           'done: JUMP done'])
+    batch = BatchVirtualMachine(vm.program, 2)
+    batch.input_ports[:, 1] = [0, 1]
+    batch.step_many(1000)
+    assert list(batch.cycles) == [1000, 1000]
+    assert list(batch.registers[:, 1]) == [0, 7]
+    assert list(batch.program_cnt) == [1000 % 3, 4]
@@ -0,0 +1,99 @@
+import pytest
+from src.block_compiler import BlockEngine
+
+PROGRAM = ['LOAD s0, 0',
+           'LOAD s1, 0',
+           'loop: ADD s0, 7',
+           'XOR s1, s0',
+           'SLA s1',
+           'TEST s1, $55',
+           'RR s2',
+           'COMP s0, 100',
+           'CALL C, update',
+           'STORE s0, 3',
+           'FETCH s3, 3',
+           'JUMP loop',
+           'update: SUBC s4, s0',
+           'SRX s4',
+           'RET NZ',
+           'RET']
+
+
+def state(vm):
+    return list(vm.registers.values()), vm._carry, vm._zero, vm._program_cnt, list(vm._stack), list(vm.ram)
+
+
+@pytest.mark.parametrize('amount', [1, 2, 7, 12, 13, 100, 1001])
+def test_same_as_interpreter(create_and_parse, amount):
+    vm1 = create_and_parse(PROGRAM)
+    vm2 = create_and_parse(PROGRAM)
+    vm1.step_many(amount)
+    BlockEngine(vm2).run(amount)
+    assert state(vm1) == state(vm2)
+
+
+def test_blocks_cached_by_start(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    engine = BlockEngine(vm)
+    engine.run(50)
+    assert sorted(engine.blocks) == [0, 2, 9, 12]
+    assert engine.blocks[2][1] == 7
+
+    vm.load_program(create_and_parse(['LOAD s0, 1', 'JUMP 0']).program)
+    vm._program_cnt = 0
+    engine.run(1)
+    assert sorted(engine.blocks) == [0]
+
+
+def test_interrupt_single_steps(create_and_parse):
+    vm = create_and_parse(['EINT', 'LOAD s0, 1', 'LOAD s1, 2', 'ORG $3FF', 'RETI DISABLE'])
+    vm.toggle_interrupt(True)
+    BlockEngine(vm).run(2)
+    assert vm._program_cnt == 1023
+    assert vm._stack == [1]
+    vm.toggle_interrupt(False)
+    BlockEngine(vm).run(3)
+    assert vm.registers['S1'] == 2
+    assert vm._interrupt_enabled is False
+
+
+def test_interrupt_while_disabled(create_and_parse):
+    orders = ['DINT',
+              'loop: ADD s0, 1',
+              'ADD s1, 2',
+              'COMP s0, 50',
+              'JUMP NZ, loop',
+              'EINT',
+              'ADD s2, 1',
+              'ADD s2, 1',
+              'done: JUMP done',
+              'ORG $3FF',
+              'RETI DISABLE']
+    vm1, vm2 = create_and_parse(orders), create_and_parse(orders)
+    for vm in (vm1, vm2):
+        vm.toggle_interrupt(True)
+    vm1.step_many(300)
+    engine = BlockEngine(vm2)
+    engine.run(300)
+
+    # the pending interrupt waits for EINT, the loop still runs as a block
+    assert 1 in engine.blocks
+    assert state(vm1) == state(vm2)
+    assert vm2.registers['S2'] == 2
+    assert vm2._interrupt_enabled is False
+    assert vm2.cycles == 300
+
+
+def test_out_of_memory(create_and_parse):
+    vm = create_and_parse(['ORG $3FE', 'LOAD s0, 1'])
+    with pytest.raises(RuntimeError):
+        BlockEngine(vm).run(2000)
+
+
+@pytest.mark.parametrize('source', [['LOAD s0, 1', 'RET'], ['COMP s0, 0', 'RET Z'], ['RETI ENABLE']])
+def test_stack_underflow(create_and_parse, source):
+    for run in (lambda vm: vm.run(10), lambda vm: BlockEngine(vm).run(10)):
+        vm = create_and_parse(source)
+        with pytest.raises(RuntimeError) as e:
+            run(vm)
+        assert str(e.value) == 'Error in address {0}: stack underflow'.format(len(source) - 1)
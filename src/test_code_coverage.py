@@ -0,0 +1,87 @@
+from src import code_coverage
+from src.code_coverage import Coverage, EXECUTED, TAKEN, NOT_TAKEN, covered
+from src.run import Job, run_job, run_jobs
+
+BRANCHES = ['IN s0, 1',
+            'COMP s0, 5',
+            'JUMP C, small',
+            'CALL NZ, big',
+            'done: JUMP done',
+            'small: LOAD s1, 1',
+            'JUMP done',
+            'big: LOAD s1, 2',
+            'RET']
+
+
+def test_collect_and_merge(create_and_parse):
+    vm = create_and_parse(BRANCHES)
+    coverage = Coverage(vm)
+    vm.input_ports[1] = 9
+    vm.step_many(8)
+    first = coverage.bitmap()
+    assert len(first) == code_coverage.BITMAP_BYTES
+    assert [covered(first, EXECUTED, addr) for addr in range(9)] == [1, 1, 1, 1, 1, 0, 0, 1, 1]
+    assert (covered(first, TAKEN, 2), covered(first, NOT_TAKEN, 2)) == (False, True)
+    assert (covered(first, TAKEN, 3), covered(first, NOT_TAKEN, 3)) == (True, False)
+
+    vm.reset()
+    coverage.clear()
+    vm.input_ports[1] = 1
+    vm.step_many(8)
+    second = coverage.bitmap()
+
+    merged = code_coverage.merge(first, second)
+    assert [covered(merged, EXECUTED, addr) for addr in range(9)] == [1] * 9
+    assert covered(merged, TAKEN, 2) and covered(merged, NOT_TAKEN, 2)
+    assert covered(merged, TAKEN, 3) and not covered(merged, NOT_TAKEN, 3)
+
+    coverage.clear()
+    coverage.update(merged)
+    assert coverage.bitmap() == merged
+    coverage.detach()
+    vm.step_over()
+    assert coverage.bitmap() == merged
+
+
+def test_branch_to_next(create_and_parse):
+    vm = create_and_parse(['COMP s0, 0',
+                           'JUMP NZ, next',
+                           'next: JUMP Z, last',
+                           'last: JUMP C, last'])
+    coverage = Coverage(vm)
+    vm.step_many(4)
+    bitmap = coverage.bitmap()
+    assert [covered(bitmap, TAKEN, addr) for addr in (1, 2, 3)] == [False, True, False]
+    assert [covered(bitmap, NOT_TAKEN, addr) for addr in (1, 2, 3)] == [True, False, True]
+
+    coverage.clear()
+    coverage.update(bitmap)
+    assert coverage.bitmap() == bitmap
+    assert coverage._sets[NOT_TAKEN][:4] == bytearray([0, 1, 0, 1])
+
+
+def test_reports(create_and_parse):
+    vm = create_and_parse(BRANCHES)
+    coverage = Coverage(vm)
+    vm.input_ports[1] = 9
+    vm.step_many(8)
+    bitmap = coverage.bitmap()
+
+    assert code_coverage.summary(vm.program, bitmap) == ((7, 9), (2, 4))
+    summary = code_coverage.label_summary(vm.program, bitmap)
+    assert summary['small'] == ((0, 2), (0, 0))
+    assert summary['big'] == ((2, 2), (0, 0))
+
+    lines = code_coverage.annotate(vm.program, bitmap, [order + '\n' for order in BRANCHES])
+    assert [line.split()[0] for line in lines] == ['+', '+', '-N', 'T-', '+', '#####', '#####', '+', '+']
+    assert lines[5].endswith('6: small: LOAD s1, 1')
+
+
+def test_parallel_runs(write_program):
+    program = write_program('branches.psm', BRANCHES)
+    assert run_job(Job(program, 8, {1: [9]})).coverage is None
+
+    results = list(run_jobs([Job(program, 8, {1: [value]}, coverage=True) for value in (1, 5, 9)], workers=2))
+    merged = code_coverage.merge(*(result.coverage for result in results))
+    assert all(covered(merged, EXECUTED, addr) for addr in range(9))
+    assert covered(merged, TAKEN, 3) and covered(merged, NOT_TAKEN, 3)
@@ -0,0 +1,106 @@
+import pytest
+from src.block_compiler import BlockEngine
+from src.idle import loop_ports
+from src.peripherals import Constant
+
+TIMER = ['EINT',
+         'idle: JUMP idle',
+         'ORG $3F0',
+         'isr: ADD s1, 1',
+         'OUT s1, 5',
+         'RETI ENABLE',
+         'ORG $3FF',
+         'JUMP isr']
+
+POLL = ['LOAD s2, 7',
+        'poll: IN s0, 1',
+        'AND s0, $0F',
+        'COMP s0, 0',
+        'JUMP Z, poll',
+        'OUT s0, 2',
+        'wait: SUB s2, 1',
+        'JUMP NZ, wait',
+        'done: JUMP done']
+
+
+def _run(vm, cycles, engine):
+    if engine:
+        BlockEngine(vm).run(cycles)
+    else:
+        vm.run(cycles)
+
+
+def _press(vm):
+    vm.input_ports[1] = 0x23
+
+
+def test_loop_ports(create_and_parse):
+    image = create_and_parse(POLL).program.image
+    assert loop_ports(image, 1, 4) == (1,)
+    assert loop_ports(image, 6, 7) == ()
+    assert loop_ports(image, 1, 5) is None
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_idle_loop(create_and_parse, engine):
+    plain, fast = create_and_parse(TIMER), create_and_parse(TIMER)
+    for vm in (plain, fast):
+        vm.scheduler.timer(10000)
+    skipper = fast.enable_fast_forward()
+
+    _run(plain, 100000, engine)
+    _run(fast, 100000, engine)
+
+    assert fast.snapshot() == plain.snapshot()
+    assert fast.cycles == 100000
+    assert fast.output_ports[5] == 9
+    assert skipper.skipped > 90000
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_poll_loop(create_and_parse, engine):
+    plain, fast = create_and_parse(POLL), create_and_parse(POLL)
+    for vm in (plain, fast):
+        vm.scheduler.at(5001, _press)
+    skipper = fast.enable_fast_forward()
+
+    _run(plain, 6000, engine)
+    _run(fast, 6000, engine)
+
+    assert fast.snapshot() == plain.snapshot()
+    assert fast.output_ports[2] == 3
+    assert fast._program_cnt == fast._labels['done']
+    assert skipper.skipped > 4900
+
+
+def test_budget_ends_in_loop(create_and_parse):
+    vm = create_and_parse(POLL)
+    vm.enable_fast_forward()
+    for cycles in (3, 500, 1):
+        vm.run(cycles)
+    assert vm.cycles == 504
+
+    plain = create_and_parse(POLL)
+    plain.run(504)
+    assert vm.snapshot() == plain.snapshot()
+
+
+def test_not_skipped(create_and_parse):
+    vm = create_and_parse(POLL)
+    skipper = vm.enable_fast_forward()
+
+    # a device may change what it returns at any time
+    vm.map_input(1, Constant(0))
+    vm.run(1000)
+    assert skipper.skipped == 0
+
+    # without a budget (or with breakpoints) the run is executed step by step
+    vm.unmap_port(1)
+    vm.run(1000, breakpoints=['done'])
+    vm.scheduler.at(vm.cycles + 1000, _press)
+    vm.run(until_pc='done')
+    assert skipper.skipped == 0
+    assert vm._program_cnt == vm._labels['done']
+
+    vm.disable_fast_forward()
+    assert vm._code[4][0].__name__ == '_handle_JUMP_Z'
@@ -0,0 +1,86 @@
+import os
+import pickle
+import time
+from src import image_cache
+from src.image_cache import ImageCache, STALE_TEMPORARY
+
+
+def test_load(tmpdir, monkeypatch, write_program):
+    cache = ImageCache(str(tmpdir.join('images')))
+    program = write_program('a.psm', ['x EQU 3', 'start: LOAD s0, x', 'JUMP start'])
+
+    first = cache.load(program)
+    assert len(cache.entries()) == 1
+
+    # a hit never reaches the parser
+    monkeypatch.setattr(image_cache.assembler, 'assemble', None)
+    second = cache.load(program)
+    assert second == first
+    assert second.labels == {'start': 0}
+    assert second.aliases == {'x': 3}
+
+
+def test_key(tmpdir, monkeypatch):
+    cache = ImageCache(str(tmpdir))
+    assert cache.key(b'LOAD s0, 1') == cache.key(b'LOAD s0, 1')
+    assert cache.key(b'LOAD s0, 1') != cache.key(b'LOAD s0, 2')
+
+    key = cache.key(b'LOAD s0, 1')
+    monkeypatch.setattr(image_cache.assembler, 'ASSEMBLER_VERSION', 'next')
+    monkeypatch.setattr(image_cache.assembler, '_version', None)
+    assert cache.key(b'LOAD s0, 1') != key
+
+
+def test_broken_entry(tmpdir, write_program):
+    cache = ImageCache(str(tmpdir.join('images')))
+    program = write_program('a.psm', ['LOAD s0, 1'])
+    cache.load(program)
+
+    _, _, path = cache.entries()[0]
+    # garbage, a pickle of an unknown protocol, and not a program
+    for data in (b'garbage', b'\x80\x09.', pickle.dumps({'image': []})):
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        assert cache.load(program).instructions[0] is not None
+        assert len(cache.entries()) == 1
+        with open(path, 'rb') as file:
+            assert file.read() != data
+
+
+def test_temporary_files(tmpdir):
+    cache = ImageCache(str(tmpdir))
+    fresh, stale = tmpdir.join('fresh.tmp'), tmpdir.join('stale.tmp')
+    fresh.write('x' * 10)
+    stale.write('x' * 20)
+    age = time.time() - STALE_TEMPORARY - 1
+    os.utime(str(stale), (age, age))
+    assert cache.size() == 30
+    assert cache.entries() == []
+
+    # only the ones left by crashed writers go
+    cache.evict()
+    assert cache.size() == 10
+    cache.clear()
+    assert tmpdir.listdir() == []
+
+
+def test_lru_eviction(tmpdir, write_program):
+    cache = ImageCache(str(tmpdir.join('images')))
+    programs = [write_program('{0}.psm'.format(i), ['LOAD s0, {0}'.format(i)]) for i in range(3)]
+    keys = []
+    for i, program in enumerate(programs):
+        cache.load(program)
+        with open(program, 'rb') as file:
+            keys.append(cache.key(file.read()))
+        age = time.time() - 100 + i
+        os.utime(cache._path(keys[-1]), (age, age))
+    assert len(cache.entries()) == 3
+
+    # reading the oldest entry makes it the most recently used one
+    cache.get(keys[0])
+    cache._max_size = cache.size() * 2 // 3 + 1
+    cache.evict()
+
+    remaining = sorted(path for _, _, path in cache.entries())
+    assert remaining == sorted([cache._path(keys[0]), cache._path(keys[2])])
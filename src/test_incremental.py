@@ -0,0 +1,108 @@
+import pytest
+from src.errors import ParseException
+from src.incremental import IncrementalAssembler
+from src.mnemonics import DSIN, EQU
+from src.peripherals import Constant
+from src.virtual_machine import VirtualMachine
+
+SOURCE = ['x EQU 3',
+          'start: LOAD s0, x',
+          'loop: ADD s0, 1',
+          'JUMP NZ, loop',
+          'ORG 10',
+          'done: JUMP done']
+
+
+def test_same_as_assemble(assemble):
+    incremental = IncrementalAssembler(SOURCE)
+    assert incremental.program == assemble(SOURCE)
+    assert incremental.errors == {}
+
+
+def test_update_moves_labels(assemble):
+    lines = list(SOURCE)
+    incremental = IncrementalAssembler(lines)
+
+    lines[1] = 'start: LOAD s0, x ; comment'
+    incremental.update(2, lines[1])
+    assert incremental.program == assemble(lines)
+
+    # inserting an instruction moves `loop`, the branch to it is decoded again
+    lines[1] = 'start: LOAD s1, 2'
+    incremental.update(2, 'start: LOAD s1, 2')
+    lines.insert(2, 'LOAD s0, x')
+    incremental.insert(3, 'LOAD s0, x')
+    assert incremental.labels == {'start': 0, 'loop': 2, 'done': 10}
+    assert incremental.image[3].x == 2
+    assert incremental.program == assemble(lines)
+
+
+def test_insert_and_delete(assemble):
+    lines = list(SOURCE)
+    incremental = IncrementalAssembler(lines)
+
+    lines.insert(0, 'y EQU 1')
+    incremental.insert(1, 'y EQU 1')
+    lines.insert(3, 'ADD s0, y')
+    incremental.insert(4, 'ADD s0, y')
+    lines.append('RET')
+    incremental.insert(len(lines), 'RET')
+    assert incremental.lines == lines
+    assert incremental.program == assemble(lines)
+
+    del lines[2]
+    incremental.delete(3)
+    assert incremental.labels == {'loop': 1, 'done': 10}
+    assert incremental.program == assemble(lines)
+
+    # the line defining `y` goes, the line using it fails
+    del lines[0]
+    incremental.delete(1)
+    assert sorted(incremental.errors) == [2]
+    incremental.update(2, 'ADD s0, 1')
+    lines[1] = 'ADD s0, 1'
+    assert incremental.program == assemble(lines)
+
+    with pytest.raises(IndexError):
+        incremental.delete(len(lines) + 1)
+
+
+def test_directives(assemble):
+    lines = SOURCE + ['uart DSIN 3', 'IN s0, uart']
+    program = IncrementalAssembler(lines).program
+    assert program.directives[1] == DSIN('uart', 3)
+    assert [type(directive) for directive in program.directives] == [EQU, DSIN]
+
+    vm = VirtualMachine()
+    vm.load_program(program)
+    assert vm.connect('uart', Constant(9)) == 3
+    vm._program_cnt = 11
+    vm.step_over()
+    assert vm.registers['S0'] == 9
+
+
+def test_update_alias(assemble):
+    lines = list(SOURCE)
+    incremental = IncrementalAssembler(lines)
+
+    lines[0] = 'x EQU 7'
+    incremental.update(1, lines[0])
+    assert incremental.aliases == {'x': 7}
+    assert incremental.image[0].y == 7
+    assert incremental.program == assemble(lines)
+
+
+def test_errors(assemble):
+    lines = list(SOURCE)
+    incremental = IncrementalAssembler(lines)
+
+    incremental.update(4, 'JUMP NZ, nowhere')
+    incremental.update(2, 'start: LOAD s0, undefined')
+    assert sorted(incremental.errors) == [2, 4]
+    with pytest.raises(ParseException):
+        incremental.program
+
+    incremental.update(2, SOURCE[1])
+    incremental.update(7, 'nowhere: RET')
+    assert incremental.errors == {}
+    assert incremental.program == assemble(SOURCE[:3] + ['JUMP NZ, nowhere'] + SOURCE[4:] + ['nowhere: RET'])
@@ -0,0 +1,179 @@
+import pytest
+from src.block_compiler import BlockEngine
+from src.test_block_compiler import PROGRAM, state
+
+INTERRUPTS = ['EINT',
+              'loop: ADD s0, 1',
+              'OUT s0, 4',
+              'STORE s0, 5',
+              'JUMP loop',
+              'ORG $3FF',
+              'RETI ENABLE']
+
+
+def test_step_back_each_step(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    vm.enable_journal(capacity=64, checkpoint_interval=8)
+    snapshots = []
+    for _ in range(50):
+        snapshots.append(vm.snapshot())
+        vm.step_over()
+
+    for snapshot in reversed(snapshots):
+        vm.step_back()
+        assert vm.snapshot() == snapshot
+
+
+@pytest.mark.parametrize('amount', [1, 7, 8, 9, 30, 63])
+def test_step_back_across_checkpoints(create_and_parse, amount):
+    vm = create_and_parse(PROGRAM)
+    vm.enable_journal(capacity=64, checkpoint_interval=8)
+    vm.step_many(200 - amount)
+    expected = vm.snapshot()
+    vm.step_many(amount)
+    vm.step_back(amount)
+    assert vm.snapshot() == expected
+
+
+def test_interrupts_and_ports(create_and_parse):
+    vm = create_and_parse(INTERRUPTS)
+    vm.enable_journal(checkpoint_interval=4)
+    vm.step_many(3)
+    expected = vm.snapshot()
+    vm.toggle_interrupt(True)
+    vm.step_many(2)
+    vm.toggle_interrupt(False)
+    vm.step_many(10)
+    assert vm.output_ports[4] > 1
+
+    vm.step_back(12)
+    vm.toggle_interrupt(False)
+    assert vm.snapshot() == expected
+
+
+def test_bounded(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    journal = vm.enable_journal(capacity=32, checkpoint_interval=8)
+    vm.step_many(1000)
+    assert len(journal) == 32
+    with pytest.raises(ValueError):
+        vm.step_back(33)
+    vm.step_back(len(journal))
+    assert vm.cycles == journal.earliest
+
+
+def test_run_back_to(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    vm.enable_journal(checkpoint_interval=16)
+    vm.step_many(100)
+    steps = vm.run_back_to('update')
+    assert vm._program_cnt == vm.program.labels['update']
+    assert vm.cycles == 100 - steps
+    assert vm.run_back_to(1) == 100 - steps - 1
+    assert vm.cycles == 1
+    assert vm.run_back_to(1000) is None
+
+
+def test_block_engine(create_and_parse):
+    vm1 = create_and_parse(PROGRAM)
+    vm2 = create_and_parse(PROGRAM)
+    vm1.step_many(300)
+    expected = state(vm1)
+    vm1.step_many(200)
+
+    vm2.enable_journal(capacity=256, checkpoint_interval=16)
+    BlockEngine(vm2).run(500)
+    assert state(vm2) == state(vm1)
+    vm2.step_back(200)
+    assert state(vm2) == expected and vm2.cycles == 300
+
+
+def test_out_of_sync(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    with pytest.raises(RuntimeError):
+        vm.step_back()
+    vm.enable_journal()
+    vm.step_many(10)
+    vm._cycles += 1
+    with pytest.raises(RuntimeError):
+        vm.step_back()
+    vm.reset()
+    vm.step_many(3)
+    vm.step_back(3)
+    assert vm.cycles == 0
+
+
+TIMER = ['EINT',
+         'loop: ADD s0, 1',
+         'JUMP loop',
+         'ORG $3F0',
+         'isr: ADD s1, 1',
+         'RETI ENABLE',
+         'ORG $3FF',
+         'JUMP isr']
+
+LATE_INTERRUPT = ['LOAD s2, 20',
+                  'wait: SUB s2, 1',
+                  'JUMP NZ, wait',
+                  'EINT',
+                  'loop: ADD s0, 1',
+                  'JUMP loop',
+                  'ORG $3F0',
+                  'isr: ADD s1, 1',
+                  'RETI ENABLE',
+                  'ORG $3FF',
+                  'JUMP isr']
+
+
+def test_replay_with_timer(create_and_parse):
+    straight = create_and_parse(TIMER)
+    straight.scheduler.timer(50)
+    straight.run(230)
+
+    vm = create_and_parse(TIMER)
+    vm.scheduler.timer(50)
+    vm.enable_journal(checkpoint_interval=16)
+    vm.run(230)
+    vm.step_back(20)
+    vm.run(20)
+    assert vm.snapshot() == straight.snapshot()
+    assert vm.registers['S1'] == 4
+
+    # the timer fired at cycle 200, it would not fire again
+    with pytest.raises(RuntimeError):
+        vm.step_back(100)
+    assert vm.snapshot() == straight.snapshot()
+
+
+def test_replay_pending_interrupt(create_and_parse):
+    straight = create_and_parse(LATE_INTERRUPT)
+    straight.scheduler.interrupt_at(10)
+    straight.run(60)
+
+    # raised at cycle 10, taken once interrupts are enabled
+    vm = create_and_parse(LATE_INTERRUPT)
+    vm.scheduler.interrupt_at(10)
+    vm.enable_journal(checkpoint_interval=16)
+    vm.run(60)
+    vm.step_back(30)
+    assert vm._interrupt_caused is True
+    vm.run(30)
+    assert vm.snapshot() == straight.snapshot()
+    assert vm.registers['S1'] == 1
+
+
+def test_restore_with_events(create_and_parse):
+    vm = create_and_parse(TIMER)
+    snapshot = vm.snapshot()
+    vm.scheduler.timer(50)
+    vm.run(60)
+    later = vm.snapshot()
+
+    with pytest.raises(RuntimeError):
+        vm.restore(snapshot)
+    vm.run(10)
+    vm.restore(later)
+
+    vm.scheduler.clear()
+    vm.restore(snapshot)
+    assert vm.cycles == 0
@@ -0,0 +1,75 @@
+import pytest
+from src import kcpsm3
+from src.mnemonics import *
+from src.test_block_compiler import PROGRAM
+from src.virtual_machine import VirtualMachine
+
+
+@pytest.mark.parametrize('instruction, word', [
+    (LOAD('S0', 5), 0x00005),
+    (LOAD('S1', 'SF'), 0x011F0),
+    (ADD('SA', 'S1'), 0x19A10),
+    (ADDC('S2', 0xFF), 0x1A2FF),
+    (SUBC('SF', 'S0'), 0x1FF00),
+    (COMP('S3', 0x80), 0x14380),
+    (TEST('S4', 'S5'), 0x13450),
+    (FETCH('S6', 63), 0x0663F),
+    (STORE('S6', 'S7'), 0x2F670),
+    (IN('S8', 'S9'), 0x05890),
+    (OUT('S1', 2), 0x2C102),
+    (SR0('S3'), 0x2030E),
+    (SLA('SC'), 0x20C00),
+    (RR('S0'), 0x2000C),
+    (JUMP(0x3FF, None), 0x343FF),
+    (JUMP('NZ', 0x3FF), 0x357FF),
+    (CALL('C', 0x10), 0x31810),
+    (CALL(0x200, None), 0x30200),
+    (RET(None), 0x2A000),
+    (RET('NC'), 0x2BC00),
+    (RETI('ENABLE'), 0x38001),
+    (RETI('DISABLE'), 0x38000),
+    (EINT(), 0x3C001),
+    (DINT(), 0x3C000),
+])
+def test_encode_decode(instruction, word):
+    assert kcpsm3.encode(instruction) == word
+    assert kcpsm3.decode(word) == instruction
+
+
+def test_encode_labels():
+    assert kcpsm3.encode(JUMP('Z', 'loop'), {'loop': 0x12}) == 0x35012
+    with pytest.raises(KeyError):
+        kcpsm3.encode(JUMP('loop', None))
+    with pytest.raises(ValueError):
+        kcpsm3.encode(LOAD('S0', 256))
+    with pytest.raises(ValueError):
+        kcpsm3.encode(ORG(10))
+
+
+@pytest.mark.parametrize('word', [0x02000, 0x20010, 0x2A001, 0x3C002, 0x00000 - 1, 0x40000])
+def test_invalid_words(word):
+    with pytest.raises(ValueError):
+        kcpsm3.decode(word)
+
+
+@pytest.mark.parametrize('extension', ['.hex', '.mem'])
+def test_image_round_trip(create_and_parse, tmpdir, extension):
+    assembled = create_and_parse(PROGRAM)
+    path = str(tmpdir.join('rom' + extension))
+    kcpsm3.save_image(path, assembled.program)
+
+    loaded = VirtualMachine()
+    loaded.load_image(path)
+    assert kcpsm3.program_words(loaded.program) == kcpsm3.program_words(assembled.program)
+
+    for _ in range(500):
+        assembled.step_over()
+        loaded.step_over()
+        assert loaded.registers == assembled.registers
+        assert loaded.ram == assembled.ram
+        assert loaded._program_cnt == assembled._program_cnt
+
+
+def test_read_mem():
+    lines = ['// comment', '@00000002', '00005 19A10 // two words', '@0', '343FF']
+    assert kcpsm3.read_mem(lines) == [0x343FF, 0, 0x00005, 0x19A10]
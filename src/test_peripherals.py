@@ -0,0 +1,70 @@
+import pytest
+from src.block_compiler import BlockEngine
+from src.peripherals import Capture, Constant, InputQueue, TimedCapture
+
+ECHO = ['rx DSIN $81',
+        'tx DSOUT $F0',
+        'status DSIN $20',
+        'loop: IN s0, status',
+        'COMP s0, 0',
+        'JUMP Z, loop',
+        'IN s1, rx',
+        'LOAD s2, tx',
+        'OUT s1, s2',
+        'JUMP loop']
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_echo(create_and_parse, engine):
+    vm = create_and_parse(ECHO)
+    capture = Capture()
+    assert vm.connect('rx', InputQueue(b'hello')) == 0x81
+    vm.connect('tx', capture)
+    vm.map_input(0x20, Constant(1))
+
+    if engine:
+        BlockEngine(vm).run(7 * 6)
+    else:
+        vm.step_many(7 * 6)
+    assert capture.data == b'hello\0'
+    # mapped ports leave the latches alone
+    assert vm.output_ports[0xF0] == 0
+
+
+def test_unmapped_and_callables(create_and_parse):
+    vm = create_and_parse(['IN s0, $FF', 'OUT s0, 3', 'IN s1, 7', 'OUT s1, 200'])
+    written = []
+    vm.input_ports[0xFF] = 5
+    vm.map_input(7, lambda: 42)
+    vm.map_output(200, written.append)
+    vm.step_many(4)
+    assert vm.output_ports[3] == 5
+    assert written == [42]
+
+    vm.unmap_port(7)
+    vm.unmap_port(200)
+    vm._program_cnt = 2
+    vm.step_many(2)
+    assert vm.output_ports[200] == 0
+
+    with pytest.raises(KeyError):
+        vm.connect('uart', Constant(0))
+
+
+def test_input_queue():
+    queue = InputQueue(iter([1, 2, 300]), default=7)
+    queue.push([9])
+    assert [queue.read() for _ in range(5)] == [9, 1, 2, 300 & 0xFF, 7]
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_timestamps(create_and_parse, engine):
+    vm = create_and_parse(['loop: ADD s0, 1', 'OUT s0, 1', 'LOAD s1, s0', 'JUMP loop'])
+    vm.frequency = 1000
+    capture = TimedCapture(vm)
+    vm.map_output(1, capture)
+    if engine:
+        BlockEngine(vm).run(12)
+    else:
+        vm.run(12)
+    assert capture.samples == [(0.002, 1), (0.01, 2), (0.018, 3)]
@@ -0,0 +1,57 @@
+from src.block_compiler import BlockEngine
+from src.profiler import Profiler
+from src.test_block_compiler import PROGRAM
+
+POLLING = ['EINT',
+           'poll: IN s0, 1',
+           'COMP s0, 0',
+           'JUMP Z, poll',
+           'done: JUMP done',
+           'ORG $3F0',
+           'isr: ADD s1, 1',
+           'RETI ENABLE',
+           'ORG $3FF',
+           'JUMP isr']
+
+
+def test_counts(create_and_parse):
+    vm = create_and_parse(POLLING)
+    profiler = Profiler(vm)
+    vm.step_many(1 + 3 * 10)
+    vm.toggle_interrupt(True)
+    vm.step_over()
+    vm.toggle_interrupt(False)
+    vm.step_many(3)
+    vm.input_ports[1] = 1
+    vm.step_many(5)
+
+    assert profiler.instructions == 39
+    assert profiler.interrupts == 1
+    assert profiler.clocks == 2 * vm.cycles == 80
+    assert list(profiler.counts[:5]) == [1, 11, 11, 11, 2]
+    assert profiler.counts[0x3F0] == profiler.counts[0x3FF] == 1
+    assert profiler.opcode_counts()['COMP'] == 11
+    assert profiler.label_clocks() == {None: 2, 'poll': 66, 'done': 4, 'isr': 6}
+
+    (spot,) = profiler.hotspots(1)
+    assert (spot.addr, spot.count, spot.clocks, spot.label) == (1, 11, 22, 'poll')
+    poll, vector, done = profiler.loops()
+    assert (poll.start, poll.end, poll.iterations, poll.clocks, poll.label) == (1, 3, 10, 66, 'poll')
+    assert (done.start, done.end, done.iterations) == (4, 4, 2)
+    assert (vector.start, vector.end, vector.label) == (0x3F0, 0x3FF, 'isr')
+    report = profiler.report()
+    assert 'poll' in report and 'IN S0, 1' in report
+
+
+def test_detach_and_block_engine(create_and_parse):
+    vm = create_and_parse(PROGRAM)
+    profiler = Profiler(vm)
+    BlockEngine(vm).run(500)
+    assert profiler.instructions == 500
+    assert profiler.loops()[0].start == vm.program.labels['loop']
+
+    profiler.detach()
+    vm.step_many(10)
+    assert profiler.instructions == 500
+    profiler.clear()
+    assert profiler.instructions == 0
@@ -0,0 +1,76 @@
+from src import run
+from src.peripherals import Constant
+from src.run import Job, run_job, run_jobs, EXIT_CYCLES, EXIT_ERROR
+
+ECHO = ['start: IN s0, 1',
+        'ADD s0, 1',
+        'OUT s0, 2',
+        'JUMP start']
+
+
+def test_run_job(write_program):
+    program = write_program('echo.psm', ECHO)
+    result = run_job(Job(program, 12, {1: [4, 9]}))
+
+    assert result.exit_reason == EXIT_CYCLES
+    assert result.error is None
+    assert result.cycles == 12
+    assert result.program_cnt == 0
+    assert result.registers['S0'] == 10
+    assert result.outputs == [(2, 5), (2, 10), (2, 10)]
+
+    # nothing leaks into the next job of the same worker
+    result = run_job(Job(program, 3))
+    assert result.outputs == [(2, 1)]
+    assert result.ram == [0] * 64
+
+
+def test_mapped_device(write_program):
+    vm = run._worker_machine()
+    vm.map_input(3, Constant(7))
+    try:
+        result = run_job(Job(write_program('in.psm', ['IN s0, 3', 'IN s1, 1', 'OUT s0, 2']), 3, {1: [5]}))
+    finally:
+        vm.unmap_port(3)
+    assert result.registers['S0'] == 7
+    assert result.registers['S1'] == 5
+    assert result.outputs == [(2, 7)]
+
+    # the stimulus stays mapped until the next job is fed
+    assert vm.read_port(1) == 5
+    vm.feed(None)
+    assert vm.read_port(1) == 0
+
+
+def test_run_job_errors(tmpdir, write_program):
+    result = run_job(Job(write_program('ret.psm', ['LOAD s0, 1', 'RET']), 10))
+    assert result.exit_reason == EXIT_ERROR
+    assert result.error == 'RuntimeError: Error in address 1: stack underflow'
+    assert result.cycles == 1
+    assert result.registers['S0'] == 1
+
+    result = run_job(Job(write_program('label.psm', ['JUMP nowhere']), 10))
+    assert result.exit_reason == EXIT_ERROR
+    assert result.cycles == 0
+
+    result = run_job(Job(str(tmpdir.join('missing.psm')), 10))
+    assert result.exit_reason == EXIT_ERROR
+    assert result.error.startswith('FileNotFoundError')
+    assert result.cycles == 0
+
+
+def test_run_jobs(tmpdir, write_program):
+    echo = write_program('echo.psm', ECHO)
+    broken = write_program('broken.psm', ['FETCH s0, 64'])
+    missing = str(tmpdir.join('missing.psm'))
+    jobs = [Job(echo, 4 * i, {1: [i]}) for i in range(8)] + [Job(broken, 5), Job(missing, 5)]
+
+    results = list(run_jobs(jobs, workers=2))
+
+    assert sorted(r.job.cycles for r in results) == sorted(job.cycles for job in jobs)
+    for result in results:
+        if result.job.program in (broken, missing):
+            assert result.exit_reason == EXIT_ERROR
+        else:
+            i = result.job.stimulus[1][0]
+            assert result.outputs == [(2, i + 1)] * i
@@ -0,0 +1,80 @@
+import pytest
+from src.block_compiler import BlockEngine
+from src.scheduler import NEVER
+
+TIMER = ['EINT',
+         'loop: ADD s0, 1',
+         'JUMP loop',
+         'ORG $3F0',
+         'isr: ADD s1, 1',
+         'OUT s0, 5',
+         'RETI ENABLE',
+         'ORG $3FF',
+         'JUMP isr']
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_timer(create_and_parse, engine):
+    vm = create_and_parse(TIMER)
+    vm.scheduler.timer(100)
+    if engine:
+        BlockEngine(vm).run(1000)
+    else:
+        vm.run(1000)
+
+    # at cycles 100, 200, ..., 900
+    assert vm.registers['S1'] == 9
+    assert vm.cycles == 1000
+    assert vm.scheduler.deadline == 1000
+    assert vm._interrupt_caused is False
+
+
+@pytest.mark.parametrize('engine', [False, True])
+def test_exact_cycle(create_and_parse, engine):
+    vm = create_and_parse(TIMER)
+    seen = []
+    vm.scheduler.at(37, lambda vm: seen.append((vm.cycles, vm._program_cnt)))
+    vm.scheduler.interrupt_at(50)
+    if engine:
+        BlockEngine(vm).run(60)
+    else:
+        vm.step_many(60)
+
+    assert seen == [(37, 1)]
+    # taken as the instruction of cycle 50, after the ADD of cycle 49
+    assert vm._stack == [] and vm.registers['S1'] == 1
+    assert vm.output_ports[5] == 25
+
+
+def test_device_interrupt_and_cancel(create_and_parse):
+    vm = create_and_parse(TIMER)
+    events = []
+
+    def device(vm):
+        events.append(vm.cycles)
+        vm.scheduler.interrupt_after(3)
+
+    vm.scheduler.at(10, device)
+    timer = vm.scheduler.every(5, lambda vm: events.append(vm.cycles))
+    vm.run(16)
+    vm.scheduler.cancel(timer)
+    vm.run(20)
+
+    assert events == [5, 10, 10, 15]
+    assert vm.registers['S1'] == 1
+    assert vm.scheduler.deadline == NEVER and vm._deadline == NEVER
+
+    with pytest.raises(ValueError):
+        vm.scheduler.at(1, device)
+    vm.reset()
+    assert len(vm.scheduler) == 0
+
+
+def test_disabled_interrupt_waits(create_and_parse):
+    vm = create_and_parse(['LOAD s0, 1', 'LOAD s0, 2', 'EINT', 'loop: JUMP loop', 'ORG $3FF', 'RETI DISABLE'])
+    vm.scheduler.interrupt_at(1)
+    vm.run(3)
+    assert vm._interrupt_caused is True
+    vm.run(1)
+    assert vm._program_cnt == 0x3FF and vm._stack == [3]
+    assert vm._interrupt_caused is False
@@ -0,0 +1,84 @@
+import pytest
+from src.block_compiler import BlockEngine
+from src.peripherals import Capture
+from src.system import System, DATA_AVAILABLE, FULL
+from src.virtual_machine import VirtualMachine
+
+PRODUCER = ['send: IN s1, $11',
+            'TEST s1, 2',
+            'JUMP NZ, send',
+            'ADD s0, 1',
+            'OUT s0, $10',
+            'JUMP send']
+
+WORKER = ['wait: IN s1, $21',
+          'TEST s1, 1',
+          'JUMP Z, wait',
+          'IN s0, $20',
+          'ADD s0, 1',
+          'send: IN s1, $11',
+          'TEST s1, 2',
+          'JUMP NZ, send',
+          'OUT s0, $10',
+          'JUMP wait']
+
+SINK = WORKER[:4] + ['OUT s0, 5', 'JUMP wait']
+
+
+def core(program):
+    vm = VirtualMachine()
+    vm.load_program(program)
+    return vm
+
+
+def pipeline(assemble, quantum, engine=None, reverse=False):
+    system = System(quantum)
+    cores = [core(assemble(PRODUCER)), core(assemble(WORKER)), core(assemble(WORKER)), core(assemble(SINK))]
+    for vm in reversed(cores) if reverse else cores:
+        system.add(vm, engine)
+    fifos = [system.connect(source, 0x10, target, 0x20, depth=4, source_status=0x11, target_status=0x21)
+             for source, target in zip(cores, cores[1:])]
+    capture = Capture()
+    cores[3].map_output(5, capture)
+    return system, cores, fifos, capture
+
+
+@pytest.mark.parametrize('quantum', [1, 7, 100])
+def test_pipeline(assemble, quantum):
+    system, cores, fifos, capture = pipeline(assemble, quantum)
+    system.run(3000)
+
+    assert system.cycles == 3000
+    assert all(vm.cycles == 3000 for vm in cores)
+    assert len(capture.data) > 10
+    assert list(capture.data) == [(3 + i) & 0xFF for i in range(len(capture.data))]
+    assert all(fifo.overflows == fifo.underflows == 0 for fifo in fifos)
+
+
+def test_deterministic(assemble):
+    results = []
+    for engine, reverse in [(None, False), (None, True), (BlockEngine, False), (BlockEngine, True)]:
+        system, cores, fifos, capture = pipeline(assemble, 50, engine, reverse)
+        system.run(2000)
+        results.append((bytes(capture.data), [vm.snapshot() for vm in cores]))
+    assert all(result == results[0] for result in results)
+
+
+def test_fifo_and_latch(assemble):
+    system = System(10)
+    source = system.add(core(assemble(['OUT s0, 1', 'OUT s0, 4', 'ADD s0, 1', 'JUMP 0'])))
+    target = system.add(core(assemble(['IN s0, 2'])))
+    fifo = system.connect(source, 1, target, 3, depth=2)
+    latch = system.share(source, 4, {target: 2})
+
+    system.run(10)
+    assert len(fifo) == 2 and fifo.overflows == 1
+    assert (fifo.read_status(), fifo.write_status()) == (DATA_AVAILABLE, FULL)
+    assert latch.read() == 2
+    assert [fifo.read(), fifo.read(), fifo.read()] == [0, 1, 0]
+    assert fifo.underflows == 1
+
+    with pytest.raises(ValueError):
+        system.add(source)
+    with pytest.raises(ValueError):
+        system.connect(source, 1, VirtualMachine(), 1)
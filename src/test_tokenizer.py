@@ -3,10 +3,13 @@ from ply import lex
 
 import src.tokenizer_rules as tokenizer_rules
 from src.errors import TokenizeException
+from src.fast_tokenizer import FastLexer
 
 
-@pytest.fixture(scope='session')
-def lexer():
+@pytest.fixture(scope='session', params=['ply', 'fast'])
+def lexer(request):
+    if request.param == 'fast':
+        return FastLexer()
     return lex.lex(module=tokenizer_rules)
 
 
@@ -100,3 +103,20 @@ def test_flags(get_tokens):
     assert get_tokens('ENABLE enable eNaBlE') == [('FLAG', 'ENABLE')]*3
     assert get_tokens('DISABLE disable DiSaBlE') == [('FLAG', 'DISABLE')]*3
 
+
+def test_precedence(get_tokens):
+    assert get_tokens('c: nc') == [('LABEL', 'c'), ('INDICATOR', 'NC')]
+    assert get_tokens('12load s16 s01 addc_') == [
+        ('NUMBER', 12), ('NAME', 'load'), ('NAME', 's16'), ('NAME', 's01'), ('NAME', 'addc_')
+    ]
+    with pytest.raises(TokenizeException):
+        get_tokens('load: s0')
+
+
+def test_lines(lexer):
+    lexer.lineno = 1
+    lexer.input('LOAD s0, 1\n\nADD s0, $2 ; x\n')
+    assert [(token.type, token.lineno, token.lexpos) for token in lexer] == [
+        ('LOAD', 1, 0), ('REGISTER', 1, 5), ('COMMA', 1, 7), ('NUMBER', 1, 9),
+        ('ADD', 3, 12), ('REGISTER', 3, 16), ('COMMA', 3, 18), ('NUMBER', 3, 20), ('COMMENT', 3, 23)
+    ]
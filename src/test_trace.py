@@ -0,0 +1,87 @@
+import pytest
+from src import trace
+from src.block_compiler import BlockEngine
+from src.mnemonics import ADD, CALL
+from src.program import OPCODE_IDS
+from src.test_block_compiler import PROGRAM
+
+PORTS = ['IN s0, 3',
+         'LOAD s1, 4',
+         'loop: ADD s0, 1',
+         'OUT s0, s1',
+         'JUMP loop']
+
+
+def record(vm, path, cycles, engine=False):
+    with open(path, 'wb') as file:
+        tracer = trace.Tracer(vm, file, buffer_size=16)
+        if engine:
+            BlockEngine(vm).run(cycles)
+        else:
+            vm.step_many(cycles)
+        tracer.detach()
+    return tracer
+
+
+def test_records(create_and_parse, tmpdir):
+    path = str(tmpdir.join('ports.trace'))
+    vm = create_and_parse(PORTS)
+    vm.input_ports[3] = 9
+    assert record(vm, path, 6).records == 6
+
+    records = list(trace.read(path))
+    assert [r.cycle for r in records] == list(range(6))
+    assert [r.pc for r in records] == [0, 1, 2, 3, 4, 2]
+    assert (records[0].register, records[0].value, records[0].port, records[0].port_value) == (0, 9, 3, 9)
+    assert records[0].flags & trace.PORT_READ
+    assert records[2].register == 0 and records[2].value == 10
+    assert records[3].flags & trace.PORT_WRITE and (records[3].port, records[3].port_value) == (4, 10)
+    assert records[4].register == trace.NO_REGISTER
+
+
+def test_filters(create_and_parse, tmpdir):
+    path = str(tmpdir.join('program.trace'))
+    vm = create_and_parse(PROGRAM)
+    record(vm, path, 1000)
+
+    records = list(trace.read(path))
+    assert len(records) == 1000
+    assert [r.cycle for r in trace.read(path, cycles=(100, 110))] == list(range(100, 110))
+    assert all(r.pc in range(12, 16) for r in trace.read(path, pcs=range(12, 16)))
+    assert len(list(trace.read(path, opcodes=[ADD, CALL]))) == \
+        sum(r.opcode in (OPCODE_IDS[ADD], OPCODE_IDS[CALL]) for r in records)
+    assert list(trace.read(path, cycles=(2000, 3000))) == []
+
+
+def test_block_engine_same_trace(create_and_parse, tmpdir):
+    vm1 = create_and_parse(PROGRAM)
+    vm2 = create_and_parse(PROGRAM)
+    record(vm1, str(tmpdir.join('1.trace')), 500)
+    record(vm2, str(tmpdir.join('2.trace')), 500, engine=True)
+    assert list(trace.read(str(tmpdir.join('1.trace')))) == list(trace.read(str(tmpdir.join('2.trace'))))
+
+
+def test_interrupt(create_and_parse, tmpdir):
+    path = str(tmpdir.join('interrupt.trace'))
+    vm = create_and_parse(['EINT', 'loop: JUMP loop', 'ORG $3FF', 'RETI ENABLE'])
+    vm.step_over()
+    vm.toggle_interrupt(True)
+    record(vm, path, 1)
+    (entry,) = trace.read(path)
+    assert (entry.cycle, entry.pc, entry.opcode) == (1, 1, trace.NO_OPCODE)
+    assert entry.flags & trace.INTERRUPT
+
+
+def test_not_a_trace(tmpdir):
+    path = tmpdir.join('bad.trace')
+    path.write('PBXX' + ' ' * 20)
+    with pytest.raises(ValueError):
+        list(trace.read(str(path)))
+
+
+def test_main(create_and_parse, tmpdir, capsys):
+    path = str(tmpdir.join('ports.trace'))
+    record(create_and_parse(PORTS), path, 10)
+    assert trace.main([path, '--pc', '3:4', '--opcode', 'out']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3 and 'OUT[04]' in lines[0]
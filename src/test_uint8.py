@@ -74,3 +74,20 @@ def test_getitem():
     for i in range(8):
         assert uint8(255)[i] == 1
         assert uint8(0)[i] == 0
+
+
+def test_rshift():
+    assert (uint8(64), 1) == uint8(129) >> 1
+    assert (uint8(0), 0) == uint8(0) >> 1
+
+
+def test_interned():
+    assert uint8(3) is uint8(259)
+    assert (uint8(250) + 11)[0] is uint8(5)
+    assert not hasattr(uint8(1), '__dict__')
+
+
+def test_bits():
+    assert uint8(5).as_bit_list() == [1, 0, 1]
+    assert uint8(0).as_bit_list() == [0]
+    assert uint8(128).as_bit_str() == '10000000'
@@ -1,22 +1,6 @@
 import pytest
+import time
 from src.virtual_machine import VirtualMachine
-from os import remove
-
-
-@pytest.fixture(scope='session')
-def create_and_parse():
-
-    def _create_and_parse(orders):
-        lines = map(lambda x: x + '\n', orders)
-        with open('testfile', 'w') as file:
-            file.writelines(lines)
-
-        vm = VirtualMachine()
-        vm.parse_file('testfile')
-        return vm
-
-    yield _create_and_parse
-    remove('testfile')
 
 
 def test1(create_and_parse):
@@ -67,3 +51,160 @@ def test4(create_and_parse):
     vm.step_over()
     assert vm._stack == []
     assert vm._program_cnt == 43
+
+
+def test_load_time_errors(create_and_parse):
+    with pytest.raises(KeyError):
+        create_and_parse(['JUMP nowhere'])
+    with pytest.raises(ValueError):
+        create_and_parse(['FETCH s0, 64'])
+    with pytest.raises(ValueError):
+        create_and_parse(['num EQU 3', 'ADD num, 1'])
+
+
+def test_decoded_image(create_and_parse):
+    vm = create_and_parse(['num EQU 6',
+                           'start: ADD s10, num',
+                           'ADD sA, s3',
+                           'JUMP NZ, start'])
+    assert [op.handler for op in vm.program.image[:3]] == ['ADD_val', 'ADD_reg', 'JUMP_NZ']
+    assert vm.program.image[0][2:] == (10, 6)
+    assert vm.program.image[1][2:] == (10, 3)
+    assert vm.program.image[2].x == 0
+    assert vm.program.image[3] is None
+
+
+def test_ADDC_SUBC_COMP(create_and_parse):
+    vm = create_and_parse(['LOAD s0, 255',
+                           'LOAD s1, 1',
+                           'ADD s0, s1',
+                           'ADDC s1, s1',
+                           'COMP s1, 3',
+                           'SUBC s1, 2'])
+    vm.step_many(4)
+    assert vm.registers['S0'] == 0
+    assert vm.registers['S1'] == 3
+    vm.step_over()
+    assert vm._zero == 1
+    assert vm._carry == 0
+    vm.step_over()
+    assert vm.registers['S1'] == 1
+
+
+def test_register_view(create_and_parse):
+    vm = create_and_parse(['LOAD s10, 300', 'LOAD sB, sA'])
+    vm.step_many(2)
+    assert vm.registers['SA'] == vm.registers['S10'] == 44
+    assert vm.registers['SB'] == 44
+    assert list(vm.registers)[:3] == ['S0', 'S1', 'S2']
+    vm.registers['S0'] = 257
+    assert vm._registers[0] == 1
+
+
+def test_shift_flags(create_and_parse):
+    vm = create_and_parse(['LOAD s0, 0', 'SL1 s0', 'LOAD s1, 1', 'SR0 s1', 'TEST s0, 7'])
+    vm.step_many(2)
+    assert vm.registers['S0'] == 1
+    assert vm._zero == 0
+    vm.step_many(2)
+    assert vm._carry == 1
+    assert vm._zero == 1
+    vm.step_over()
+    assert vm._carry == 1
+    assert vm._zero == 0
+
+
+def test_run(create_and_parse):
+    vm = create_and_parse(['LOAD s0, 0',
+                           'loop: ADD s0, 1',
+                           'COMP s0, 10',
+                           'JUMP NZ, loop',
+                           'done: LOAD s1, 1',
+                           'JUMP done'])
+
+    assert vm.run(5) == ('max_cycles', 5)
+    assert vm.cycles == 5
+
+    assert vm.run(breakpoints=['loop']) == ('breakpoint', 2)
+    assert vm.registers['S0'] == 2
+    # resuming from a breakpoint executes it first
+    assert vm.run(breakpoints=[1]) == ('breakpoint', 3)
+    assert vm.registers['S0'] == 3
+
+    assert vm.run(until_pc='done', breakpoints=[5]) == ('until_pc', 21)
+    assert vm.registers['S0'] == 10
+    assert vm.run(100, breakpoints=[2, 3]) == ('max_cycles', 100)
+
+    vm.reset()
+    assert vm.run(100, stop_on=lambda vm: vm.registers['S0'] == 4) == ('stop_on', 11)
+    assert vm.cycles == 11
+
+    with pytest.raises(KeyError):
+        vm.run(breakpoints=['nowhere'])
+    with pytest.raises(ValueError):
+        vm.run(until_pc=1024)
+
+
+def test_snapshot(create_and_parse):
+    vm = create_and_parse(['LOAD s0, 3',
+                           'EINT',
+                           'loop: CALL count',
+                           'STORE s0, 1',
+                           'JUMP loop',
+                           'count: SUB s0, 1',
+                           'OUT s0, 4',
+                           'RET',
+                           'ORG $3FF',
+                           'RETI ENABLE'])
+    vm.input_ports[2] = 9
+    vm.step_many(5)
+    vm.toggle_interrupt(True)
+    vm.step_over()
+    vm.toggle_interrupt(False)
+
+    snapshot = vm.snapshot()
+    assert type(snapshot) is bytes
+    assert vm._stack == [2, 7]
+    assert len(snapshot) == 16 + 64 + 2 * 256 + 14 + 2 * 2
+
+    def state():
+        return vm.snapshot(), dict(vm.registers), bytes(vm.ram), list(vm._stack), vm._carry, vm._zero, \
+            vm._interrupt_enabled, vm._pre_carry, vm._pre_zero, vm._program_cnt, vm.cycles
+
+    vm.step_many(20)
+    expected = state()
+
+    for _ in range(3):
+        vm.restore(snapshot)
+        assert vm.snapshot() == snapshot
+        vm.step_many(20)
+        assert state() == expected
+
+    vm.reset()
+    assert vm.snapshot() == VirtualMachine().snapshot()
+
+    with pytest.raises(ValueError):
+        vm.restore(snapshot[:-1])
+
+
+def test_timing(create_and_parse):
+    vm = create_and_parse(['loop: ADD s0, 1', 'JUMP loop'])
+    vm.frequency = 1000000
+    assert vm.cycles_in(0.001) == 500
+    vm.run(500)
+    assert (vm.clocks, vm.time) == (1000, 0.001)
+    with pytest.raises(ValueError):
+        vm.frequency = 0
+
+
+def test_run_throttled(create_and_parse):
+    vm = create_and_parse(['loop: ADD s0, 1', 'JUMP loop'])
+    vm.frequency = 20000
+    started = time.perf_counter()
+    assert vm.run_throttled(500, batch=0.005) == ('max_cycles', 500)
+    # 500 instructions of 2 clocks at 20 kHz take 50 ms
+    assert 0.05 <= time.perf_counter() - started < 0.5
+
+    started = time.perf_counter()
+    assert vm.run_throttled(1000, until_pc=0, speed=10) == ('until_pc', 2)
+    assert time.perf_counter() - started < 0.05
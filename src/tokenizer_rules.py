@@ -79,4 +79,4 @@ def t_newline(t):
 
 
 def t_error(t):
-    raise TokenizeException("Illegal character '%s'" % t.value[0])
+    raise TokenizeException("Illegal character '%s' in line %d" % (t.value[0], t.lineno))
@@ -0,0 +1,199 @@
+# Binary execution traces: one fixed size record per executed instruction, written through a
+# buffer while the machine runs and read back with a generator over a memory map of the file.
+from src.journal import REGISTER_HANDLERS
+from src.program import OPCODE_IDS, OPCODES
+from collections import namedtuple
+import argparse
+import mmap
+import struct
+import sys
+
+MAGIC = b'PBTR'
+TRACE_VERSION = 1
+HEADER = struct.Struct('<4sHH')
+# cycle, pc, opcode, changed register, its new value, flags, port, port value
+RECORD = struct.Struct('<QHBBBBBB')
+
+Record = namedtuple('Record', ('cycle', 'pc', 'opcode', 'register', 'value', 'flags', 'port', 'port_value'))
+
+# `opcode` of empty addresses and of taking an interrupt, `register` when none was written
+NO_OPCODE = 0xFF
+NO_REGISTER = 0xFF
+
+CARRY, ZERO, INTERRUPT_ENABLED, INTERRUPT, PORT_READ, PORT_WRITE = 1, 2, 4, 8, 16, 32
+
+BUFFER_SIZE = 1 << 16
+READ_RECORDS = 1 << 14
+
+
+# Records every instruction the machine executes to a binary file opened for writing.
+# The cycles are counted from the cycle of the machine when the tracer was attached.
+class Tracer(object):
+    def __init__(self, vm, file, buffer_size=BUFFER_SIZE):
+        self._vm = vm
+        self._file = file
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size * RECORD.size
+        self._cycle = vm.cycles
+        self._records = 0
+
+        file.write(HEADER.pack(MAGIC, TRACE_VERSION, RECORD.size))
+        vm.instrument(self)
+
+    @property
+    def records(self):
+        return self._records + len(self._buffer) // RECORD.size
+
+    def flush(self):
+        self._records += len(self._buffer) // RECORD.size
+        self._file.write(self._buffer)
+        del self._buffer[:]
+        self._file.flush()
+
+    def detach(self):
+        self._vm.uninstrument(self)
+        self.flush()
+
+    def _write(self, pc, opcode, register, value, flags, port, port_value):
+        vm = self._vm
+        flags |= vm._carry | vm._zero << 1 | vm._interrupt_enabled << 2
+        self._buffer += RECORD.pack(self._cycle, pc, opcode, register, value, flags, port, port_value)
+        self._cycle += 1
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def instrument_code(self, vm, code):
+        image = vm.program.image
+        return [self._wrap(vm, handler, x, y, addr, NO_OPCODE if image[addr] is None else image[addr].opcode)
+                for addr, (handler, x, y) in enumerate(code)]
+
+    def _wrap(self, vm, handler, x, y, addr, opcode):
+        write, registers = self._write, vm._registers
+        name = handler.__name__[len('_handle_'):]
+
+        if name in ('IN_val', 'IN_reg', 'OUT_val', 'OUT_reg'):
+            by_register = name.endswith('_reg')
+            direction = PORT_READ if name.startswith('IN') else PORT_WRITE
+            register = x if direction == PORT_READ else NO_REGISTER
+
+            def traced(x, y):
+                port = registers[y] if by_register else y
+                handler(x, y)
+                value = registers[x]
+                write(addr, opcode, register, value, direction, port, value)
+        elif name.split('_')[0] in REGISTER_HANDLERS:
+            def traced(x, y):
+                handler(x, y)
+                write(addr, opcode, x, registers[x], 0, 0, 0)
+        else:
+            def traced(x, y):
+                handler(x, y)
+                write(addr, opcode, NO_REGISTER, 0, 0, 0, 0)
+
+        return traced, x, y
+
+    def instrument_interrupt(self, vm, handler):
+        write = self._write
+
+        def traced():
+            pc = vm._program_cnt
+            handler()
+            write(pc, NO_OPCODE, NO_REGISTER, 0, INTERRUPT, 0, 0)
+
+        return traced
+
+
+def _records(view):
+    if len(view) < HEADER.size:
+        raise ValueError('Not a trace file')
+    magic, version, size = HEADER.unpack_from(view)
+    if magic != MAGIC or version != TRACE_VERSION or size != RECORD.size:
+        raise ValueError('Not a trace file of this version')
+    return (len(view) - HEADER.size) // RECORD.size
+
+
+def _cycle(view, index):
+    return struct.unpack_from('<Q', view, HEADER.size + index * RECORD.size)[0]
+
+
+# index of the first record of `cycle` or a later one, the cycles only grow through a trace
+def _seek(view, count, cycle):
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if _cycle(view, middle) < cycle:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+# Yields the records of the trace file, optionally only these with the program counter in `pcs`,
+# the cycle in the [start, stop) window `cycles` or one of the instructions in `opcodes`.
+def read(filename, pcs=None, cycles=None, opcodes=None):
+    if opcodes is not None:
+        opcodes = frozenset(OPCODE_IDS[opcode] for opcode in opcodes)
+
+    with open(filename, 'rb') as file:
+        if not file.seek(0, 2):
+            raise ValueError('Not a trace file')
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            count = _records(view)
+            first, last = 0, count
+            if cycles is not None:
+                first, last = _seek(view, count, cycles[0]), _seek(view, count, cycles[1])
+
+            # read in slices, so no buffer of the map is exported when the caller stops early
+            for start in range(first, last, READ_RECORDS):
+                stop = min(last, start + READ_RECORDS)
+                for record in RECORD.iter_unpack(view[HEADER.size + start * RECORD.size:
+                                                      HEADER.size + stop * RECORD.size]):
+                    if pcs is not None and record[1] not in pcs:
+                        continue
+                    if opcodes is not None and record[2] not in opcodes:
+                        continue
+                    yield Record._make(record)
+
+
+def _format(record):
+    if record.opcode == NO_OPCODE:
+        name = 'interrupt' if record.flags & INTERRUPT else 'NOP'
+    else:
+        name = OPCODES[record.opcode].__name__
+    text = '{0:>12} {1:03X} {2:<5} C={3} Z={4} IE={5}'.format(
+        record.cycle, record.pc, name, record.flags & CARRY and 1, record.flags & ZERO and 1,
+        record.flags & INTERRUPT_ENABLED and 1)
+    if record.register != NO_REGISTER:
+        text += ' S{0:X}={1:02X}'.format(record.register, record.value)
+    if record.flags & PORT_READ:
+        text += ' IN[{0:02X}]={1:02X}'.format(record.port, record.port_value)
+    if record.flags & PORT_WRITE:
+        text += ' OUT[{0:02X}]={1:02X}'.format(record.port, record.port_value)
+    return text
+
+
+def _range(text):
+    start, _, stop = text.partition(':')
+    return int(start, 0), int(stop, 0)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Prints the records of an execution trace.')
+    arg_parser.add_argument('trace', help='trace file')
+    arg_parser.add_argument('--pc', type=_range, help='START:STOP program counter range')
+    arg_parser.add_argument('--cycles', type=_range, help='START:STOP cycle window')
+    arg_parser.add_argument('--opcode', action='append', help='only this instruction (repeatable)')
+    args = arg_parser.parse_args(argv)
+
+    opcodes = None
+    if args.opcode:
+        by_name = {opcode.__name__: opcode for opcode in OPCODES}
+        opcodes = [by_name[name.upper()] for name in args.opcode]
+
+    for record in read(args.trace, range(*args.pc) if args.pc else None, args.cycles, opcodes):
+        print(_format(record))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,60 +1,51 @@
 class uint8(object):
+    __slots__ = ('_val',)
     _mask = 0b11111111
 
-    def __init__(self, value):
-        self._val = value & self._mask
+    def __new__(cls, value):
+        # every value has exactly one instance, see _VALUES below
+        return _VALUES[value & cls._mask]
+
+    def __reduce__(self):
+        return uint8, (self._val,)
 
     def __add__(self, other):
-        if isinstance(other, int):
-            result = self._val + other
-        else:
-            result = self._val + other._val
+        value = other._val if type(other) is uint8 else other
+        if 0 <= value <= self._mask:
+            return _ADD[self._val << 8 | value]
 
-        if result > self._mask or result < 0:
-            return uint8(result), 1
-        else:
-            return uint8(result), 0
+        result = self._val + value
+        return _VALUES[result & self._mask], 1 if result > self._mask or result < 0 else 0
 
     def __sub__(self, other):
-        if isinstance(other, int):
-            result = self._val - other
-        else:
-            result = self._val - other._val
+        value = other._val if type(other) is uint8 else other
+        if 0 <= value <= self._mask:
+            return _SUB[self._val << 8 | value]
 
-        if result > self._mask or result < 0:
-            return uint8(result), 1
-        else:
-            return uint8(result), 0
+        result = self._val - value
+        return _VALUES[result & self._mask], 1 if result > self._mask or result < 0 else 0
 
     def __and__(self, other):
-        if isinstance(other, int):
-            return uint8(self._val & other)
-        else:
-            return uint8(self._val & other._val)
+        return _VALUES[self._val & (other._val if type(other) is uint8 else other) & self._mask]
 
     def __or__(self, other):
-        if isinstance(other, int):
-            return uint8(self._val | other)
-        else:
-            return uint8(self._val | other._val)
+        return _VALUES[(self._val | (other._val if type(other) is uint8 else other)) & self._mask]
 
     def __xor__(self, other):
-        if isinstance(other, int):
-            return uint8(self._val ^ other)
-        else:
-            return uint8(self._val ^ other._val)
+        return _VALUES[(self._val ^ (other._val if type(other) is uint8 else other)) & self._mask]
 
     def __mod__(self, other):
-        if isinstance(other, int):
-            return uint8(self._val % other)
-        else:
-            return uint8(self._val % other._val)
+        return _VALUES[self._val % (other._val if type(other) is uint8 else other) & self._mask]
 
     def __lshift__(self, other):
-        return uint8(self._val << other), self[7]
+        if other == 1:
+            return _LSHIFT[self._val]
+        return _VALUES[(self._val << other) & self._mask], self._val >> 7
 
     def __rshift__(self, other):
-        return uint8(self._val >> other), self[0]
+        if other == 1:
+            return _RSHIFT[self._val]
+        return _VALUES[self._val >> other], self._val & 1
 
     def __getitem__(self, item):
         if item < 0 or item > 7:
@@ -62,34 +53,49 @@ class uint8(object):
         return (self._val >> item) & 1
 
     def __eq__(self, other):
-        if isinstance(other, int):
-            return self._val == other
-        else:
-            return self._val == other._val
+        return self._val == (other._val if type(other) is uint8 else other)
 
     def __lt__(self, other):
-        if isinstance(other, int):
-            return self._val < other
-        else:
-            return self._val < other._val
+        return self._val < (other._val if type(other) is uint8 else other)
 
     def __bool__(self):
-        return False if self._val is 0 else True
+        return self._val != 0
 
     def __int__(self):
         return self._val
 
     def __str__(self):
-        return str(self._val)
+        return _STRS[self._val]
 
     def __repr__(self):
-        return str(self._val)
+        return _STRS[self._val]
 
     def __index__(self):
         return self._val
 
     def as_bit_list(self):
-        return [int(i) for i in bin(self._val)[2:]]
+        return list(_BIT_LISTS[self._val])
 
     def as_bit_str(self):
-        return bin(self._val)[2:]
+        return _BIT_STRS[self._val]
+
+
+def _interned(value):
+    instance = object.__new__(uint8)
+    instance._val = value
+    return instance
+
+
+_VALUES = [_interned(value) for value in range(256)]
+
+_STRS = [str(value) for value in range(256)]
+_BIT_STRS = [bin(value)[2:] for value in range(256)]
+_BIT_LISTS = [tuple(int(i) for i in bits) for bits in _BIT_STRS]
+
+# (result, carry) pairs indexed by a << 8 | b, there are only 512 distinct pairs to share
+_RESULTS = [(_VALUES[value], carry) for carry in (0, 1) for value in range(256)]
+
+_ADD = [_RESULTS[(a + b) & 0x1FF] for a in range(256) for b in range(256)]
+_SUB = [_RESULTS[256 + ((a - b) & 0xFF) if a < b else a - b] for a in range(256) for b in range(256)]
+_LSHIFT = [_RESULTS[(value >> 7) * 256 + ((value << 1) & 0xFF)] for value in range(256)]
+_RSHIFT = [_RESULTS[(value & 1) * 256 + (value >> 1)] for value in range(256)]
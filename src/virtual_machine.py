@@ -1,21 +1,70 @@
-from src.parser_rules import Parser
-from src.mnemonics import *
-from src.uint8 import uint8
-from ply import lex, yacc
-from collections import OrderedDict
-import src.tokenizer_rules as tokenizer_rules
+from src import alu, kcpsm3
+from src.journal import Journal
+from src.mnemonics import DSIN, DSOUT, DSIO
+from src.scheduler import Scheduler, NEVER
+from src.program import link, CLOCKS_PER_INSTRUCTION, INSTRUCTIONS_CNT, PORTS_CNT, RAM_SIZE, REGISTERS, REGISTER_NAMES
+from array import array
+from collections import namedtuple
+from collections.abc import MutableMapping
+from functools import partial
+from itertools import repeat
+import struct
+import time
+
+
+STOP_MAX_CYCLES = 'max_cycles'
+STOP_BREAKPOINT = 'breakpoint'
+STOP_UNTIL_PC = 'until_pc'
+STOP_CONDITION = 'stop_on'
+
+RunResult = namedtuple('RunResult', ('reason', 'cycles'))
+
+# clock of the simulated PicoBlaze in Hz, and the wall-clock time run_throttled runs between sleeps
+DEFAULT_FREQUENCY = 50000000
+THROTTLE_BATCH = 0.01
+
+EMPTY_PROGRAM = link([])
+
+# version, registers, RAM, input and output ports, flags, program counter, cycles, stack depth,
+# followed by the stack as 16 bit addresses. The program is not a part of the state.
+SNAPSHOT_VERSION = 2
+SNAPSHOT = struct.Struct('<B{0}s{1}s{2}s{2}sBHQH'.format(len(REGISTER_NAMES), RAM_SIZE, PORTS_CNT))
+
+PORT_DIRECTIVES = (DSIN, DSOUT, DSIO)
+
+CARRY, ZERO, INTERRUPT_ENABLED, INTERRUPT_CAUSED, PRE_CARRY, PRE_ZERO = (1 << i for i in range(6))
+
+
+# Name based view of the register file, e.g. registers['S0'] or registers['sA'.upper()]
+class RegisterView(MutableMapping):
+    def __init__(self, registers):
+        self._registers = registers
+
+    def __getitem__(self, name):
+        return self._registers[REGISTERS[name]]
+
+    def __setitem__(self, name, value):
+        self._registers[REGISTERS[name]] = int(value) & 0xFF
+
+    def __delitem__(self, name):
+        raise TypeError('Registers cannot be removed')
+
+    def __iter__(self):
+        return iter(REGISTER_NAMES)
+
+    def __len__(self):
+        return len(REGISTER_NAMES)
 
 
 class VirtualMachine(object):
     def __init__(self):
-        self._parser = Parser()
-        self._registers = OrderedDict([('S'+str(i), uint8(0)) for i in [*range(10), *[j for j in 'ABCDEF']]])
-        self._instructions = {addr: None for addr in range(1024)}
-        self._ram = {addr: uint8(0) for addr in range(64)}
-        self._labels = {}
+        self._registers = bytearray(len(REGISTER_NAMES))
+        self._ram = bytearray(RAM_SIZE)
         self._carry = 0
         self._zero = 0
         self._stack = []
+        self._input_ports = bytearray(PORTS_CNT)
+        self._output_ports = bytearray(PORTS_CNT)
 
         self._interrupt_enabled = False
         self._pre_zero = 0
@@ -23,356 +72,638 @@ class VirtualMachine(object):
         self._interrupt_caused = False
 
         self._program_cnt = 0
-
-        lex.lex(module=tokenizer_rules)
-        self._parser.tokens = tokenizer_rules.tokens
-        self._yacc = yacc.yacc(module=self._parser)
-
-        self.__handlers = {
-            ADD:   self._handle_ADD,
-            ADDC:  self._handle_ADDC,
-            AND:   self._handle_AND,
-            CALL:  self._handle_CALL,
-            COMP:  self._handle_COMP,
-            DINT:  self._handle_DINT,
-            EINT:  self._handle_EINT,
-            FETCH: self._handle_FETCH,
-            IN:    self._handle_IN,
-            JUMP:  self._handle_JUMP,
-            LOAD:  self._handle_LOAD,
-            OR:    self._handle_OR,
-            OUT:   self._handle_OUT,
-            RET:   self._handle_RET,
-            RETI:  self._handle_RETI,
-            RL:    self._handle_RL,
-            SL0:   self._handle_SL0,
-            SL1:   self._handle_SL1,
-            SLA:   self._handle_SLA,
-            SLX:   self._handle_SLX,
-            RR:    self._handle_RR,
-            SR0:   self._handle_SR0,
-            SR1:   self._handle_SR1,
-            SRA:   self._handle_SRA,
-            SRX:   self._handle_SRX,
-            STORE: self._handle_STORE,
-            SUB:   self._handle_SUB,
-            SUBC:  self._handle_SUBC,
-            TEST:  self._handle_TEST,
-            XOR:   self._handle_XOR,
-        }
+        self._cycles = 0
+        self._frequency = DEFAULT_FREQUENCY
+
+        self._input_defaults = [partial(self._input_ports.__getitem__, port) for port in range(PORTS_CNT)]
+        self._output_defaults = [partial(self._output_ports.__setitem__, port) for port in range(PORTS_CNT)]
+        self._port_readers = list(self._input_defaults)
+        self._port_writers = list(self._output_defaults)
+
+        self._instruments = []
+        self._journal = None
+        self._scheduler = None
+        self._deadline = NEVER
+        self._idle = None
+        self._run_end = NEVER
+        self.load_program(EMPTY_PROGRAM)
 
     @property
     def registers(self):
-        return self._registers
+        return RegisterView(self._registers)
 
     @property
     def ram(self):
         return self._ram
 
+    @property
+    def program(self):
+        return self._program
+
+    @property
+    def cycles(self):
+        return self._cycles
+
+    @property
+    def frequency(self):
+        return self._frequency
+
+    @frequency.setter
+    def frequency(self, frequency):
+        if frequency <= 0:
+            raise ValueError('Clock frequency has to be positive, not {0}'.format(frequency))
+        self._frequency = frequency
+
+    @property
+    def clocks(self):
+        return self._cycles * CLOCKS_PER_INSTRUCTION
+
+    # simulated time in seconds, e.g. timestamps for port devices
+    @property
+    def time(self):
+        return self._cycles * CLOCKS_PER_INSTRUCTION / self._frequency
+
+    # the number of instruction cycles taking `seconds` at the clock frequency
+    def cycles_in(self, seconds):
+        return int(round(seconds * self._frequency / CLOCKS_PER_INSTRUCTION))
+
+    # events and timers at exact cycles, created on first use
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = Scheduler(self)
+        return self._scheduler
+
+    @property
+    def input_ports(self):
+        return self._input_ports
+
+    @property
+    def output_ports(self):
+        return self._output_ports
+
+    def reset(self):
+        self._registers[:] = bytes(len(self._registers))
+        self._ram[:] = bytes(len(self._ram))
+        self._carry = 0
+        self._zero = 0
+        del self._stack[:]
+        self._input_ports[:] = bytes(PORTS_CNT)
+        self._output_ports[:] = bytes(PORTS_CNT)
+
+        self._interrupt_enabled = False
+        self._pre_zero = 0
+        self._pre_carry = 0
+        self._interrupt_caused = False
+
+        self._program_cnt = 0
+        self._cycles = 0
+        if self._journal is not None:
+            self._journal.clear()
+        if self._scheduler is not None:
+            self._scheduler.clear()
+
+    def snapshot(self):
+        flags = (self._carry and CARRY) | (self._zero and ZERO) | (self._interrupt_enabled and INTERRUPT_ENABLED) | \
+            (self._interrupt_caused and INTERRUPT_CAUSED) | (self._pre_carry and PRE_CARRY) | \
+            (self._pre_zero and PRE_ZERO)
+
+        return SNAPSHOT.pack(SNAPSHOT_VERSION, self._registers, self._ram, self._input_ports, self._output_ports,
+                             flags, self._program_cnt, self._cycles, len(self._stack)) + \
+            array('H', self._stack).tobytes()
+
+    def restore(self, snapshot):
+        version, registers, ram, input_ports, output_ports, flags, program_cnt, cycles, depth = \
+            SNAPSHOT.unpack_from(snapshot)
+        if version != SNAPSHOT_VERSION or len(snapshot) != SNAPSHOT.size + 2 * depth:
+            raise ValueError('Not a snapshot of this machine')
+        if self._scheduler is not None:
+            self._scheduler.check_travel(cycles)
+
+        self._registers[:] = registers
+        self._ram[:] = ram
+        self._input_ports[:] = input_ports
+        self._output_ports[:] = output_ports
+        self._stack[:] = array('H', snapshot[SNAPSHOT.size:])
+
+        self._carry = 1 if flags & CARRY else 0
+        self._zero = 1 if flags & ZERO else 0
+        self._interrupt_enabled = bool(flags & INTERRUPT_ENABLED)
+        self._interrupt_caused = bool(flags & INTERRUPT_CAUSED)
+        self._pre_carry = 1 if flags & PRE_CARRY else 0
+        self._pre_zero = 1 if flags & PRE_ZERO else 0
+
+        self._program_cnt = program_cnt
+        self._cycles = cycles
+
     def parse_file(self, filename):
-        with open(filename) as file:
-            content = file.readlines()
-
-        for i in content:
-            self._yacc.parse(i)
-
-        instruction_cnt = 0
-        for i in self._parser.instructions:
-            if type(i) == ORG:
-                if instruction_cnt <= i[0]:
-                    instruction_cnt = i[0]
-                else:
-                    raise ValueError(str(i) + ": Trying to place code in past position")
-            elif type(i) == LABEL:
-                if i[0] not in self._labels:
-                    self._labels[i[0]] = instruction_cnt
-                else:
-                    raise ValueError(str(i) + ": Label already in use")
-            else:
-                self._instructions[instruction_cnt] = i
-                instruction_cnt += 1
-
-    def _handle_LOAD(self, *args):
-        self.registers[args[0]] = uint8(args[1])
-        self._program_cnt += 1
-
-    def _handle_FETCH(self, *args):
-        if args[1] < 0 or args[1] > 63:
-            raise ValueError('Error in address {0}: ram addres "{1}" outside memory'.format(
-                             str(self._program_cnt), args[1]))
-        self.registers[args[0]] = self.ram[args[1]]
+        # imported here, so running machine code images never loads the assembler (and ply)
+        from src import image_cache
+        self.load_program(image_cache.load(filename))
+
+    def load_image(self, filename):
+        self.load_program(kcpsm3.load_image(filename))
+
+    def load_program(self, program):
+        self._program = program
+        self._labels = program.labels
+        self._instructions = program.instructions
+        self._rebind()
+        if self._journal is not None:
+            self._journal.clear()
+
+    # An instrument wraps the bound handlers to observe or record execution. It implements
+    # instrument_code(vm, code), returning the new list of (handler, x, y) for every address,
+    # and instrument_interrupt(vm, handler), returning the handler taking an interrupt.
+    # Handlers have to keep their wrapper's own name, so the BlockEngine calls them as they are.
+    def instrument(self, instrument):
+        self._instruments.append(instrument)
+        self._rebind()
+
+    def uninstrument(self, instrument):
+        self._instruments.remove(instrument)
+        self._rebind()
+
+    # Records the execution from now on, so it can be undone with step_back and run_back_to
+    def enable_journal(self, capacity=1 << 20, checkpoint_interval=1 << 12):
+        self.disable_journal()
+        self._journal = Journal(self, capacity, checkpoint_interval)
+        return self._journal
+
+    def disable_journal(self):
+        if self._journal is not None:
+            self._journal.detach()
+            self._journal = None
+
+    def _journal_or_error(self):
+        if self._journal is None:
+            raise RuntimeError("Journal is not enabled, call enable_journal() first")
+        return self._journal
+
+    # Skips idle and polling loops straight to the next scheduled event or the end of the run
+    def enable_fast_forward(self):
+        # imported here, idle imports this module
+        from src.idle import IdleSkipper
+        self.disable_fast_forward()
+        self._idle = IdleSkipper(self)
+        return self._idle
+
+    def disable_fast_forward(self):
+        if self._idle is not None:
+            self._idle.detach()
+            self._idle = None
+
+    def step_back(self, amount=1):
+        self._journal_or_error().step_back(amount)
+
+    def run_back_to(self, addr):
+        return self._journal_or_error().run_back_to(self._address(addr))
+
+    def _rebind(self):
+        nop = self._handle_NOP, None, None
+        code = [nop if op is None else self._bind(op) for op in self._program.image]
+        interrupt = self._handle_interrupt
+
+        for instrument in self._instruments:
+            code = instrument.instrument_code(self, code)
+            interrupt = instrument.instrument_interrupt(self, interrupt)
+
+        self._code = code
+        self._interrupt_handler = interrupt
+
+    def _bind(self, op):
+        if op is None:
+            return self._handle_NOP, None, None
+        return getattr(self, '_handle_' + op.handler), op.x, op.y
+
+    def _handle_NOP(self, x, y):
+        self._program_cnt += 1
+
+    def _handle_LOAD_val(self, x, y):
+        self._registers[x] = y
+        self._program_cnt += 1
+
+    def _handle_LOAD_reg(self, x, y):
+        self._registers[x] = self._registers[y]
+        self._program_cnt += 1
+
+    def _handle_FETCH_val(self, x, y):
+        self._registers[x] = self._ram[y]
         self._program_cnt += 1
 
-    def _handle_STORE(self, *args):
-        if args[1] < 0 or args[1] > 63:
+    def _handle_FETCH_reg(self, x, y):
+        self._registers[x] = self._ram[self._ram_addr(self._registers[y])]
+        self._program_cnt += 1
+
+    def _handle_STORE_val(self, x, y):
+        self._ram[y] = self._registers[x]
+        self._program_cnt += 1
+
+    def _handle_STORE_reg(self, x, y):
+        self._ram[self._ram_addr(self._registers[y])] = self._registers[x]
+        self._program_cnt += 1
+
+    def _ram_addr(self, addr):
+        if addr > RAM_SIZE - 1:
             raise ValueError('Error in address {0}: ram addres "{1}" outside memory'.format(
-                str(self._program_cnt), args[1]))
-        self.ram[args[1]] = self.registers[args[0]]
+                str(self._program_cnt), addr))
+        return addr
+
+    def _handle_IN_val(self, x, y):
+        self._registers[x] = self.read_port(y)
         self._program_cnt += 1
 
-    def _handle_IN(self, *args):
-        # there could be some port simulator in further version of VM class,
-        # for now we assume that there are only zeros on input
-        if args[1] < 0 or args[1] > 63:
-            raise ValueError('Error in address {0}: no such port "{1}"'.format(
-                str(self._program_cnt), args[1]))
-        self.registers[args[0]] = uint8(0)
+    def _handle_IN_reg(self, x, y):
+        self._registers[x] = self.read_port(self._registers[y])
         self._program_cnt += 1
 
-    def _handle_OUT(self, *args):
-        # output to /dev/null
-        if args[1] < 0 or args[1] > 63:
-            raise ValueError('Error in address {0}: no such port "{1}"'.format(
-                str(self._program_cnt), args[1]))
+    def _handle_OUT_val(self, x, y):
+        self.write_port(y, self._registers[x])
         self._program_cnt += 1
 
-    def _handle_ADD(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] + args[1]
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_OUT_reg(self, x, y):
+        self.write_port(self._registers[y], self._registers[x])
         self._program_cnt += 1
 
-    def _handle_ADDC(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] + (args[1] + self._carry)
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    # Port hooks, override them to attach a stimulus. By default they dispatch through the port
+    # tables, where every unmapped port reads input_ports and latches into output_ports.
+    def read_port(self, port):
+        return self._port_readers[port]()
+
+    def write_port(self, port, value):
+        self._port_writers[port](value)
+
+    # Connects a device to a port: an object with read() and / or write(value), or a callable
+    # taking no argument for an input and the written value for an output.
+    def map_input(self, port, device):
+        self._port_readers[port] = getattr(device, 'read', device)
+
+    def map_output(self, port, device):
+        self._port_writers[port] = getattr(device, 'write', device)
+
+    def unmap_port(self, port):
+        self._port_readers[port] = self._input_defaults[port]
+        self._port_writers[port] = self._output_defaults[port]
+
+    # whether IN from the port reads input_ports, which only change from outside of a run
+    def _plain_input(self, port):
+        return self._port_readers[port] is self._input_defaults[port] and \
+            type(self).read_port is VirtualMachine.read_port
+
+    # Connects the device to the port named by a DSIN, DSOUT or DSIO directive of the program
+    def connect(self, name, device):
+        for directive in self._program.directives:
+            if directive.alias == name and type(directive) in PORT_DIRECTIVES:
+                if type(directive) in (DSIN, DSIO):
+                    self.map_input(directive.pp, device)
+                if type(directive) in (DSOUT, DSIO):
+                    self.map_output(directive.pp, device)
+                return directive.pp
+        raise KeyError('No such port "{0}"'.format(name))
+
+    def _handle_ADD_val(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.ADD[registers[x] << 9 | y << 1]
         self._program_cnt += 1
 
-    def _handle_SUB(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] - args[1]
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_ADD_reg(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.ADD[registers[x] << 9 | registers[y] << 1]
         self._program_cnt += 1
 
-    def _handle_SUBC(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] - (args[1] - self._carry)
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_ADDC_val(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.ADD[registers[x] << 9 | y << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_COMP(self, *args):
-        self._zero = 1 if self.registers[args[0]] is args[1] else 0
-        self._carry = 1 if self.registers[args[0]] < args[1] else 0
+    def _handle_ADDC_reg(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.ADD[registers[x] << 9 | registers[y] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_AND(self, *args):
-        self.registers[args[0]] &= args[1]
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SUB_val(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SUB[registers[x] << 9 | y << 1]
         self._program_cnt += 1
 
-    def _handle_OR(self, *args):
-        self.registers[args[0]] |= args[1]
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SUB_reg(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SUB[registers[x] << 9 | registers[y] << 1]
         self._program_cnt += 1
 
-    def _handle_XOR(self, *args):
-        self.registers[args[0]] ^= args[1]
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SUBC_val(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SUB[registers[x] << 9 | y << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_TEST(self, *args):
-        def bit_parity(num):
-            bits = num.as_bit_list()
-            result = bits[0]
-            for i in bits[1:]:
-                result ^= i
-            return result
+    def _handle_SUBC_reg(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SUB[registers[x] << 9 | registers[y] << 1 | self._carry]
+        self._program_cnt += 1
+
+    def _handle_COMP_val(self, x, y):
+        registers = self._registers
+        _, self._carry, self._zero = alu.SUB[registers[x] << 9 | y << 1]
+        self._program_cnt += 1
+
+    def _handle_COMP_reg(self, x, y):
+        registers = self._registers
+        _, self._carry, self._zero = alu.SUB[registers[x] << 9 | registers[y] << 1]
+        self._program_cnt += 1
+
+    def _handle_AND_val(self, x, y):
+        registers = self._registers
+        registers[x] &= y
+        self._zero = alu.ZERO[registers[x]]
+        self._program_cnt += 1
+
+    def _handle_AND_reg(self, x, y):
+        registers = self._registers
+        registers[x] &= registers[y]
+        self._zero = alu.ZERO[registers[x]]
+        self._program_cnt += 1
+
+    def _handle_OR_val(self, x, y):
+        registers = self._registers
+        registers[x] |= y
+        self._zero = alu.ZERO[registers[x]]
+        self._program_cnt += 1
+
+    def _handle_OR_reg(self, x, y):
+        registers = self._registers
+        registers[x] |= registers[y]
+        self._zero = alu.ZERO[registers[x]]
+        self._program_cnt += 1
+
+    def _handle_XOR_val(self, x, y):
+        registers = self._registers
+        registers[x] ^= y
+        self._zero = alu.ZERO[registers[x]]
+        self._program_cnt += 1
 
-        self._zero = 1 if (self.registers[args[0]] & args[1]) is 0 else 0
-        self._carry = 1 if bit_parity(self.registers[args[0]] & args[1]) is 1 else 0
+    def _handle_XOR_reg(self, x, y):
+        registers = self._registers
+        registers[x] ^= registers[y]
+        self._zero = alu.ZERO[registers[x]]
         self._program_cnt += 1
 
-    def _handle_SL0(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] << 1
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_TEST_val(self, x, y):
+        registers = self._registers
+        self._carry, self._zero = alu.TEST[registers[x] & y]
         self._program_cnt += 1
 
-    def _handle_SL1(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] << 1
-        self.registers[args[0]] |= 1
+    def _handle_TEST_reg(self, x, y):
+        registers = self._registers
+        self._carry, self._zero = alu.TEST[registers[x] & registers[y]]
         self._program_cnt += 1
 
-    def _handle_SLX(self, *args):
-        rest = self.registers[args[0]][0]
-        self.registers[args[0]], self._carry = self.registers[args[0]] << 1
-        self.registers[args[0]] |= rest
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SL0(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SL0[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_SLA(self, *args):
-        carry = self._carry
-        self.registers[args[0]], self._carry = self.registers[args[0]] << 1
-        self.registers[args[0]] |= carry
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SL1(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SL1[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_RL(self, *args):
-        rest = self.registers[args[0]][7]
-        self.registers[args[0]], self._carry = self.registers[args[0]] << 1
-        self.registers[args[0]] |= rest
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SLX(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SLX[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_SR0(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] >> 1
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SLA(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SLA[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_SR1(self, *args):
-        self.registers[args[0]], self._carry = self.registers[args[0]] >> 1
-        self.registers[args[0]] |= 1 << 7
+    def _handle_RL(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.RL[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_SRX(self, *args):
-        rest = self.registers[args[0]][7]
-        self.registers[args[0]], self._carry = self.registers[args[0]] >> 1
-        self.registers[args[0]] |= rest << 7
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SR0(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SR0[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_SRA(self, *args):
-        carry = self._carry
-        self.registers[args[0]], self._carry = self.registers[args[0]] >> 1
-        self.registers[args[0]] |= carry << 7
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SR1(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SR1[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_RR(self, *args):
-        rest = self.registers[args[0]][0]
-        self.registers[args[0]], self._carry = self.registers[args[0]] >> 1
-        self.registers[args[0]] |= rest << 7
-        self._zero = 1 if self.registers[args[0]] == 0 else 0
+    def _handle_SRX(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SRX[registers[x] << 1 | self._carry]
         self._program_cnt += 1
 
-    def _handle_JUMP(self, *args):
-        if args[1] is not None:
-            if type(args[1]) is str:
-                if args[1] not in self._labels.keys():
-                    raise KeyError('Error in address {0}: no such label "{1}"'.format(str(self._program_cnt), args[1]))
-                else:
-                    arg2 = self._labels[args[1]]
-            else:
-                if args[1] < 0 or args[1] > 1023:
-                    raise ValueError('Error in address {0}: no such address "{1}"'.format(str(self._program_cnt), args[1]))
-                else:
-                    arg2 = args[1]
-            if args[0] == 'Z' and self._zero == 1 or \
-               args[0] == 'NZ' and self._zero == 0 or \
-               args[0] == 'C' and self._carry == 1 or \
-               args[0] == 'NC' and self._carry == 0:
-                self._program_cnt = arg2
-            else:
-                self._program_cnt += 1
+    def _handle_SRA(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.SRA[registers[x] << 1 | self._carry]
+        self._program_cnt += 1
+
+    def _handle_RR(self, x, y):
+        registers = self._registers
+        registers[x], self._carry, self._zero = alu.RR[registers[x] << 1 | self._carry]
+        self._program_cnt += 1
+
+    def _handle_JUMP(self, x, y):
+        self._program_cnt = x
+
+    def _handle_JUMP_Z(self, x, y):
+        self._program_cnt = x if self._zero else self._program_cnt + 1
+
+    def _handle_JUMP_NZ(self, x, y):
+        self._program_cnt = self._program_cnt + 1 if self._zero else x
+
+    def _handle_JUMP_C(self, x, y):
+        self._program_cnt = x if self._carry else self._program_cnt + 1
+
+    def _handle_JUMP_NC(self, x, y):
+        self._program_cnt = self._program_cnt + 1 if self._carry else x
+
+    def _handle_CALL(self, x, y):
+        self._stack.append(self._program_cnt)
+        self._program_cnt = x
+
+    def _handle_CALL_Z(self, x, y):
+        if self._zero:
+            self._handle_CALL(x, y)
+        else:
+            self._program_cnt += 1
+
+    def _handle_CALL_NZ(self, x, y):
+        if self._zero:
+            self._program_cnt += 1
         else:
-            if type(args[0]) is str:
-                if args[0] not in self._labels.keys():
-                    raise KeyError('Error in address {0}: no such label "{1}"'.format(str(self._program_cnt), args[0]))
-                else:
-                    arg1 = self._labels[args[0]]
-            else:
-                if args[0] < 0 or args[0] > 1023:
-                    raise ValueError('Error in address {0}: no such address "{1}"'.format(str(self._program_cnt), args[0]))
-                else:
-                    arg1 = args[0]
-            self._program_cnt = arg1
-
-    def _handle_CALL(self, *args):
-        if args[1] is not None:
-            if type(args[1]) is str:
-                if args[1] not in self._labels.keys():
-                    raise KeyError('Error in address {0}: no such label "{1}"'.format(str(self._program_cnt), args[1]))
-                else:
-                    arg2 = self._labels[args[1]]
-            else:
-                if args[1] < 0 or args[1] > 1023:
-                    raise ValueError('Error in address {0}: no such address "{1}"'.format(str(self._program_cnt), args[1]))
-                else:
-                    arg2 = args[1]
-            if args[0] == 'Z' and self._zero == 1 or \
-               args[0] == 'NZ' and self._zero == 0 or \
-               args[0] == 'C' and self._carry == 1 or \
-               args[0] == 'NC' and self._carry == 0:
-                self._stack.append(self._program_cnt)
-                self._program_cnt = arg2
-            else:
-                self._program_cnt += 1
+            self._handle_CALL(x, y)
+
+    def _handle_CALL_C(self, x, y):
+        if self._carry:
+            self._handle_CALL(x, y)
         else:
-            if type(args[0]) is str:
-                if args[0] not in self._labels.keys():
-                    raise KeyError('Error in address {0}: no such label "{1}"'.format(str(self._program_cnt), args[0]))
-                else:
-                    arg1 = self._labels[args[0]]
-            else:
-                if args[0] < 0 or args[0] > 1023:
-                    raise ValueError('Error in address {0}: no such address "{1}"'.format(str(self._program_cnt), args[0]))
-                else:
-                    arg1 = args[0]
-            self._stack.append(self._program_cnt)
-            self._program_cnt = arg1
-
-    def _handle_RET(self, *args):
-        if args[0] is not None:
-            if args[0] == 'Z' and self._zero == 1 or \
-               args[0] == 'NZ' and self._zero == 0 or \
-               args[0] == 'C' and self._carry == 1 or \
-               args[0] == 'NC' and self._carry == 0:
-                self._program_cnt = self._stack.pop() + 1
-            else:
-                self._program_cnt += 1
+            self._program_cnt += 1
+
+    def _handle_CALL_NC(self, x, y):
+        if self._carry:
+            self._program_cnt += 1
         else:
-            self._program_cnt = self._stack.pop() + 1
+            self._handle_CALL(x, y)
+
+    def _handle_RET(self, x, y):
+        self._program_cnt = self._pop_stack(self._program_cnt) + 1
+
+    def _handle_RET_Z(self, x, y):
+        self._program_cnt = self._pop_stack(self._program_cnt) + 1 if self._zero else self._program_cnt + 1
+
+    def _handle_RET_NZ(self, x, y):
+        self._program_cnt = self._program_cnt + 1 if self._zero else self._pop_stack(self._program_cnt) + 1
 
-    def _handle_DINT(self, *args):
-        self._interrupt_enabled = 0
+    def _handle_RET_C(self, x, y):
+        self._program_cnt = self._pop_stack(self._program_cnt) + 1 if self._carry else self._program_cnt + 1
+
+    def _handle_RET_NC(self, x, y):
+        self._program_cnt = self._program_cnt + 1 if self._carry else self._pop_stack(self._program_cnt) + 1
+
+    # the return address of RET or RETI at `addr`
+    def _pop_stack(self, addr):
+        if not self._stack:
+            raise RuntimeError('Error in address {0}: stack underflow'.format(addr))
+        return self._stack.pop()
+
+    def _handle_DINT(self, x, y):
+        self._interrupt_enabled = False
         self._program_cnt += 1
 
-    def _handle_EINT(self, *args):
-        self._interrupt_enabled = 1
+    def _handle_EINT(self, x, y):
+        self._interrupt_enabled = True
         self._program_cnt += 1
 
-    def _handle_RETI(self, *args):
-        if args[0] == 'ENABLE':
-            self._interrupt_enabled = True
-        else:
-            self._interrupt_enabled = False
+    def _handle_RETI_ENABLE(self, x, y):
+        self._interrupt_enabled = True
         self._carry = self._pre_carry
         self._zero = self._pre_zero
-        self._program_cnt = self._stack.pop()
+        self._program_cnt = self._pop_stack(self._program_cnt)
+
+    def _handle_RETI_DISABLE(self, x, y):
+        self._interrupt_enabled = False
+        self._carry = self._pre_carry
+        self._zero = self._pre_zero
+        self._program_cnt = self._pop_stack(self._program_cnt)
 
     def _handle_interrupt(self):
         self._pre_carry = self._carry
         self._pre_zero = self._zero
         self._interrupt_enabled = False
         self._stack.append(self._program_cnt)
-        self._program_cnt = 1023
+        self._program_cnt = INSTRUCTIONS_CNT - 1
 
     def step_over(self):
+        if self._cycles >= self._deadline:
+            self._scheduler.dispatch()
+
         if self._interrupt_caused and self._interrupt_enabled:
-            self._handle_interrupt()
+            self._interrupt_handler()
+            self._cycles += 1
             return
 
-        if self._program_cnt > 1023:
+        try:
+            handler, x, y = self._code[self._program_cnt]
+        except IndexError:
             raise RuntimeError("Out of memory range")
-
-        instruction = self._instructions[self._program_cnt]
-        if instruction is not None:
-            if len(instruction) is 2 and instruction[1] in self._registers:
-                arg2 = self._registers[instruction[1]]
-                self.__handlers[type(instruction)](instruction[0], arg2)
-            else:
-                self.__handlers[type(instruction)](*instruction)
-        else:
-            self._program_cnt += 1
+        handler(x, y)
+        self._cycles += 1
 
     def toggle_interrupt(self, state):
         self._interrupt_caused = state
 
     def print_parameters(self):
-        for k, val in self._registers.items():
+        for k, val in self.registers.items():
             print('{0}: {1} ({2})'.format(k, str(val).rjust(3), bin(val)[2:].zfill(8)))
         print("Zero: {0}  Carry: {1}  Interrupt enabled: {2}".format(self._zero, self._carry, self._interrupt_enabled))
         print("Program counter: {0}".format(self._program_cnt))
 
     def step_many(self, amount, print_params=False):
+        if not print_params:
+            self.run(amount)
+            return
+
         for i in range(amount):
             self.step_over()
-            if print_params:
-                self.print_parameters()
+            self.print_parameters()
+
+    def _address(self, addr):
+        if type(addr) is str:
+            if addr not in self._labels:
+                raise KeyError('No such label "{0}"'.format(addr))
+            return self._labels[addr]
+        if addr < 0 or addr > INSTRUCTIONS_CNT - 1:
+            raise ValueError('No such address "{0}"'.format(addr))
+        return addr
+
+    # Executes until one of the stop conditions holds, breakpoints and until_pc are addresses
+    # or labels checked before the instruction there executes and stop_on is called with the VM
+    # after every instruction. The first instruction always executes, so a run can be resumed
+    # from a breakpoint. Returns RunResult(reason, cycles executed by this call).
+    def run(self, max_cycles=None, breakpoints=(), until_pc=None, stop_on=None):
+        step = self.step_over
+        start = self._cycles
+        steps = repeat(None) if max_cycles is None else repeat(None, max_cycles)
+
+        # one entry past the last instruction, where the program counter ends after executing it
+        stops = bytearray(INSTRUCTIONS_CNT + 1)
+        for addr in breakpoints or ():
+            stops[self._address(addr)] = 1
+        if until_pc is not None:
+            stops[self._address(until_pc)] = 2
+
+        if stop_on is not None:
+            for _ in steps:
+                step()
+                if stops[self._program_cnt]:
+                    return RunResult(STOP_REASONS[stops[self._program_cnt]], self._cycles - start)
+                if stop_on(self):
+                    return RunResult(STOP_CONDITION, self._cycles - start)
+        elif any(stops):
+            for _ in steps:
+                step()
+                if stops[self._program_cnt]:
+                    return RunResult(STOP_REASONS[stops[self._program_cnt]], self._cycles - start)
+        elif self._idle is not None:
+            # idle loops may be skipped up to the end of the run, so the cycles are counted instead
+            self._run_end = NEVER if max_cycles is None else start + max_cycles
+            try:
+                if max_cycles is not None:
+                    steps = iter(lambda: self._cycles < self._run_end, False)
+                for _ in steps:
+                    step()
+            finally:
+                self._run_end = NEVER
+        else:
+            for _ in steps:
+                step()
+
+        return RunResult(STOP_MAX_CYCLES, self._cycles - start)
+
+    # Like run, but no faster than the clock frequency (times `speed`) in wall-clock time. The
+    # machine runs in batches of `batch` seconds and sleeps once per batch to catch up.
+    def run_throttled(self, max_cycles=None, breakpoints=(), until_pc=None, stop_on=None, speed=1.0,
+                      batch=THROTTLE_BATCH):
+        start, started = self._cycles, time.perf_counter()
+        batch_cycles = max(1, self.cycles_in(batch * speed))
+        seconds_per_cycle = CLOCKS_PER_INSTRUCTION / (self._frequency * speed)
+
+        while max_cycles is None or self._cycles - start < max_cycles:
+            amount = batch_cycles if max_cycles is None else min(batch_cycles, max_cycles - (self._cycles - start))
+            result = self.run(amount, breakpoints, until_pc, stop_on)
+
+            delay = started + (self._cycles - start) * seconds_per_cycle - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if result.reason != STOP_MAX_CYCLES:
+                return RunResult(result.reason, self._cycles - start)
+
+        return RunResult(STOP_MAX_CYCLES, self._cycles - start)
 
 
+STOP_REASONS = {1: STOP_BREAKPOINT, 2: STOP_UNTIL_PC}